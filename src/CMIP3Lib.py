@@ -5,21 +5,93 @@ Created on Mon Aug 7 14:27:34 2023
 
 PJD  7 Aug 2023     - Written to collect functions being used across libraries
 PJD  9 Aug 2023     - Added makeDRS.py functions
+PJD 18 Oct 2026     - Added scanTree, threaded os.scandir walker; getFileStats reuses DirEntry stat
+PJD 18 Oct 2026     - Added scanTree resumeAfter, skip directories already scanned
+PJD 18 Oct 2026     - Added CatalogueWriter, replayCatalogue; append-only JSONL catalogue
+                      replacing per-directory json.dump of the whole dictionary
+PJD 18 Oct 2026     - getSha256 streams with readinto a reused buffer and fadvise hints,
+                      shared by all scripts
+PJD 18 Oct 2026     - Added hashFiles, thread pool getSha256 with per-device limits
+PJD 18 Oct 2026     - Added openHashCache, getCachedHashes, putCachedHashes, getSha256Cached;
+                      SQLite sha256 cache keyed on (st_dev, st_ino, st_size, st_mtime_ns)
+PJD 18 Oct 2026     - Added getPartialHash, blake2b head/tail fingerprint; hashFiles hashFunc
+PJD 18 Oct 2026     - Replaced exec fixFunc with badRules.json fix rules; added loadRules,
+                      compileRule, getRule, setTimeUnits
+PJD 18 Oct 2026     - matchTable, writeJson prints -> runLib.log levels
+PJD 18 Oct 2026     - getCachedHashes queries per device, a (dev, ino) primary key lookup
+PJD 18 Oct 2026     - scanTree cancels prefetches of directories skipped by resumeAfter
+PJD 18 Oct 2026     - hashFiles reads known without emptying the caller's dict
 
 @author: durack1
 """
 
 # %% imports
+import collections
 import datetime
+import functools
 import hashlib
 import json
 import os
 import pdb
 import re
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from runLib import levelDebug, levelInfo, log
+
+# %% per-thread getSha256 read buffer
+hashBuffers = threading.local()
+
+# %% sha256 cache shared by scanCMIP.py, scanCMIP3.py, scanCMIP3-sha256.py, checkOzone.py
+hashCacheFile = os.path.join(
+    os.path.expanduser("~"), ".cache", "CMIP3_CVs", "sha256.db"
+)
+
+# %% bad file fix rules read by scanCMIP.py and scanCMIP3.py
+ruleFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "badRules.json")
 
 # %% function defs
 
 
+class CatalogueWriter:
+    # append-only catalogue, one compact [keys, value] line per dictionary
+    # assignment e.g. cm[root][fileName] = rec -> [[root, fileName], rec]
+    # replayCatalogue rebuilds the nested dictionary, writeJson the old layout
+    def __init__(self, catFile, offset=None, batchSize=1000):
+        if offset is None:
+            self.fH = open(catFile, "wb")
+        else:
+            # resume, drop anything written after the checkpointed offset
+            self.fH = open(catFile, "r+b")
+            self.fH.truncate(offset)
+            self.fH.seek(offset)
+        self.batchSize = batchSize
+        self.lines = []
+
+    def set(self, keys, value):
+        line = json.dumps([keys, value], ensure_ascii=True, separators=(",", ":"))
+        self.lines.append(line)
+        if len(self.lines) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.fH.write("".join([line + "\n" for line in self.lines]).encode())
+            self.lines = []
+        self.fH.flush()
+
+    def sync(self):
+        # flush to disk, returns the offset a resumed writer truncates back to
+        self.flush()
+        os.fsync(self.fH.fileno())
+        return self.fH.tell()
+
+    def close(self):
+        self.flush()
+        self.fH.close()
+
+
 def checkDate(dateStr):
     # assume 2022-10-05 format
     y, m, d = dateStr.split("-")
@@ -39,14 +111,53 @@ def checkDate(dateStr):
     return dateStr
 
 
-def fixFunc(fixStr, fixStrInfo):
-    def fix(ds):
-        print(fixStrInfo)
-        exec(fixStr)  # ds.time.encoding["units"] = "days since 2001-1-1"
-
-        return ds
+def compileRule(rule):
+    # badRules.json rule -> {"info", "skip", "dropVariables", "fixes"}, fixes are
+    # functools.partial callables (picklable for scanCMIP.py --workers) applied
+    # to the undecoded Dataset, see scanLib.openRule
+    compiled = {"info": rule["info"], "skip": False, "dropVariables": [], "fixes": []}
+    for action in rule["actions"]:
+        name = action["action"]
+        if name == "skipFile":
+            compiled["skip"] = True
+        elif name == "dropVariables":
+            compiled["dropVariables"].extend(action["variables"])
+        elif name == "setTimeUnits":
+            compiled["fixes"].append(
+                functools.partial(setTimeUnits, units=action["units"])
+            )
+        else:
+            raise ValueError(
+                " ".join(["unknown rule action", name, "for", rule["root"]])
+            )
+
+    return compiled
+
+
+def fileAdvise(fd, offset, length, adviceName):
+    # os.posix_fadvise hint, skipped where the platform or filesystem has none
+    advice = getattr(os, adviceName, None)
+    if advice is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def fileKey(entry):
+    # hash cache key, os.DirEntry (scanTree, stat cached) or path
+    if isinstance(entry, os.DirEntry):
+        fileStats = entry.stat()
+    else:
+        fileStats = os.stat(entry)
 
-    return fix
+    return (
+        fileStats.st_dev,
+        fileStats.st_ino,
+        fileStats.st_size,
+        fileStats.st_mtime_ns,
+    )
 
 
 def fixSource(sourceId):
@@ -72,8 +183,49 @@ def formatDate(dateStr):
     return dateStr
 
 
-def getFileStats(filePath):
-    if os.path.isfile(filePath):
+def getCachedHashes(db, entries):
+    # {path: sha256} for entries unchanged since hashed, one query per 500 files so
+    # a directory is a single round trip; db None (cache disabled) returns {}
+    found = {}
+    if db is None:
+        return found
+    keys = {}
+    for entry in entries:
+        try:
+            keys[fileKey(entry)] = os.fspath(entry)
+        except OSError:
+            continue  # unreadable, left to the hash itself to report
+    # per device, dev = ? AND ino IN (...) is a primary key (dev, ino) lookup
+    devInodes = {}
+    for key in keys:
+        devInodes.setdefault(key[0], set()).add(key[1])
+    for dev, inodes in sorted(devInodes.items()):
+        inodes = sorted(inodes)
+        for ind in range(0, len(inodes), 500):
+            batch = inodes[ind : ind + 500]
+            rows = db.execute(
+                "SELECT dev, ino, size, mtimeNs, sha256 FROM hashes"
+                " WHERE dev = ? AND ino IN ({})".format(",".join(["?"] * len(batch))),
+                [dev] + batch,
+            )
+            for rowDev, ino, size, mtimeNs, sha256 in rows:
+                filePath = keys.get((rowDev, ino, size, mtimeNs))
+                if filePath is not None:
+                    found[filePath] = sha256
+
+    return found
+
+
+def getFileStats(filePath, entry=None):
+    # entry is an os.DirEntry from scanTree, reuse its cached stat
+    if entry is not None and entry.is_file():
+        fileStats = entry.stat()
+        fileSizeBytes = fileStats.st_size
+        fileModTime = datetime.datetime.fromtimestamp(fileStats.st_mtime)
+        fileModTime = makeDate(
+            fileModTime.year, fileModTime.month, fileModTime.day, False
+        )
+    elif os.path.isfile(filePath):
         fileStats = os.stat(filePath)
         fileSizeBytes = fileStats.st_size
         fileModTime = datetime.datetime.fromtimestamp(fileStats.st_mtime)
@@ -88,16 +240,75 @@ def getFileStats(filePath):
     return fileSizeBytes, fileModTime
 
 
-def getSha256(filePath, print=False):
-    with open(filePath, "rb") as f:
-        bytes = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest()
-        if print:
-            print(readable_hash)
+def getPartialHash(filePath, blockSize=4194304):
+    # blake2b of the size and the first and last blockSize bytes, files of one size
+    # that differ here are different without reading them end to end
+    partialHash = hashlib.blake2b(digest_size=32)
+    with open(filePath, "rb", buffering=0) as f:
+        fileSize = os.fstat(f.fileno()).st_size
+        partialHash.update(str(fileSize).encode())
+        partialHash.update(f.read(blockSize))
+        if fileSize > blockSize:
+            f.seek(max(fileSize - blockSize, blockSize))
+            partialHash.update(f.read(blockSize))
+
+    return partialHash.hexdigest()
+
+
+def getRule(rules, root, fileName):
+    # rule for fileName in root, a fileName "" rule covers every file in root
+    dirRules = rules.get(root)
+    if dirRules is None:
+        return None
+    rule = dirRules.get(fileName)
+    if rule is None:
+        rule = dirRules.get("")
+
+    return rule
+
+
+def getSha256(filePath, printHash=False, bufferSize=8388608, blockFunc=None):
+    # stream filePath through sha256 with readinto a preallocated per-thread buffer,
+    # memory stays at bufferSize however large the file (thetao, rhopoto ...)
+    # blockFunc(offset, view) sees each block, the view is reused so copy to keep
+    buf = getattr(hashBuffers, "buf", None)
+    if buf is None or len(buf) != bufferSize:
+        buf = bytearray(bufferSize)
+        hashBuffers.buf = buf
+    view = memoryview(buf)
+    sha256 = hashlib.sha256()
+    offset = 0
+    with open(filePath, "rb", buffering=0) as f:
+        fd = f.fileno()
+        fileAdvise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            block = view[:n]
+            sha256.update(block)
+            if blockFunc is not None:
+                blockFunc(offset, block)
+            # hashed pages will not be read again, drop them from the page cache
+            fileAdvise(fd, offset, n, "POSIX_FADV_DONTNEED")
+            offset = offset + n
+    readable_hash = sha256.hexdigest()
+    if printHash:
+        print(readable_hash)
 
     return readable_hash
 
 
+def getSha256Cached(db, filePath):
+    # single file getSha256 through the hash cache
+    sha256 = getCachedHashes(db, [filePath]).get(filePath)
+    if sha256 is None:
+        sha256 = getSha256(filePath)
+        putCachedHashes(db, [(filePath, sha256)])
+
+    return sha256
+
+
 def getTimes(time):
     y = int(time.dt.year.data)
     m = int(time.dt.month.data)
@@ -107,6 +318,109 @@ def getTimes(time):
     return dateStr
 
 
+def hashFiles(
+    entries,
+    threads=16,
+    perDevice=4,
+    bufferSize=8388608,
+    stats=None,
+    known=None,
+    hashFunc=None,
+):
+    # getSha256 many files at once on a thread pool - hashlib and readinto release
+    # the GIL - with at most perDevice concurrent reads on each st_dev so one mount
+    # is not thrashed; entries are os.DirEntry (scanTree) or paths, yields
+    # (entry, sha256) in input order; stats (dict) accumulates files/bytes hashed
+    # known {path: sha256} (getCachedHashes) are yielded without reading the file
+    # hashFunc(filePath) replaces getSha256 e.g. getPartialHash
+    lock = threading.Lock()
+    devices = {}
+    if stats is not None:
+        stats.setdefault("files", 0)
+        stats.setdefault("bytes", 0)
+
+    def hashOne(entry):
+        if isinstance(entry, os.DirEntry):
+            fileStats = entry.stat()
+        else:
+            fileStats = os.stat(entry)
+        with lock:
+            if fileStats.st_dev not in devices:
+                devices[fileStats.st_dev] = threading.Semaphore(perDevice)
+            limit = devices[fileStats.st_dev]
+        with limit:
+            if hashFunc is None:
+                sha256 = getSha256(os.fspath(entry), bufferSize=bufferSize)
+            else:
+                sha256 = hashFunc(os.fspath(entry))
+        if stats is not None:
+            with lock:
+                stats["files"] = stats["files"] + 1
+                stats["bytes"] = stats["bytes"] + fileStats.st_size
+        return sha256
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="hashFiles")
+    window = collections.deque()
+    try:
+        for entry in entries:
+            if known and os.fspath(entry) in known:
+                future = Future()
+                future.set_result(known[os.fspath(entry)])  # known is left as is
+            else:
+                future = pool.submit(hashOne, entry)
+            window.append((entry, future))
+            if len(window) >= threads * 4:
+                entry, future = window.popleft()
+                yield entry, future.result()
+        while window:
+            entry, future = window.popleft()
+            yield entry, future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def listDir(path, excludeDirs=set(), excludeDirs2=set()):
+    # single os.scandir pass, file stats are cached on the returned DirEntry
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        dirs.append(entry)
+                        continue
+                    entry.stat()
+                except OSError:
+                    pass  # broken links etc. are still reported as files
+                files.append(entry)
+    except OSError:
+        print("listDir: cannot scan", path)
+        return [], []
+    parent = os.path.basename(path)
+    dirs = [
+        d
+        for d in dirs
+        if d.name not in excludeDirs
+        and not (d.name in excludeDirs2 and d.name == parent)  # catch ipcc/ipcc
+    ]
+    dirs.sort(key=lambda e: e.name)
+    files.sort(key=lambda e: e.name)
+
+    return dirs, files
+
+
+def loadRules(ruleFile=ruleFile):
+    # root -> fileName -> compiled rule, one dict lookup per directory however
+    # many rules there are
+    with open(ruleFile) as fH:
+        ruleList = json.load(fH)["rules"]
+    rules = {}
+    for rule in ruleList:
+        rules.setdefault(rule["root"], {})[rule["fileName"]] = compileRule(rule)
+
+    return rules
+
+
 def makeDate(year, month, day, check):
     date = "-".join([str(year), str(month), str(day)])
     # print("makeDate: date =", date)
@@ -323,13 +637,13 @@ def matchTable(fileName):
     fileName = "".join(fileName)
     # split "_"
     fileBits = [x.upper() for x in fileName.split("_")]
-    print("fileBits1:", fileBits)
+    log(levelDebug, "fileBits1:", fileBits)
     # split "."
     fileBits = [item.split(".") for item in fileBits]
-    print("fileBits2:", fileBits)
+    log(levelDebug, "fileBits2:", fileBits)
     # flatten
     fileBits = [el for innerList in fileBits for el in innerList]
-    print("fileBits3:", fileBits)
+    log(levelDebug, "fileBits3:", fileBits)
     tableId = [el for el in fileBits if el in tables]
 
     if not len(tableId):
@@ -339,6 +653,147 @@ def matchTable(fileName):
     return tableId[0]
 
 
+def openHashCache(cacheFile=hashCacheFile):
+    # SQLite sha256 cache, WAL so concurrent scanners read while one writes;
+    # (st_dev, st_ino) identifies the file, size/mtime must also match to hit
+    if not cacheFile:
+        return None
+    cacheDir = os.path.dirname(os.path.abspath(cacheFile))
+    os.makedirs(cacheDir, exist_ok=True)
+    db = sqlite3.connect(cacheFile, timeout=60)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, ino INTEGER, size INTEGER, "
+        "mtimeNs INTEGER, sha256 TEXT, PRIMARY KEY (dev, ino))"
+    )
+    db.commit()
+
+    return db
+
+
+def putCachedHashes(db, items):
+    # store [(entry or path, sha256), ...] in one transaction
+    if db is None or not items:
+        return
+    rows = []
+    for entry, sha256 in items:
+        try:
+            rows.append(fileKey(entry) + (sha256,))
+        except OSError:
+            continue
+    with db:
+        db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def replayCatalogue(catFile):
+    # rebuild the nested dictionary from a CatalogueWriter file, later lines win
+    cm = {}
+    with open(catFile) as fH:
+        for line in fH:
+            try:
+                keys, value = json.loads(line)
+            except ValueError:
+                # partial last line from an interrupted scan
+                print("skipping:", line[:80])
+                continue
+            d = cm
+            for key in keys[:-1]:
+                d = d.setdefault(key, {})
+            d[keys[-1]] = value
+
+    return cm
+
+
+def scanTree(
+    paths,
+    excludeDirs=set(),
+    excludeDirs2=set(),
+    threads=16,
+    lookAhead=4096,
+    resumeAfter=None,
+):
+    # os.walk replacement - yields (root, dirs, files) topdown in sorted, deterministic
+    # order while a thread pool lists up to lookAhead directories ahead of the caller.
+    # files are os.DirEntry objects with stat() cached; dirs can be pruned in place.
+    # resumeAfter is a root previously yielded, it and everything before it is skipped
+    lock = threading.Lock()
+    pending = {}
+    resumeBits = {}
+    if resumeAfter is not None:
+        # ancestor path -> name of the next directory down towards resumeAfter
+        resumeAfter = resumeAfter.rstrip(os.sep)
+        path = resumeAfter
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            resumeBits[parent] = os.path.basename(path)
+            path = parent
+        resumeBits[resumeAfter] = None
+
+    def walkInto(entry):
+        return not entry.is_symlink()  # match os.walk(followlinks=False)
+
+    def drop(path):
+        # cancel the prefetched listing of path and those it started below it
+        with lock:
+            for prefetched in list(pending):
+                if prefetched == path or prefetched.startswith(path + os.sep):
+                    pending.pop(prefetched).cancel()
+
+    def listing(path):
+        dirs, files = listDir(path, excludeDirs, excludeDirs2)
+        with lock:
+            for d in dirs:
+                if len(pending) >= lookAhead:
+                    break
+                if d.path not in pending and walkInto(d):
+                    pending[d.path] = pool.submit(listing, d.path)
+        return dirs, files
+
+    pool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        for cmPath in paths:
+            stack = [cmPath]
+            while stack:
+                root = stack.pop()
+                with lock:
+                    future = pending.pop(root, None)
+                    if future is None:
+                        future = pool.submit(listing, root)
+                dirs, files = future.result()
+                if root in resumeBits:
+                    # already scanned, only descend into what sorts after resumeAfter
+                    nextName = resumeBits[root]
+                    if nextName is not None:
+                        for d in dirs:
+                            if d.name < nextName:
+                                drop(d.path)  # scanned before resumeAfter
+                        dirs = [d for d in dirs if d.name >= nextName]
+                    stack.extend(d.path for d in reversed(dirs) if walkInto(d))
+                    continue
+                dirNames = [d.name for d in dirs]
+                yield root, dirNames, files
+                # honour any pruning of dirNames by the caller
+                keep = set(dirNames)
+                for d in dirs:
+                    if d.name not in keep:
+                        drop(d.path)
+                stack.extend(
+                    d.path for d in reversed(dirs) if d.name in keep and walkInto(d)
+                )
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def setTimeUnits(ds, units):
+    # rule action e.g. ingv_echam4 time:units 20O1-1-1 -> days since 2001-01-01
+    ds.time.attrs["units"] = units
+
+    return ds
+
+
 def setTimes(fh):
     if "T" in fh.cf.axes:
         startTime = getTimes(fh.time[0])
@@ -357,7 +812,7 @@ def writeJson(dictToWrite, fileText, timeFormatDir=""):
     outFile = ".".join(["_".join([timeFormatDir, fileText]), "json"])
     if os.path.exists(outFile):
         os.remove(outFile)
-    print("writing:", outFile)
+    log(levelInfo, "writing:", outFile)
     fH = open(outFile, "w")
     json.dump(
         dictToWrite,
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:31:09 2026
+
+PJD 18 Oct 2026     - Written to time dateLib.getDate against the regex cascade it replaced
+                      e.g. python benchDates.py -n 20000 --files /p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/mo/tas/*/run1/*.nc
+
+@author: durack1
+"""
+
+# %% imports
+import argparse
+import re
+import timeit
+
+from dateLib import attList, getDate, monList
+from ncLib import readHeader
+
+# %% global attributes as found in CMIP3 files
+cmip3Atts = {
+    "title": "NCAR model output prepared for IPCC Fourth Assessment 20C3M experiment",
+    "institution": "NCAR (National Center for Atmospheric Research, Boulder, CO, USA)",
+    "source": "CCSM3.0, version beta19 (2004): atmosphere: CAM3.0, T85L26; ocean : POP1.4.3 (modified), gx1v3; sea ice : CSIM5.0, gx1v3; land : CLM3.0, T85",
+    "contact": "ccsm@ucar.edu",
+    "project_id": "IPCC Fourth Assessment",
+    "table_id": "Table A1 (17 November 2004)",
+    "experiment_id": "20th century experiment (20C3M)",
+    "realization": 1,
+    "cmor_version": 0.96,
+    "Conventions": "CF-1.0",
+    "comment": "This simulation was initiated from year 360 of CCSM3 model run b30.020 and executed on hardware cheetah.ccs.ornl.gov",
+    "forcing": "N(0,1) G S(0,1) I(0,1) O(0,1) T V",
+}
+samples = [
+    {
+        **cmip3Atts,
+        "history": "Output from /data/cmip3/20c3m/run1. At 20:53:22 on 06/28/2005, CMOR rewrote data to comply with CF standards and IPCC Fourth Assessment requirements",
+    },
+    {
+        **cmip3Atts,
+        "history": "Fri Aug  5 19:23:54 MDT 2005 ncks -d time,0,11 b30.030a.cam2.h0.nc tas_A1.nc",
+    },
+    {
+        **cmip3Atts,
+        "history": "year:2005:month:01:day:17 converted to CMOR by CSIRO",
+    },
+    {
+        **cmip3Atts,
+        "date": "17-Jan-2005",
+        "history": "Created by BCCR for the IPCC AR4",
+    },
+    {
+        **cmip3Atts,
+        "history": "Created for the IPCC AR4 without a timestamp",
+    },
+]
+
+# %% function defs
+
+
+def legacyCheckDate(dateStr, startYr, endYr):
+    y, m, d = dateStr.split("-")
+    if not startYr <= int(y) <= endYr:
+        return None
+    if not 1 <= int(m) <= 12:
+        return None
+    if not 1 <= int(d) <= 31:
+        return None
+
+    return dateStr
+
+
+def legacyGetDate(attDict, era, startYr, endYr):
+    # scanCMIP.py getDate before dateLib, print("att:") dropped so only parsing is timed
+    date, dateFoundAtt = None, None
+    dateFound = False
+    for att in attList:
+        if not att in attDict.keys():
+            # print(att, "not in file, skipping..")
+            continue
+        if isinstance(attDict[att], str):
+            attStr = attDict[att]
+            # print("attStr:", attStr)
+            # BCCR_BCM2_0 format
+            if att == "date":
+                date = attStr
+                date = date.split("-")
+                day = date[0]
+                mon = "{:02d}".format(monList.index(date[1]) + 1)
+                yr = date[-1]
+                date = legacyMakeDate(yr, mon, day, startYr, endYr, check=True)
+                dateFound = True
+                dateFoundAtt = att
+            # Deal with CMOR matches
+            if "CMOR rewrote data to comply" in attStr:
+                if era == "CMIP3":  # CMOR1
+                    # assuming mm/dd/yyyy e.g. At 20:53:22 on 06/28/2005, CMOR rewrote data to comply with CF standards and IPCC Fourth Assessment requirements
+                    attStrInd = attStr.index(" At ")
+                    attStr = attStr[attStrInd:]
+                    date = re.findall(r"\d{1,2}/\d{1,2}/\d{2,4}", attStr)
+                    date = date[0].split("/")
+                    date = legacyMakeDate(
+                        date[-1],
+                        date[0],
+                        date[1],
+                        startYr,
+                        endYr,
+                        check=True,
+                    )
+                elif era == "CMIP5":  # CMOR2
+                    # assuming YYYY-MM-DDTHH:MM:SSZ e.g. ..from cfsv2_decadal runs. 2013-03-12T17:53:48Z CMOR rewrote data to comply with CF standards and CMIP5 requirements.
+                    attStrInd = attStr.index("Z CMOR rewrote data to comply")
+                    attStr = attStr[attStrInd - 19 : attStrInd]
+                    date = re.findall(r"\d{1,4}-\d{1,2}-\d{1,2}", attStr)
+                    date = date[0].split("-")
+                    date = legacyMakeDate(
+                        date[0],
+                        date[1],
+                        date[2],
+                        startYr,
+                        endYr,
+                        check=True,
+                    )
+                elif era == "CMIP6":
+                    # assuming ??? CMOR3
+                    attStrInd = attStr.index("Z CMOR rewrote data to comply")
+                    attStr = attStr[attStrInd - 19 : attStrInd]
+                    date = re.findall(r"\d{1,4}-\d{1,2}-\d{1,2}", attStr)
+                    date = date[0].split("-")
+                    date = legacyMakeDate(
+                        date[0],
+                        date[1],
+                        date[2],
+                        startYr,
+                        endYr,
+                        check=True,
+                    )
+                # Proceed with globalAtts
+                # dateFound = True
+                dateFoundAtt = att
+            # Deal with regex matches
+            dateReg = [
+                r"[0-3][0-9]/[0-3][0-9]/(?:[0-9][0-9])?[0-9][0-9]",
+                r"year:[0-9]{4}:month:[0-9]{2}:day:[0-9]{2}",
+                # r"Fri Aug  5 19:23:54 MDT 2005"
+                r"[a-zA-Z]{3}\s[a-zA-Z]{3}\s{1,2}\d{1,2}\s\d{1,2}.\d{2}.\d{2}\s[A-Z]{3}\s\d{4}",
+                # :creation_date = "2021-05-06T18:58:51Z" CMIP6/ISMIP6/NCAR/CESM2/ssp585-withism/r1i1p1f1/ImonGre/rlds/gn/v20210513
+                r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z",
+            ]
+            # check if dateFound, otherwise drop into other attributes for matches
+            if dateFound:
+                continue
+            # start checking other attributes
+            for dateFormat in dateReg:
+                # print("for dateFormat:", dateFormat)
+                # print("dateFound:", dateFound)
+                # pdb.set_trace()
+                date = re.findall(dateFormat, attStr)
+                # print("re.date:", date)
+                # timezones
+                timeZones = [
+                    "EDT",
+                    "EST",
+                    "MDT",
+                    "MST",
+                    "PDT",
+                    "PST",
+                ]
+                # CSIRO format - r"year:[0-9]{4}:month:[0-9]{2}:day:[0-9]{2}"
+                if date and ("year" in date[0]):
+                    date = (
+                        date[0]
+                        .replace("year:", "")
+                        .replace(":month:", "-")
+                        .replace(":day:", "-")
+                    )
+                    dateFound = True
+                    dateFoundAtt = att
+                # CMIP3 NCAR CCSM format - r"[a-zA-Z]{3}\s[a-zA-Z]{3}\s{1,2}\d{1,2}\s\d{1,2}.\d{2}.\d{2}\s[A-Z]{3}\s\d{4}"
+                elif date and any(zone in date[0] for zone in timeZones):
+                    date = date[0].split(" ")
+                    mon = "{:02d}".format(monList.index(date[1]) + 1)
+                    yr = date[-1]
+                    if len(date) == 6:
+                        day = date[2]
+                    elif len(date) == 7:
+                        day = date[3]
+                    day = "{:02d}".format(int(day))
+                    date = legacyMakeDate(yr, mon, day, startYr, endYr, check=True)
+                    dateFound = True
+                    dateFoundAtt = att
+                # CMIP6 NCAR CESM2 format r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z"
+                if date and re.match(
+                    r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z",
+                    date[0],
+                ):
+                    date = date[0].split("T")
+                    # print(date)
+                    date = date[0].split("-")
+                    yr = date[0]
+                    mon = date[1]
+                    day = date[2]
+                    date = legacyMakeDate(yr, mon, day, startYr, endYr, check=True)
+                    dateFound = True
+                    dateFoundAtt = att
+
+    return date, dateFoundAtt
+
+
+def legacyMakeDate(year, month, day, startYr, endYr, check):
+    date = "-".join([str(year), str(month), str(day)])
+    if check:
+        date = legacyCheckDate(date, startYr, endYr)
+
+    return date
+
+
+def readAtts(filePath):
+    # global attributes of a netCDF3 file, header only
+    header = readHeader(filePath)
+    if header is None:
+        return None
+
+    return header["attributes"]
+
+
+# %% run
+parser = argparse.ArgumentParser(description="Time dateLib.getDate vs legacy cascade")
+parser.add_argument("-n", help="Calls per attribute set", type=int, default=10000)
+parser.add_argument(
+    "--files",
+    help="netCDF3 files whose global attributes are timed, default built-in samples",
+    nargs="+",
+    default=[],
+)
+parser.add_argument("--era", help="CMIP era e.g. CMIP3", default="CMIP3")
+parser.add_argument("--startYr", type=int, default=2003)
+parser.add_argument("--endYr", type=int, default=2008)
+args = vars(parser.parse_args())
+
+attDicts = samples
+if args["files"]:
+    attDicts = [atts for atts in map(readAtts, args["files"]) if atts]
+era, startYr, endYr, n = args["era"], args["startYr"], args["endYr"], args["n"]
+legacyTotal, newTotal = 0.0, 0.0
+for attDict in attDicts:
+    try:
+        legacy = legacyGetDate(attDict, era, startYr, endYr)
+    except Exception as e:
+        legacy = ("raised", type(e).__name__)
+        legacyTime = float("nan")
+    else:
+        legacyTime = timeit.timeit(
+            lambda: legacyGetDate(attDict, era, startYr, endYr), number=n
+        )
+        legacyTotal = legacyTotal + legacyTime
+    new = getDate(attDict, era, startYr, endYr)
+    newTime = timeit.timeit(lambda: getDate(attDict, era, startYr, endYr), number=n)
+    if legacyTime == legacyTime:
+        newTotal = newTotal + newTime
+    print(
+        "legacy: {:8.2f} us {!s:32}".format(legacyTime / n * 1e6, legacy),
+        "dateLib: {:8.2f} us {!s:32}".format(newTime / n * 1e6, new),
+    )
+if newTotal:
+    print("speedup: {:.1f}x".format(legacyTotal / newTotal))
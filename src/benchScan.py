@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:41:53 2026
+
+PJD 18 Oct 2026     - Written to benchmark the scanners end to end on makeTestArchive.py
+                      archives: files/s, MB/s and peak RSS per scanner and scale
+                      e.g. python benchScan.py --scales 1000 10000 100000 1000000 -w 8
+
+@author: durack1
+"""
+
+# %% imports
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from runLib import addArguments, levelInfo, levelVerbose, log, setLevel
+
+# %% scanners, command line and run report json
+srcDir = os.path.dirname(os.path.abspath(__file__))
+scanners = {
+    "scanCMIP": ("scanCMIP.py", "CMIP3_report.json"),
+    "scanCMIP3-sha256": ("scanCMIP3-sha256.py", "cmip3-sha256_report.json"),
+}
+
+# add runtime argument
+parser = argparse.ArgumentParser(description="Benchmark the scanners")
+parser.add_argument(
+    "--scales",
+    help="Archive sizes in files, one makeTestArchive.py archive each",
+    type=int,
+    nargs="+",
+    default=[1000, 10000],
+)
+parser.add_argument(
+    "--scanners",
+    help="Scanners to run",
+    nargs="+",
+    choices=sorted(scanners),
+    default=sorted(scanners),
+)
+parser.add_argument(
+    "--benchDir",
+    help="Archives (kept between runs) and per-run output directories",
+    default="bench",
+)
+parser.add_argument(
+    "--rebuild",
+    help="Regenerate archives that already exist",
+    action="store_true",
+)
+parser.add_argument(
+    "--seed",
+    help="makeTestArchive.py seed",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    help="scanCMIP.py and makeTestArchive.py worker processes, 0 runs inline",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--output",
+    help="Results json, one row per scale and scanner",
+    default="benchScan.json",
+)
+addArguments(parser)
+args = vars(parser.parse_args())
+setLevel(args)
+
+# %% function defs
+
+
+def runTimed(cmd, cwd, logFile):
+    # run cmd with output to logFile, returns (seconds, peak RSS MB, exit code);
+    # wait4 reports the child's maxrss, including the workers it waited for
+    log(levelVerbose, "run:", " ".join(cmd))
+    start = time.monotonic()
+    with open(logFile, "w") as fH:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=fH, stderr=subprocess.STDOUT)
+        pid, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.monotonic() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    return seconds, usage.ru_maxrss / 1024, proc.returncode
+
+
+def getArchive(scale):
+    # makeTestArchive.py archive of scale files, reused when the manifest matches
+    archDir = os.path.join(args["benchDir"], "archive_{:d}".format(scale))
+    manifestFile = os.path.join(archDir, "manifest.json")
+    if os.path.exists(manifestFile) and not args["rebuild"]:
+        with open(manifestFile) as fH:
+            manifest = json.load(fH)
+        if manifest["files"] == scale and manifest["seed"] == args["seed"]:
+            return manifest, None
+    cmd = [
+        sys.executable,
+        os.path.join(srcDir, "makeTestArchive.py"),
+        "--outDir",
+        archDir,
+        "--files",
+        str(scale),
+        "--seed",
+        str(args["seed"]),
+        "-w",
+        str(args["workers"]),
+    ]
+    log(levelInfo, "generating:", archDir)
+    seconds, rss, exitCode = runTimed(cmd, ".", archDir + ".log")
+    if exitCode:
+        raise RuntimeError("makeTestArchive.py failed, see " + archDir + ".log")
+    with open(manifestFile) as fH:
+        manifest = json.load(fH)
+
+    return manifest, seconds
+
+
+def scanCommand(scanner, paths, runDir):
+    script, reportFile = scanners[scanner]
+    cmd = [sys.executable, os.path.join(srcDir, script), "-q", "--hashCache", ""]
+    cmd = cmd + ["--paths"] + paths
+    if scanner == "scanCMIP":
+        cmd = cmd + ["-e", "3", "--outDir", runDir, "--checkpoint", "0"]
+        cmd = cmd + ["--quarantine", "", "-w", str(args["workers"])]
+
+    return cmd
+
+
+# %% run each scanner on each archive, a fresh output directory per run
+os.makedirs(args["benchDir"], exist_ok=True)
+rows = []
+for scale in args["scales"]:
+    manifest, genSeconds = getArchive(scale)
+    for scanner in args["scanners"]:
+        runDir = os.path.abspath(
+            os.path.join(args["benchDir"], "run_{:d}_{}".format(scale, scanner))
+        )
+        if os.path.exists(runDir):
+            shutil.rmtree(runDir)
+        os.makedirs(runDir)
+        cmd = scanCommand(scanner, manifest["paths"], runDir)
+        logFile = os.path.join(runDir, "log.txt")
+        seconds, rss, exitCode = runTimed(cmd, runDir, logFile)
+        row = {
+            "scale": scale,
+            "scanner": scanner,
+            "files": manifest["files"],
+            "MB": round(manifest["fileSizeBytes"] / 1e6, 3),
+            "seconds": round(seconds, 3),
+            "filesPerSecond": round(manifest["files"] / seconds, 1),
+            "MBPerSecond": round(manifest["fileSizeBytes"] / 1e6 / seconds, 2),
+            "peakRssMB": round(rss, 1),
+            "exitCode": exitCode,
+            "generateSeconds": genSeconds and round(genSeconds, 3),
+        }
+        reportFile = os.path.join(runDir, scanners[scanner][1])
+        if os.path.exists(reportFile):
+            with open(reportFile) as fH:
+                report = json.load(fH)
+            row["stageSeconds"] = {
+                stage: rec["seconds"] for stage, rec in report["stages"].items()
+            }
+            row["counts"] = report["counts"]
+        if exitCode:
+            log(levelInfo, "failed:", scanner, scale, "see", logFile)
+        log(
+            levelInfo,
+            "{:>9d} files {:<17} {:9.1f} s {:9.1f} files/s {:8.2f} MB/s"
+            " {:8.1f} MB RSS".format(
+                scale,
+                scanner,
+                row["seconds"],
+                row["filesPerSecond"],
+                row["MBPerSecond"],
+                row["peakRssMB"],
+            ),
+        )
+        rows.append(row)
+
+# %% results json
+results = {
+    "timeEnd": datetime.datetime.now().isoformat(timespec="seconds"),
+    "host": platform.node(),
+    "python": platform.python_version(),
+    "cpus": os.cpu_count(),
+    "workers": args["workers"],
+    "seed": args["seed"],
+    "rows": rows,
+}
+with open(args["output"], "w") as fH:
+    json.dump(results, fH, indent=4)
+log(levelInfo, "results:", args["output"])
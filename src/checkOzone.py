@@ -5,16 +5,19 @@ Created on Tue Aug 1 16:38:34 2023
 
 PJD  1 Aug 2023     - Written to validate binary identical copies of CMIP5 ozone forcing data are written
 PJD  3 Aug 2023     - Updated to print to screen - all checkout ok!
+PJD 18 Oct 2026     - Use streaming CMIP3Lib.getSha256, whole files were read into memory
+PJD 18 Oct 2026     - sha256 through the shared hash cache (CMIP3Lib.getSha256Cached)
 
 @author: durack1
 """
 
 # %% imports
 import datetime
-import hashlib
 import os
 import pdb
 
+from CMIP3Lib import getSha256Cached, openHashCache
+
 # %% function defs
 
 
@@ -34,16 +37,6 @@ def getFileStats(filePath):
     return fileSizeBytes, fileModTime
 
 
-def getSha256(filePath, print=False):
-    with open(filePath, "rb") as f:
-        bytes = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest()
-        if print:
-            print(readable_hash)
-
-    return readable_hash
-
-
 def makeDate(year, month, day, check):
     date = "-".join([str(year), str(month), str(day)])
     # print("makeDate: date =", date)
@@ -55,6 +48,7 @@ def makeDate(year, month, day, check):
 # old and new dir paths
 oldPath = "/p/css03/esgf_publish/cmip3/ipcc/cmip5/ozone/"
 newPath = "/p/user_pub/work/input4MIPs/CMIP5/ozone/"
+db = openHashCache()
 
 for cmPath in [
     oldPath,
@@ -70,11 +64,11 @@ for cmPath in [
                     filePath = os.path.join(oldPath, fileName)
                     print("filePath_1:", filePath)
                     # get sha256, fileSizeBytes, fileModTime
-                    sha256_1 = getSha256(filePath)
+                    sha256_1 = getSha256Cached(db, filePath)
                     fileSizeBytes_1, fileModTime_1 = getFileStats(filePath)
                     filePath = os.path.join(newPath, fileName)
                     print("filePath_2:", filePath)
-                    sha256_2 = getSha256(filePath)
+                    sha256_2 = getSha256Cached(db, filePath)
                     fileSizeBytes_2, fileModTime_2 = getFileStats(filePath)
                     # print
                     print("sha256_1:", sha256_1)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:05:41 2026
+
+PJD 18 Oct 2026     - Written to extract file creation dates from global attributes in one
+                      precompiled regex pass, replacing the scanCMIP.py getDate cascade
+PJD 18 Oct 2026     - Added LRU cache of matchDate results keyed by (era, att, blake2b of the
+                      attribute string), files sharing provenance parse it once
+
+@author: durack1
+"""
+
+# %% imports
+import collections
+import hashlib
+import re
+
+# %% create lookup lists
+attList = [
+    "cmor_version",
+    "creation_date",  # CMIP6 NCAR CESM2
+    "comment",
+    "contact",
+    "date",
+    "experiment_id",
+    "forcing",
+    "history",
+    "institution",
+    "realization",
+    "source",
+]
+# "creation_date","license","tracking_id", "table_id"
+monList = [
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+]
+timeZones = [
+    "EDT",
+    "EST",
+    "MDT",
+    "MST",
+    "PDT",
+    "PST",
+]
+
+# %% date formats, one alternation - finditer tries them left to right at each offset
+dateReg = re.compile(
+    r"""
+    # candidate offsets only, the first character of a format and not mid-number
+    (?=[AyFMSTW0-9])(?<![0-9])
+    (?:
+    # CMOR1 e.g. At 20:53:22 on 06/28/2005, CMOR rewrote data to comply with CF standards
+    (?P<cmor1>At\s\d{1,2}:\d{2}:\d{2}\son\s
+        (?P<cmor1Mon>\d{1,2})/(?P<cmor1Day>\d{1,2})/(?P<cmor1Yr>\d{2,4}),?\s
+        CMOR\srewrote\sdata\sto\scomply)
+    # CMOR2/CMOR3 e.g. 2013-03-12T17:53:48Z CMOR rewrote data to comply with CF standards
+    |(?P<cmor2>(?P<cmor2Yr>\d{1,4})-(?P<cmor2Mon>\d{1,2})-(?P<cmor2Day>\d{1,2})
+        T\d{1,2}:\d{1,2}:\d{1,2}Z\sCMOR\srewrote\sdata\sto\scomply)
+    # CSIRO e.g. year:2005:month:01:day:17
+    |(?P<csiro>year:(?P<csiroYr>\d{4}):month:(?P<csiroMon>\d{2}):day:(?P<csiroDay>\d{2}))
+    # NCAR CCSM e.g. Fri Aug  5 19:23:54 MDT 2005
+    |(?P<ncar>(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)\s(?P<ncarMon>[a-zA-Z]{3})\s{1,2}
+        (?P<ncarDay>\d{1,2})\s
+        \d{1,2}.\d{2}.\d{2}\s(?:"""
+    + "|".join(timeZones)
+    + r""")\s(?P<ncarYr>\d{4}))
+    # ISO e.g. creation_date = 2021-05-06T18:58:51Z (CMIP6 NCAR CESM2)
+    |(?P<iso>(?P<isoYr>\d{1,4})-(?P<isoMon>\d{1,2})-(?P<isoDay>\d{1,2})
+        T\d{1,2}:\d{1,2}:\d{1,2}Z)
+    # BCCR_BCM2_0 date attribute e.g. 17-Jan-2005
+    |(?P<bccr>(?P<bccrDay>\d{1,2})-(?P<bccrMon>"""
+    + "|".join(monList)
+    + r""")-(?P<bccrYr>\d{4}))
+    )
+    """,
+    re.VERBOSE,
+)
+# every format above holds one of these, strings without any skip the regex
+dateHints = ["CMOR rewrote", "year:", "Z"] + timeZones
+# lower wins within an attribute; a CMOR rewrite date wins across attributes
+datePriority = {"cmor1": 0, "cmor2": 0, "bccr": 1, "csiro": 2, "ncar": 3, "iso": 4}
+
+# %% matchDate LRU cache, per process - scanCMIP.py sums dateCacheStats over workers
+dateCache = collections.OrderedDict()
+dateCacheSize = 16384
+dateCacheStats = {"hits": 0, "misses": 0}
+
+# %% function defs
+
+
+def cachedMatchDate(attStr, att, era, startYr, endYr):
+    # matchDate through dateCache, keyed on a digest so long history strings are
+    # not held; startYr/endYr are fixed per era
+    digest = hashlib.blake2b(attStr.encode("utf-8", "replace"), digest_size=16)
+    key = (era, att, digest.digest())
+    if key in dateCache:
+        dateCache.move_to_end(key)
+        dateCacheStats["hits"] = dateCacheStats["hits"] + 1
+        return dateCache[key]
+    dateCacheStats["misses"] = dateCacheStats["misses"] + 1
+    found = matchDate(attStr, att, era, startYr, endYr)
+    dateCache[key] = found
+    if len(dateCache) > dateCacheSize:
+        dateCache.popitem(last=False)
+
+    return found
+
+
+def getDate(attDict, era, startYr, endYr):
+    # scan global attributes (attList) for a file creation date, returns the
+    # zero-padded yyyy-mm-dd date and the attribute it came from, or (None, None)
+    # the first attribute with a valid date wins, unless a later attribute holds
+    # the CMOR rewrite date
+    date, dateFoundAtt = None, None
+    for att in attList:
+        attStr = attDict.get(att)
+        if not isinstance(attStr, str):
+            continue
+        if date is not None and "CMOR rewrote" not in attStr:
+            continue  # only a CMOR rewrite date can still replace date
+        kind, attDate = cachedMatchDate(attStr, att, era, startYr, endYr)
+        if attDate is None:
+            continue
+        if kind in ("cmor1", "cmor2"):
+            return attDate, att
+        if date is None:
+            date, dateFoundAtt = attDate, att
+
+    return date, dateFoundAtt
+
+
+def makeDate(year, month, day, startYr, endYr):
+    # normalized yyyy-mm-dd, None outside startYr-endYr or an impossible month/day
+    year, month, day = int(year), int(month), int(day)
+    if not startYr <= year <= endYr:
+        return None
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
+        return None
+
+    return "{:04d}-{:02d}-{:02d}".format(year, month, day)
+
+
+def matchDate(attStr, att, era, startYr, endYr):
+    # single finditer pass over attStr, returns (kind, date) of the best valid match
+    best, bestDate = None, None
+    if att != "date" and not any([hint in attStr for hint in dateHints]):
+        return best, bestDate
+    for match in dateReg.finditer(attStr):
+        kind = match.lastgroup
+        if kind == "cmor1":
+            if era != "CMIP3":
+                continue
+            bits = match.group("cmor1Yr", "cmor1Mon", "cmor1Day")
+        elif kind == "cmor2":
+            if era == "CMIP3":
+                continue
+            bits = match.group("cmor2Yr", "cmor2Mon", "cmor2Day")
+        elif kind == "bccr":
+            if att != "date":
+                continue
+            mon = monList.index(match.group("bccrMon")) + 1
+            bits = (match.group("bccrYr"), mon, match.group("bccrDay"))
+        elif kind == "ncar":
+            if match.group("ncarMon") not in monList:
+                continue
+            mon = monList.index(match.group("ncarMon")) + 1
+            bits = (match.group("ncarYr"), mon, match.group("ncarDay"))
+        else:
+            bits = match.group(kind + "Yr", kind + "Mon", kind + "Day")
+        date = makeDate(*bits, startYr, endYr)
+        if date is None:
+            continue
+        if best is None or datePriority[kind] < datePriority[best]:
+            best, bestDate = kind, date
+        if datePriority[kind] == 0:
+            break  # CMOR rewrite date, nothing ranks higher
+
+    return best, bestDate
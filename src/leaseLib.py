@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:06:48 2026
+
+PJD 18 Oct 2026     - Written for multi-node scans: the archive is planned into work units,
+                      workers on any node claim them through lease files in a shared
+                      directory (expired leases of dead workers are re-claimed), each unit
+                      is written to its own catalogue shard and mergeShards joins them
+                      in plan order, so the merge does not depend on who scanned what
+PJD 18 Oct 2026     - Units costed from a previous catalogue (catalogueCosts) or a stat
+                      pre-pass (statCosts), claimed largest first; subtrees over maxCost
+                      are divided and oversized directories split into file batches
+PJD 18 Oct 2026     - plan raises once the planning has failed; claim reads a lease
+                      before trying to create it, waiting workers no longer write
+
+@author: durack1
+"""
+
+# %% imports
+import json
+import os
+import platform
+import threading
+import time
+import uuid
+
+from CMIP3Lib import CatalogueWriter, listDir, scanTree
+from recordLib import noInt
+from runLib import levelInfo, levelVerbose, log
+
+# %% catalogue counters and the numbered entries they count, see scanCMIP.py
+counterKeys = [
+    "!_cmorCount",
+    "!_dirCount",
+    "!_fileCount",
+    "!badFileCount",
+    "!fileReadErrorCount",
+    "!noDateFileCount",
+]
+numberedKeys = {
+    "!badFile": "!badFileCount",
+    "!noDateFile": "!noDateFileCount",
+    "!fileReadError": "!fileReadErrorCount",
+}
+maxAttempts = 3  # leases a unit may expire on before it is marked failed
+# cost model, in bytes read: a file costs its size plus the open/decode overhead of
+# about fileCostBytes; automatic maxCost is the scan total / splitShare
+fileCostBytes = 2**22
+splitShare = 256
+
+# %% function defs
+
+
+class WorkLeases:
+    # work units of one scan shared through leaseDir (any POSIX filesystem the
+    # workers all mount), layout:
+    #   plan.json               units in scan order, written once by the first process
+    #   leases/{unit}.json      {worker, token, attempt, expires}, held while scanning
+    #   done/{unit}.json        completion marker naming the shard, counts it holds
+    #   shards/{unit}.{worker}.{attempt}.jsonl  CatalogueWriter lines of the unit
+    # files are created by os.link of a complete temporary file, so exactly one
+    # worker wins a lease or a completion; leases are renewed by a thread every
+    # leaseSeconds / 4 and expire on the wall clock (node clocks must agree to
+    # well within leaseSeconds)
+    def __init__(self, leaseDir, workerId=None, leaseSeconds=600):
+        self.leaseDir = leaseDir
+        self.workerId = workerId or ".".join([platform.node(), str(os.getpid())])
+        self.leaseSeconds = leaseSeconds
+        self.poll = min(5.0, leaseSeconds / 4)
+        self.units = []
+        self.order = []  # units largest cost first, the order workers claim them
+        self.held = {}  # unit id -> lease written by this worker
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat = None
+        for subDir in ("leases", "done", "shards"):
+            os.makedirs(os.path.join(leaseDir, subDir), exist_ok=True)
+
+    def path(self, *names):
+        return os.path.join(self.leaseDir, *names)
+
+    def plan(
+        self,
+        paths,
+        unitDepth,
+        excludeDirs=set(),
+        excludeDirs2=set(),
+        costs=None,
+        maxCost=0,
+    ):
+        # read plan.json, or plan and publish it; one process plans (under a
+        # "plan" lease) while the others wait, then all scan the same units.
+        # costs is called by the planning process only, returning {root: cost}
+        # of each directory's own files (catalogueCosts, statCosts) or None;
+        # maxCost 0 is the cost total / splitShare. the planning process's
+        # options decide, so give every process the same ones
+        planFile = self.path("plan.json")
+        while not os.path.exists(planFile):
+            failedFile = self.path("done", "plan.json")
+            failed = readJson(failedFile)
+            if failed is not None:
+                # the planner's leases expired maxAttempts times, see claim
+                raise ValueError(
+                    "planning failed, last planner {} - remove {} to retry".format(
+                        failed["worker"], failedFile
+                    )
+                )
+            if not self.claim("plan"):
+                time.sleep(self.poll)
+                continue
+            dirCosts = costs() if costs is not None else None
+            if dirCosts and not maxCost:
+                maxCost = sum(dirCosts.values()) // splitShare
+            units = planUnits(
+                paths, unitDepth, excludeDirs, excludeDirs2, dirCosts, maxCost
+            )
+            plan = {"paths": paths, "unitDepth": unitDepth, "maxCost": maxCost}
+            plan["units"] = units
+            createJson(planFile, plan)
+            with self.lock:
+                lease = self.held.pop("plan")
+            removeLease(self.path("leases", "plan.json"), lease["token"])
+            log(
+                levelInfo,
+                "planned work units:",
+                len(units),
+                "largest: {:.1f} MB".format(
+                    max([unit["cost"] for unit in units] + [0]) / 1e6
+                ),
+                "file batches:",
+                len([unit for unit in units if "start" in unit]),
+            )
+        plan = readJson(planFile)
+        if plan["paths"] != paths or plan["unitDepth"] != unitDepth:
+            raise ValueError(
+                " ".join([planFile, "was planned for other paths or --unitDepth"])
+            )
+        self.units = plan["units"]
+        self.order = sorted(self.units, key=lambda unit: (-unit["cost"], unit["id"]))
+
+        return self.units
+
+    def doneUnits(self):
+        names = os.listdir(self.path("done"))
+
+        return set([name[:-5] for name in names if name.endswith(".json")])
+
+    def claim(self, unitId):
+        # lease unitId for this worker, re-claiming an expired lease; the lease
+        # dict, or None when the unit is leased, complete or has failed. a live
+        # lease is read first, only free or expired ones are created (fsync, link)
+        leaseFile = self.path("leases", unitId + ".json")
+        old = readJson(leaseFile)
+        if old is not None and time.time() < old["expires"]:
+            return None
+        lease = {
+            "worker": self.workerId,
+            "token": uuid.uuid4().hex,
+            "attempt": 1,
+            "expires": time.time() + self.leaseSeconds,
+        }
+        if not createJson(leaseFile, lease):
+            old = readJson(leaseFile)
+            if old is None or time.time() < old["expires"]:
+                return None
+            # expired, move it aside - only one worker's rename succeeds
+            staleFile = ".".join([leaseFile, lease["token"], "stale"])
+            try:
+                os.rename(leaseFile, staleFile)
+            except FileNotFoundError:
+                return None
+            old = readJson(staleFile)
+            if time.time() < old["expires"]:
+                # renewed in the meantime, put it back
+                try:
+                    os.link(staleFile, leaseFile)
+                except FileExistsError:
+                    pass
+                os.remove(staleFile)
+                return None
+            os.remove(staleFile)
+            lease["attempt"] = old["attempt"] + 1
+            if lease["attempt"] > maxAttempts:
+                marker = {"unit": unitId, "status": "failed", "worker": old["worker"]}
+                marker["attempt"] = old["attempt"]
+                createJson(self.path("done", unitId + ".json"), marker)
+                log(levelInfo, "work unit failed:", unitId, "leases expired")
+                return None
+            lease["expires"] = time.time() + self.leaseSeconds
+            if not createJson(leaseFile, lease):
+                return None
+            log(levelInfo, "re-claimed work unit:", unitId, "from:", old["worker"])
+        if os.path.exists(self.path("done", unitId + ".json")):
+            removeLease(leaseFile, lease["token"])  # completed by an earlier lease
+            return None
+        with self.lock:
+            self.held[unitId] = lease
+        if self.heartbeat is None:
+            self.heartbeat = threading.Thread(target=self.renewLoop, daemon=True)
+            self.heartbeat.start()
+
+        return lease
+
+    def claimUnits(self):
+        # claim units largest first and yield them until every unit is complete, so
+        # the scan ends on small units; waits on units other workers hold,
+        # re-claiming them if their lease expires. the caller completes each unit
+        # before asking for the next one
+        while True:
+            done = self.doneUnits()
+            pending = [unit for unit in self.order if unit["id"] not in done]
+            if not pending:
+                return
+            for unit in pending:
+                if unit["id"] not in self.held and self.claim(unit["id"]):
+                    log(levelVerbose, "claimed work unit:", unit["id"], unit["path"])
+                    yield unit
+                    break
+            else:
+                time.sleep(self.poll)
+
+    def close(self):
+        # stop renewing; leases still held are expired in place, so another worker
+        # re-claims them at once and the attempt count is kept
+        self.stopped.set()
+        with self.lock:
+            held, self.held = self.held, {}
+        for unitId, lease in held.items():
+            leaseFile = self.path("leases", unitId + ".json")
+            if (readJson(leaseFile) or {}).get("token") == lease["token"]:
+                replaceJson(leaseFile, dict(lease, expires=0))
+
+    def complete(self, unitId, shardFile, base, end):
+        # completion marker for a unit scanned into shardFile, base and end are
+        # the scanner's catalogue counters before and after it; False (and the
+        # shard removed) when the lease was lost or the unit completed elsewhere
+        with self.lock:
+            lease = self.held.pop(unitId, None)
+        leaseFile = self.path("leases", unitId + ".json")
+        marker = {
+            "unit": unitId,
+            "status": "ok",
+            "worker": self.workerId,
+            "attempt": lease and lease["attempt"],
+            "shard": os.path.basename(shardFile),
+            "base": dict([(key, base.get(key, 0)) for key in counterKeys]),
+            "counts": dict(
+                [(key, end.get(key, 0) - base.get(key, 0)) for key in counterKeys]
+            ),
+        }
+        if lease is None or not createJson(self.path("done", unitId + ".json"), marker):
+            log(levelInfo, "work unit lost to another worker:", unitId)
+            os.remove(shardFile)
+            return False
+        removeLease(leaseFile, lease["token"])
+
+        return True
+
+    def renewLoop(self):
+        # heartbeat thread, a lease replaced by another worker is dropped and the
+        # unit's completion then fails
+        while not self.stopped.wait(self.leaseSeconds / 4):
+            with self.lock:
+                held = list(self.held.items())
+            for unitId, lease in held:
+                leaseFile = self.path("leases", unitId + ".json")
+                with self.lock:  # not while complete removes it
+                    if unitId not in self.held:
+                        continue
+                    if (readJson(leaseFile) or {}).get("token") != lease["token"]:
+                        self.held.pop(unitId)
+                        continue
+                    lease["expires"] = time.time() + self.leaseSeconds
+                    replaceJson(leaseFile, lease)
+
+    def shardFile(self, unitId):
+        lease = self.held[unitId]
+        name = ".".join([unitId, self.workerId, str(lease["attempt"]), "jsonl"])
+
+        return self.path("shards", name)
+
+    def wait(self):
+        # block until every unit is complete, the --merge coordinator
+        lastDone = None
+        while True:
+            done = self.doneUnits()
+            if len(done) != lastDone:
+                log(levelInfo, "work units complete:", len(done), "of", len(self.units))
+                lastDone = len(done)
+            if all([unit["id"] in done for unit in self.units]):
+                return
+            time.sleep(self.poll)
+
+
+def createJson(outFile, obj):
+    # write outFile only if it does not exist, atomically: a complete temporary
+    # file is hard linked into place (O_EXCL is unreliable on older NFS)
+    tmpFile = ".".join([outFile, uuid.uuid4().hex, "tmp"])
+    with open(tmpFile, "w") as fH:
+        json.dump(obj, fH, ensure_ascii=True, separators=(",", ":"))
+        fH.flush()
+        os.fsync(fH.fileno())
+    try:
+        os.link(tmpFile, outFile)
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmpFile)
+
+    return True
+
+
+def mergeShards(leases, catFile):
+    # join the unit shards into one CatalogueWriter catFile in plan order; the
+    # numbered !badFile/!noDateFile/!fileReadError entries are renumbered and the
+    # counters summed, so the result matches a single-process scan of the paths.
+    # returns (counts, failed unit ids)
+    totals = dict([(key, 0) for key in counterKeys])
+    failed = []
+    batchSeen = {}  # split directory -> what earlier file batches wrote
+    writer = CatalogueWriter(catFile)
+    for key in numberedKeys:
+        writer.set([key], {})
+    for unit in leases.units:
+        marker = readJson(leases.path("done", unit["id"] + ".json"))
+        if marker["status"] != "ok":
+            log(levelInfo, "work unit failed, not in catalogue:", unit["path"])
+            failed.append(unit["id"])
+            continue
+        counts = dict(marker["counts"])
+        batchDir = unit["path"] if "start" in unit else None
+        if batchDir is not None:
+            # once per directory, as a single-process scan of it
+            seen = batchSeen.setdefault(batchDir, set())
+            if counts["!_dirCount"] and "counted" in seen:
+                counts["!_dirCount"] = counts["!_dirCount"] - 1
+            elif counts["!_dirCount"]:
+                seen.add("counted")
+        with open(leases.path("shards", marker["shard"])) as fH:
+            for line in fH:
+                keys, value = json.loads(line)
+                if keys[0] in totals:
+                    continue  # the scanner's running totals, summed below
+                if batchDir is not None and keys == [batchDir]:
+                    if "entry" in seen:
+                        continue  # cm[root] = {} would drop the earlier batches
+                    seen.add("entry")
+                if keys[0] in numberedKeys:
+                    if len(keys) == 2:
+                        countKey = numberedKeys[keys[0]]
+                        number = keys[1] - marker["base"][countKey] + totals[countKey]
+                        writer.set([keys[0], number], value)
+                    continue
+                writer.set(keys, value)
+        for key in counterKeys:
+            totals[key] = totals[key] + counts[key]
+    for key in counterKeys:
+        if totals[key]:
+            writer.set([key], totals[key])
+    writer.close()
+
+    return totals, failed
+
+
+def catalogueCosts(store):
+    # {root: cost} of each directory's files in a recordLib.RecordStore (previous
+    # catalogue); files without a record (no date, bad) are not costed
+    dirCosts = {}
+    for root, files in store.dirs():
+        cost = 0
+        for ind in files.values():
+            fileSizeBytes = store.fileSizeBytes[ind]
+            if fileSizeBytes == noInt:
+                fileSizeBytes = store.record(ind, root).get("fileSizeBytes", 0)
+            cost = cost + fileSizeBytes + fileCostBytes
+        dirCosts[root] = cost
+
+    return dirCosts
+
+
+def fileCost(entry):
+    # scanTree/listDir DirEntry, only *.nc files are opened and hashed
+    if entry.name[-3:] != ".nc":
+        return 0
+    try:
+        return entry.stat().st_size + fileCostBytes
+    except OSError:
+        return fileCostBytes
+
+
+def planUnits(
+    paths, unitDepth, excludeDirs=set(), excludeDirs2=set(), dirCosts=None, maxCost=0
+):
+    # work units in scanTree order: every directory unitDepth below a path with
+    # everything under it, and the files (only) of each shallower directory.
+    # with dirCosts ({root: cost} of its own files) each unit has a cost, a
+    # subtree costing over maxCost is divided further down and a directory whose
+    # files cost over maxCost is split into file batches [start, stop) by name
+    units = []
+    treeCosts = {}  # cost of everything under a directory
+    for root, cost in (dirCosts or {}).items():
+        path = root
+        while True:
+            treeCosts[path] = treeCosts.get(path, 0) + cost
+            parent = os.path.dirname(path)
+            if path in paths or parent == path:
+                break
+            path = parent
+
+    def visit(path, depth):
+        if depth >= unitDepth and (not maxCost or treeCosts.get(path, 0) <= maxCost):
+            units.append({"path": path, "recursive": True})
+            units[-1]["cost"] = treeCosts.get(path, 0)
+            return
+        dirs, files = listDir(path, excludeDirs, excludeDirs2)
+        if files and maxCost and (dirCosts or {}).get(path, 0) > maxCost:
+            batch = {"path": path, "recursive": False, "start": None, "cost": 0}
+            for entry in files:
+                cost = fileCost(entry)
+                if batch["cost"] and batch["cost"] + cost > maxCost:
+                    batch["stop"] = entry.name
+                    units.append(batch)
+                    batch = {"path": path, "recursive": False, "start": entry.name}
+                    batch["cost"] = 0
+                batch["cost"] = batch["cost"] + cost
+            batch["stop"] = None
+            units.append(batch)
+        elif files:
+            units.append({"path": path, "recursive": False})
+            units[-1]["cost"] = (dirCosts or {}).get(path, 0)
+        for d in dirs:
+            if not d.is_symlink():  # as scanTree
+                visit(d.path, depth + 1)
+
+    for path in paths:
+        visit(path, 0)
+    for n, unit in enumerate(units):
+        unit["id"] = "{:06d}".format(n)
+
+    return units
+
+
+def readJson(inFile):
+    # None if inFile does not exist (a lease released or moved aside)
+    try:
+        with open(inFile) as fH:
+            return json.load(fH)
+    except FileNotFoundError:
+        return None
+
+
+def replaceJson(outFile, obj):
+    # replace outFile atomically (lease renewal)
+    tmpFile = ".".join([outFile, uuid.uuid4().hex, "tmp"])
+    with open(tmpFile, "w") as fH:
+        json.dump(obj, fH, ensure_ascii=True, separators=(",", ":"))
+    os.replace(tmpFile, outFile)
+
+
+def removeLease(leaseFile, token):
+    # remove leaseFile if it is still the lease holding token
+    if (readJson(leaseFile) or {}).get("token") == token:
+        try:
+            os.remove(leaseFile)
+        except FileNotFoundError:
+            pass
+
+
+def statCosts(paths, excludeDirs=set(), excludeDirs2=set(), threads=16):
+    # {root: cost} of each directory's own files from a scanTree pass, the
+    # stats come with the listing so nothing is opened
+    dirCosts = {}
+    for root, dirs, files in scanTree(
+        paths, excludeDirs, excludeDirs2, threads=threads
+    ):
+        if files:
+            dirCosts[root] = sum([fileCost(entry) for entry in files])
+
+    return dirCosts
+
+
+def walkUnit(unit, excludeDirs=set(), excludeDirs2=set(), threads=16):
+    # scanTree walk of one work unit, pruned to its top directory if not
+    # recursive and to start <= name < stop for a file batch
+    walk = scanTree([unit["path"]], excludeDirs, excludeDirs2, threads=threads)
+    for root, dirs, files in walk:
+        if not unit["recursive"]:
+            dirs[:] = []  # scanTree honours the pruning
+        if unit.get("start") is not None:
+            files = [entry for entry in files if entry.name >= unit["start"]]
+        if unit.get("stop") is not None:
+            files = [entry for entry in files if entry.name < unit["stop"]]
+        yield root, dirs, files
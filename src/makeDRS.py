@@ -4,6 +4,7 @@
 Created on Mon Jul 24 15:14:34 2023
 
 PJD 24 Jul 2023     - Written to organize CMIP3 data using CMIP6 DRS
+PJD 18 Oct 2026     - Added --profile (sampled dedupe/drs cProfile) and --tracemalloc
 
 Plans
 1. Generate keys for all files - scanCMIP3-sha256.py
@@ -18,6 +19,7 @@ Plans
 """
 
 # %% imports
+import argparse
 import json
 import os
 import pdb
@@ -34,7 +36,13 @@ from CMIP3Lib import (
     matchRun,
     matchTable,
 )
+from runLib import Profiler, addProfileArguments
 
+# add runtime argument
+parser = argparse.ArgumentParser(description="Map CMIP3 files to the CMIP6 DRS")
+addProfileArguments(parser)
+args = vars(parser.parse_args())
+profiler = Profiler(args["profile"], args["profileSample"], args["tracemalloc"])
 
 # %% load data
 infile = "230723_cmip3.json"
@@ -101,7 +109,7 @@ sha256uniqL.sort()  # create persistently ordered list
 emptyDir = []
 filesToProcess = []
 dupeDict = {}
-for i, sha in enumerate(sha256uniqL):  # 28499 trigger test
+for i, sha in enumerate(profiler.iterate("dedupe", sha256uniqL)):  # 28499 trigger test
     print("----------")
     print("{:06}".format(i), sha)
     count = 0
@@ -158,7 +166,7 @@ srcIdsFx = []
 varIds = []
 
 # %% start looping
-for key in dirList:
+for key in profiler.iterate("drs", dirList):
     print("key:", key)
     if key in [
         "/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1",
@@ -274,3 +282,4 @@ print("source_ids-Fx:", len(srcIdsFx), srcIdsFx)
 print("----------")
 varIds.sort()
 print("variable_ids:", len(varIds), varIds)
+profiler.close()
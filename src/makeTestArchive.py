@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:02:26 2026
+
+PJD 18 Oct 2026     - Written to build a synthetic CMIP3 archive for benchScan.py:
+                      ipcc/[dataN/]<exp>/<realm>/<freq>/<var>/<model>/runN layout, small
+                      netCDF3/netCDF4 files with the archive's date attribute styles,
+                      binary identical copies, *.nc.bad files and broken time units
+                      e.g. python makeTestArchive.py --files 10000 --outDir /tmp/cmip3Test
+
+@author: durack1
+"""
+
+# %% imports
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+
+import netCDF4
+import numpy as np
+
+from runLib import addArguments, levelInfo, log, setLevel
+
+# %% archive vocabulary, as found under /p/css03/esgf_publish/cmip3/ipcc
+experiments = [
+    "1pctto2x",
+    "20c3m",
+    "amip",
+    "commit",
+    "picntrl",
+    "sresa1b",
+    "sresa2",
+    "sresb1",
+]
+realmVars = {
+    "atm": ["clt", "hfls", "pr", "psl", "rlut", "rsut", "ta", "tas", "ua"],
+    "ice": ["sic", "sit"],
+    "land": ["mrso", "snd"],
+    "ocn": ["so", "thetao", "tos", "zos"],
+}
+# table_id by realm and frequency, in the CMIP3 fileName
+tables = {
+    ("atm", "3h"): "A3",
+    ("atm", "da"): "A2",
+    ("atm", "mo"): "A1",
+    ("atm", "yr"): "A5",
+    ("ice", "mo"): "O1",
+    ("land", "mo"): "A1",
+    ("ocn", "mo"): "O1",
+    ("ocn", "yr"): "O2",
+}
+# model: (date attribute style, calendar)
+models = {
+    "bccr_bcm2_0": ("bccr", "noleap"),
+    "cccma_cgcm3_1": ("cmor1", "noleap"),
+    "cnrm_cm3": ("cmor1", "gregorian"),
+    "csiro_mk3_0": ("csiro", "noleap"),
+    "gfdl_cm2_0": ("cmor1", "noleap"),
+    "gfdl_cm2_1": ("cmor1", "noleap"),
+    "giss_model_e_r": ("cmor1", "noleap"),
+    "ingv_echam4": ("cmor1", "standard"),
+    "inmcm3_0": ("cmor1", "360_day"),
+    "ipsl_cm4": ("cmor1", "noleap"),
+    "miroc3_2_medres": ("cmor1", "noleap"),
+    "miub_echo_g": ("cmor1", "standard"),
+    "mpi_echam5": ("cmor1", "standard"),
+    "mri_cgcm2_3_2a": ("cmor1", "noleap"),
+    "ncar_ccsm3_0": ("ncar", "noleap"),
+    "ncar_pcm1": ("ncar", "noleap"),
+    "ukmo_hadcm3": ("cmor1", "360_day"),
+    "ukmo_hadgem1": ("cmor1", "360_day"),
+}
+brokenUnits = ["days since 20O1-1-1", "months since 0000-00-00"]
+monList = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+dayList = "Mon Tue Wed Thu Fri Sat Sun".split()
+excludeDirs = ["cam3.3", "summer", "T4031qt"]  # scanCMIP.py skips these
+
+# add runtime argument
+parser = argparse.ArgumentParser(description="Build a synthetic CMIP3 archive")
+parser.add_argument(
+    "--outDir",
+    help="Replaced if it exists; files go under outDir/cmip3/ipcc, the scan path"
+    " outDir/cmip3, with outDir/manifest.json",
+    required=True,
+)
+parser.add_argument(
+    "--files",
+    help="Total number of files written",
+    type=int,
+    default=1000,
+)
+parser.add_argument(
+    "--seed",
+    help="Random seed, the same seed and --files give the same archive",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    help="Number of processes writing files, 0 runs inline",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--maxSteps",
+    help="Most time steps per file, file sizes scale with this",
+    type=int,
+    default=24,
+)
+parser.add_argument(
+    "--grid",
+    help="nlat nlon of the data variable",
+    type=int,
+    nargs=2,
+    default=[4, 8],
+)
+parser.add_argument(
+    "--duplicates",
+    help="Fraction of files that are binary identical copies under another dataN",
+    type=float,
+    default=0.1,
+)
+parser.add_argument(
+    "--bad",
+    help="Fraction of files that are truncated *.nc.bad files",
+    type=float,
+    default=0.01,
+)
+parser.add_argument(
+    "--brokenTime",
+    help="Fraction of netCDF files with undecodable time units",
+    type=float,
+    default=0.01,
+)
+parser.add_argument(
+    "--noDate",
+    help="Fraction of netCDF files without a creation date attribute",
+    type=float,
+    default=0.05,
+)
+parser.add_argument(
+    "--netcdf4",
+    help="Fraction of netCDF files written as NETCDF4 (HDF5), the rest netCDF3",
+    type=float,
+    default=0.2,
+)
+addArguments(parser)
+args = vars(parser.parse_args())
+setLevel(args)
+
+# %% function defs
+
+
+def dateAttributes(style, rng):
+    # global attributes carrying a 2004-2006 creation date in the model's style
+    year = int(rng.integers(2004, 2007))
+    month, day = int(rng.integers(1, 13)), int(rng.integers(1, 29))
+    hms = "{:02d}:{:02d}:{:02d}".format(*rng.integers(0, [24, 60, 60]))
+    if style == "cmor1":
+        return {
+            "history": " ".join(
+                [
+                    "Output from archive/run1.",
+                    "At {} on {:02d}/{:02d}/{:d},".format(hms, month, day, year),
+                    "CMOR rewrote data to comply with CF standards and IPCC",
+                    "Fourth Assessment requirements",
+                ]
+            ),
+            "cmor_version": np.float32(0.96),
+        }
+    if style == "ncar":
+        return {
+            "history": "{} {} {:2d} {} {} {:d} ncks -d time,0,11 b30.nc".format(
+                dayList[int(rng.integers(0, 7))],
+                monList[month - 1],
+                day,
+                hms,
+                ["MDT", "MST", "PDT", "PST"][int(rng.integers(0, 4))],
+                year,
+            )
+        }
+    if style == "csiro":
+        return {
+            "comment": "year:{:d}:month:{:02d}:day:{:02d} converted by CSIRO".format(
+                year, month, day
+            )
+        }
+    if style == "bccr":
+        return {"date": "{:02d}-{}-{:d}".format(day, monList[month - 1], year)}
+
+    return {"history": "Created for the IPCC AR4 without a timestamp"}
+
+
+def planArchive(nFiles, seed):
+    # file specs (kind, filePath, fields) - kind nc, copy or bad; deterministic
+    # for nFiles and seed, independent of --workers
+    rng = np.random.default_rng(seed)
+    nDup = int(nFiles * args["duplicates"])
+    nBad = int(nFiles * args["bad"])
+    nExclude = min(nFiles // 1000, 10)
+    nOrig = max(nFiles - nDup - nBad - nExclude, 1)
+    ipcc = os.path.join(args["outDir"], "cmip3", "ipcc")
+    modelNames = sorted(models)
+    pairs = sorted(tables)
+    specs, dirs = [], set()
+    while len(specs) < nOrig:
+        realm, freq = pairs[int(rng.integers(0, len(pairs)))]
+        var = realmVars[realm][int(rng.integers(0, len(realmVars[realm])))]
+        model = modelNames[int(rng.integers(0, len(modelNames)))]
+        exp = experiments[int(rng.integers(0, len(experiments)))]
+        run = "run" + str(int(rng.integers(1, 6)))
+        dataN = "data" + str(int(rng.integers(1, 21)))
+        bits = [exp, realm, freq, var, model, run]
+        if rng.random() < 0.5:
+            bits = [dataN] + bits
+        dirPath = os.path.join(ipcc, *bits)
+        if dirPath in dirs:
+            continue
+        dirs.add(dirPath)
+        table = tables[(realm, freq)]
+        # time chunked files, a directory holds 1-4 of them
+        nChunk = min(int(rng.integers(1, 5)), nOrig - len(specs))
+        year0 = int(rng.integers(1850, 2000))
+        for chunk in range(nChunk):
+            yr0 = year0 + chunk * 10
+            fileName = "{}_{}_{:04d}-{:04d}.nc".format(var, table, yr0, yr0 + 9)
+            if nChunk == 1:
+                fileName = "{}_{}.nc".format(var, table)
+            fields = {"var": var, "model": model, "exp": exp, "year0": yr0}
+            fields["seed"] = [seed, len(specs)]
+            specs.append(("nc", os.path.join(dirPath, fileName), fields))
+    origPaths = [spec[1] for spec in specs]
+    # binary identical copies, the same path under another (or no) dataN
+    taken = set(origPaths)
+    while nDup:
+        source = origPaths[int(rng.integers(0, len(origPaths)))]
+        bits = os.path.relpath(source, ipcc).split(os.sep)
+        if bits[0].startswith("data"):
+            bits = bits[1:]
+        dataN = "data" + str(int(rng.integers(1, 21)))
+        target = os.path.join(ipcc, dataN, *bits)
+        if target in taken:
+            continue
+        taken.add(target)
+        specs.append(("copy", target, {"source": source}))
+        nDup = nDup - 1
+    # truncated copies renamed *.nc.bad, next to the original
+    for ind in rng.choice(
+        len(origPaths), size=min(nBad, len(origPaths)), replace=False
+    ):
+        source = origPaths[int(ind)]
+        specs.append(("bad", source + ".bad", {"source": source}))
+    # files in excluded directories
+    for ind in range(nExclude):
+        excluded = excludeDirs[ind % len(excludeDirs)]
+        filePath = os.path.join(ipcc, excluded, "x{:d}.nc".format(ind))
+        fields = {"var": "tas", "model": "ncar_ccsm3_0", "exp": "20c3m"}
+        fields.update({"year0": 1870, "seed": [seed, nOrig + ind], "excluded": True})
+        specs.append(("nc", filePath, fields))
+
+    return specs
+
+
+def writeFile(spec):
+    # write one spec, returns (kind, detail, fileSizeBytes); detail is the
+    # file format or broken/noDate for nc files
+    kind, filePath, fields = spec
+    os.makedirs(os.path.dirname(filePath), exist_ok=True)
+    if kind == "copy":
+        shutil.copyfile(fields["source"], filePath)
+        return kind, kind, os.path.getsize(filePath)
+    if kind == "bad":
+        with open(fields["source"], "rb") as fH:
+            buf = fH.read()
+        with open(filePath, "wb") as fH:
+            fH.write(buf[: max(len(buf) // 2, 3)])
+        return kind, kind, os.path.getsize(filePath)
+    rng = np.random.default_rng(fields["seed"])
+    style, calendar = models[fields["model"]]
+    detail = "excluded" if fields.get("excluded") else "ok"
+    if rng.random() < args["noDate"]:
+        style, detail = None, "noDate"
+    units = "days since {:04d}-01-01".format(fields["year0"])
+    if rng.random() < args["brokenTime"]:
+        units, detail = brokenUnits[int(rng.integers(0, len(brokenUnits)))], "broken"
+    fileFormat = "NETCDF3_CLASSIC"
+    if rng.random() < args["netcdf4"]:
+        fileFormat = "NETCDF4"
+    elif rng.random() < 0.3:
+        fileFormat = "NETCDF3_64BIT_OFFSET"
+    nt = int(rng.integers(1, args["maxSteps"] + 1))
+    nlat, nlon = args["grid"]
+    ds = netCDF4.Dataset(filePath, "w", format=fileFormat)
+    ds.createDimension("time", None)
+    ds.createDimension("lat", nlat)
+    ds.createDimension("lon", nlon)
+    time = ds.createVariable("time", "f8", ("time",))
+    time.units = units
+    time.calendar = calendar
+    time.axis = "T"
+    time[:] = np.arange(nt) * 30.0 + 15.0
+    lat = ds.createVariable("lat", "f8", ("lat",))
+    lat.units = "degrees_north"
+    lat[:] = np.linspace(-90, 90, nlat)
+    lon = ds.createVariable("lon", "f8", ("lon",))
+    lon.units = "degrees_east"
+    lon[:] = np.linspace(0, 360, nlon, endpoint=False)
+    var = ds.createVariable(fields["var"], "f4", ("time", "lat", "lon"))
+    var[:] = rng.random((nt, nlat, nlon), dtype=np.float32)
+    atts = {
+        "title": "{} model output prepared for IPCC Fourth Assessment {}".format(
+            fields["model"], fields["exp"]
+        ),
+        "institution": fields["model"].split("_")[0].upper(),
+        "source": fields["model"],
+        "contact": "pcmdi@llnl.gov",
+        "project_id": "IPCC Fourth Assessment",
+        "table_id": "Table A1 (17 November 2004)",
+        "experiment_id": fields["exp"],
+        "realization": np.int32(1),
+        "Conventions": "CF-1.0",
+    }
+    atts.update(dateAttributes(style, rng))
+    ds.setncatts(atts)
+    ds.close()
+
+    return kind, detail, os.path.getsize(filePath)
+
+
+# %% build the archive, copies and *.nc.bad after the files they are made from
+if os.path.exists(args["outDir"]):
+    shutil.rmtree(args["outDir"])
+os.makedirs(args["outDir"])
+specs = planArchive(args["files"], args["seed"])
+phases = [
+    [spec for spec in specs if spec[0] == "nc"],
+    [spec for spec in specs if spec[0] != "nc"],
+]
+counts, fileSizeBytes = {}, 0
+if args["workers"]:
+    pool = multiprocessing.get_context("fork").Pool(args["workers"])
+for phase in phases:
+    if args["workers"]:
+        written = pool.imap_unordered(writeFile, phase, chunksize=64)
+    else:
+        written = map(writeFile, phase)
+    for kind, detail, nbytes in written:
+        counts[detail] = counts.get(detail, 0) + 1
+        fileSizeBytes = fileSizeBytes + nbytes
+if args["workers"]:
+    pool.close()
+    pool.join()
+
+# %% manifest, read by benchScan.py for files/s and MB/s
+manifest = {
+    "seed": args["seed"],
+    "files": len(specs),
+    "fileSizeBytes": fileSizeBytes,
+    "dirs": len(set([os.path.dirname(spec[1]) for spec in specs])),
+    "counts": counts,
+    "paths": [os.path.abspath(os.path.join(args["outDir"], "cmip3"))],
+}
+with open(os.path.join(args["outDir"], "manifest.json"), "w") as fH:
+    json.dump(manifest, fH, indent=4, sort_keys=True)
+log(levelInfo, "archive:", args["outDir"], "files:", len(specs), counts)
+log(levelInfo, "MB:", "{:.1f}".format(fileSizeBytes / 1e6))
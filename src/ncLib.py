@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:45 2026
+
+PJD 18 Oct 2026     - Written to read netCDF3 classic/64-bit offset headers and the
+                      first/last time values without building an xarray Dataset
+                      https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html
+PJD 18 Oct 2026     - Added scanFile, sha256, header and time values in one sequential read
+PJD 18 Oct 2026     - scanFile hashes through CMIP3Lib.getSha256 blockFunc
+PJD 18 Oct 2026     - getTimeBounds -> readTimes, raw values as scanFile returns them
+PJD 18 Oct 2026     - Added isTimeVar, rawTimeValues; decodeTime returns None for fill and
+                      overflowing values rather than raising
+PJD 18 Oct 2026     - Cap the header buffer at maxHeaderBytes and stop parsing once the
+                      header runs past the end of the file, corrupt headers fall back to xarray
+PJD 18 Oct 2026     - decodeTime adds "months since"/"years since" offsets to the reference
+                      date as xcdat does, cftime only allows them for 360_day
+
+@author: durack1
+"""
+
+# %% imports
+import os
+import struct
+
+import cftime
+import numpy as np
+
+from CMIP3Lib import getSha256
+
+# %% netCDF3 format constants
+ncDimension = 10
+ncVariable = 11
+ncAttribute = 12
+ncStreaming = 0xFFFFFFFF
+ncTypes = {
+    1: "i1",  # NC_BYTE
+    2: "S1",  # NC_CHAR
+    3: ">i2",  # NC_SHORT
+    4: ">i4",  # NC_INT
+    5: ">f4",  # NC_FLOAT
+    6: ">f8",  # NC_DOUBLE
+    7: "u1",  # NC_UBYTE (CDF5)
+    8: ">u2",  # NC_USHORT (CDF5)
+    9: ">u4",  # NC_UINT (CDF5)
+    10: ">i8",  # NC_INT64 (CDF5)
+    11: ">u8",  # NC_UINT64 (CDF5)
+}
+
+maxHeaderBytes = 4194304  # longer headers are left to xarray
+
+# %% function defs
+
+
+class HeaderTruncated(Exception):
+    # raised by parseHeader when buf ends before the header does
+    pass
+
+
+def addMonths(value, units, calendar):
+    # xcdat's decoding of "months since"/"years since" units: the whole offset is
+    # added to the reference date (dateutil relativedelta, the day clipped to the
+    # month's length); fractional offsets raise ValueError as relativedelta does
+    unit, ref = units.split(" since ", 1)
+    if value != int(value):
+        raise ValueError("non-integer " + unit.strip() + " offset")
+    months = int(value) * (12 if unit.strip() == "years" else 1)
+    refDate = cftime.num2date(0, "days since " + ref, calendar)
+    year, month = divmod(refDate.month - 1 + months, 12)
+    for day in range(refDate.day, 0, -1):
+        try:
+            return cftime.datetime(
+                refDate.year + year, month + 1, day, calendar=calendar
+            )
+        except ValueError:
+            if day == 1:
+                raise
+
+
+def decodeTime(value, units, calendar):
+    # decode a single raw time value, returned as y-m-d like scanLib.getTimes
+    # None for NaN (masked fill) and values past cftime's int64 range e.g. an
+    # undeclared 1e20 fill; bad units or calendar still raise
+    if not np.isfinite(value):
+        return None
+    try:
+        if units.split(" since ")[0].strip() in ("months", "years"):
+            date = addMonths(value, units, calendar)
+        else:
+            date = cftime.num2date(
+                value, units, calendar, only_use_cftime_datetimes=True
+            )
+    except OverflowError:
+        return None
+    dateStr = "-".join([str(date.year), str(date.month), str(date.day)])
+
+    return dateStr
+
+
+def getTimeVar(header):
+    # scanLib.inspectFile reads fh.time when xarray reports a T axis
+    var = header["variables"].get("time")
+    if var is None or not isTimeVar(var["attributes"], var["dims"]):
+        return None
+
+    return var
+
+
+def isTimeVar(atts, dims):
+    # 1D time coordinate, by units, axis or standard_name as cf_xarray would
+    units = atts.get("units", "")
+    if len(dims) != 1:
+        return False
+
+    return (
+        (isinstance(units, str) and " since " in units)
+        or atts.get("axis") == "T"
+        or atts.get("standard_name") == "time"
+    )
+
+
+def parseHeader(buf, fileSize=None):
+    # parse a netCDF3 header (CDF1, CDF2 or CDF5) from the leading bytes of a file
+    # with fileSize, a count or length reaching past the end of the file raises
+    # ValueError rather than HeaderTruncated
+    if len(buf) < 4:
+        raise HeaderTruncated()
+    if buf[:3] != b"CDF" or buf[3] not in (1, 2, 5):
+        raise ValueError("not a netCDF3 file")
+    version = buf[3]
+    pos = 4
+    sizeFmt = ">Q" if version == 5 else ">I"
+    sizeLen = 8 if version == 5 else 4
+    offsetFmt = ">I" if version == 1 else ">Q"
+    offsetLen = 4 if version == 1 else 8
+
+    def take(n):
+        nonlocal pos
+        if pos + n > len(buf):
+            if fileSize is not None and pos + n > fileSize:
+                raise ValueError("netCDF3 header runs past end of file")
+            raise HeaderTruncated()
+        chunk = bytes(buf[pos : pos + n])
+        pos = pos + n
+        return chunk
+
+    def size():
+        return struct.unpack(sizeFmt, take(sizeLen))[0]
+
+    def tag():
+        return struct.unpack(">I", take(4))[0]
+
+    def count():
+        # list lengths, every element takes at least 4 bytes
+        n = size()
+        if fileSize is not None and pos + 4 * n > fileSize:
+            raise ValueError("netCDF3 header runs past end of file")
+        return n
+
+    def name():
+        n = size()
+        chunk = take(n + (-n % 4))
+        return chunk[:n].decode("utf-8", "replace")
+
+    def values(ncType, n):
+        if ncType not in ncTypes:
+            raise ValueError("unknown nc_type " + str(ncType))
+        dtype = np.dtype(ncTypes[ncType])
+        nbytes = n * dtype.itemsize
+        chunk = take(nbytes + (-nbytes % 4))[:nbytes]
+        if ncType == 2:
+            # match netCDF4-python, char attributes come back as str
+            return chunk.decode("utf-8", "replace").replace("\x00", "")
+        arr = np.frombuffer(chunk, dtype=dtype)
+        return arr[0] if n == 1 else arr
+
+    def attributes():
+        atts = {}
+        listTag = tag()
+        n = count()
+        if listTag not in (0, ncAttribute):
+            raise ValueError("bad attribute list tag")
+        for _ in range(n):
+            attName = name()
+            ncType = tag()
+            atts[attName] = values(ncType, size())
+        return atts
+
+    numrecs = size()
+    dims = []
+    listTag = tag()
+    n = count()
+    if listTag not in (0, ncDimension):
+        raise ValueError("bad dimension list tag")
+    for _ in range(n):
+        dims.append((name(), size()))
+    globalAtts = attributes()
+    variables = {}
+    listTag = tag()
+    n = count()
+    if listTag not in (0, ncVariable):
+        raise ValueError("bad variable list tag")
+    for _ in range(n):
+        varName = name()
+        dimIds = [size() for _ in range(count())]
+        varAtts = attributes()
+        ncType = tag()
+        if ncType not in ncTypes:
+            raise ValueError("unknown nc_type " + str(ncType))
+        vsize = size()
+        begin = struct.unpack(offsetFmt, take(offsetLen))[0]
+        varDims = [dims[i][0] for i in dimIds]
+        shape = [dims[i][1] for i in dimIds]
+        variables[varName] = {
+            "attributes": varAtts,
+            "begin": begin,
+            "dims": varDims,
+            "isRecord": bool(shape) and shape[0] == 0,
+            "itemSize": np.dtype(ncTypes[ncType]).itemsize,
+            "shape": shape,
+            "type": ncType,
+            "vsize": vsize,
+        }
+    header = {
+        "attributes": globalAtts,
+        "dims": dims,
+        "headerSize": pos,
+        "numrecs": numrecs,
+        "variables": variables,
+        "version": version,
+    }
+
+    return header
+
+
+def readHeader(filePath, blockSize=65536):
+    # returns None for files that are not netCDF3 (netCDF4/HDF5 use xarray)
+    # and for headers longer than maxHeaderBytes
+    with open(filePath, "rb") as f:
+        fileSize = os.fstat(f.fileno()).st_size
+        buf = f.read(blockSize)
+        while True:
+            if buf[:4] == b"\x89HDF" or buf[:3] != b"CDF":
+                return None
+            try:
+                return parseHeader(buf, fileSize)
+            except HeaderTruncated:
+                if len(buf) >= maxHeaderBytes:
+                    return None
+                more = f.read(min(len(buf), maxHeaderBytes - len(buf)))
+                if not more:
+                    raise ValueError("truncated netCDF3 header")
+                buf = buf + more
+
+
+def readTimes(filePath, header):
+    # raw first/last time values, reading only those two elements from filePath
+    # None without a time axis, decode with timeValues
+    timeVar = getTimeVar(header)
+    if timeVar is None:
+        return None
+    offsets = timeOffsets(header, timeVar, os.path.getsize(filePath))
+    if not offsets:
+        return None
+    rawTimes = []
+    with open(filePath, "rb") as f:
+        for offset, nbytes in offsets:
+            f.seek(offset)
+            rawTimes.append(f.read(nbytes))
+
+    return rawTimes
+
+
+def recordSize(header):
+    # bytes per record across all record variables, see the format spec note on
+    # a single record variable not being padded
+    recordVars = [v for v in header["variables"].values() if v["isRecord"]]
+    sizes = []
+    for var in recordVars:
+        nbytes = var["itemSize"]
+        for n in var["shape"][1:]:
+            nbytes = nbytes * n
+        sizes.append(nbytes)
+    if len(sizes) == 1:
+        return sizes[0]
+
+    return sum(n + (-n % 4) for n in sizes)
+
+
+def scanFile(filePath, bufferSize=8388608):
+    # one sequential pass over filePath: CMIP3Lib.getSha256 hashes every block, the
+    # header is parsed from the leading blocks already in memory and the first/last
+    # time values are copied out as their blocks stream past
+    # returns (sha256, header, rawTimes), header is None for files that are not
+    # netCDF3 (netCDF4/HDF5 use xarray)
+    header, timeVar, wanted = None, None, []
+    prefix = bytearray()  # leading bytes, until the header parses or is ruled out
+    parseAt = 0  # retry the parse each time prefix doubles, as readHeader does
+    fileSize = os.path.getsize(filePath)
+
+    def capture(blockStart, block):
+        blockEnd = blockStart + len(block)
+        for offset, nbytes, piece, filled in wanted:
+            lo = max(offset, blockStart)
+            hi = min(offset + nbytes, blockEnd)
+            if lo < hi:
+                piece[lo - offset : hi - offset] = block[
+                    lo - blockStart : hi - blockStart
+                ]
+                filled.append(hi - lo)
+
+    def onBlock(blockStart, block):
+        # block is a view of the reused hash buffer, copy anything kept
+        nonlocal header, timeVar, prefix, parseAt
+        if prefix is None:
+            capture(blockStart, block)
+            return
+        prefix += block
+        if len(prefix) < parseAt and blockStart + len(block) < fileSize:
+            return
+        parseAt = 2 * len(prefix)
+        try:
+            if len(prefix) < 4:
+                raise HeaderTruncated()
+            if prefix[:4] == b"\x89HDF" or prefix[:3] != b"CDF":
+                raise ValueError("not a netCDF3 file")
+            header = parseHeader(prefix, fileSize)
+        except HeaderTruncated:
+            if len(prefix) >= maxHeaderBytes:
+                prefix = None  # left to xarray
+            return  # header continues in the next block
+        except ValueError:
+            prefix = None
+            return
+        timeVar = getTimeVar(header)
+        if timeVar is not None:
+            for offset, nbytes in timeOffsets(header, timeVar, fileSize):
+                wanted.append((offset, nbytes, bytearray(nbytes), []))
+        capture(0, prefix)
+        prefix = None
+
+    sha256 = getSha256(filePath, bufferSize=bufferSize, blockFunc=onBlock)
+    rawTimes = None
+    if wanted:
+        # a short file leaves values incomplete, timeValues then fails to decode
+        rawTimes = [
+            bytes(piece) if sum(filled) == nbytes else b""
+            for offset, nbytes, piece, filled in wanted
+        ]
+
+    return sha256, header, rawTimes
+
+
+def timeOffsets(header, var, fileSize):
+    # (offset, nbytes) of the first and last element of a 1D variable
+    nbytes = var["itemSize"]
+    if var["isRecord"]:
+        stride = recordSize(header)
+        numrecs = header["numrecs"]
+        if numrecs in (ncStreaming, 2**64 - 1):
+            numrecs = (fileSize - var["begin"]) // stride if stride else 0
+        count = numrecs
+    else:
+        stride = nbytes
+        count = var["shape"][0]
+    if not count:
+        return []
+    first = var["begin"]
+    last = var["begin"] + (count - 1) * stride
+
+    return [(first, nbytes), (last, nbytes)]
+
+
+def rawTimeValues(atts, values):
+    # y-m-d strings for raw (undecoded) time values given the variable attributes,
+    # _FillValue/missing_value and unpacking handled as xarray's CF decoding would
+    units = atts.get("units")
+    calendar = atts.get("calendar", "standard")
+    if not isinstance(calendar, str) or calendar == "":
+        calendar = "standard"
+    fills = [atts[att] for att in ("_FillValue", "missing_value") if att in atts]
+    scale = atts.get("scale_factor", 1)
+    offset = atts.get("add_offset", 0)
+    dates = []
+    for value in values:
+        if any([np.any(value == fill) for fill in fills]):
+            dates.append(None)
+            continue
+        if scale != 1 or offset != 0:
+            value = value * scale + offset
+        dates.append(decodeTime(value, units, calendar.lower()))
+
+    return dates
+
+
+def timeValues(var, rawValues):
+    # decode the raw big-endian first/last values to y-m-d strings
+    dtype = np.dtype(ncTypes[var["type"]])
+    values = [np.frombuffer(raw, dtype=dtype)[0] for raw in rawValues]
+    dates = rawTimeValues(var["attributes"], values)
+
+    return dates[0], dates[-1]
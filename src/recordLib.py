@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:12:37 2026
+
+PJD 18 Oct 2026     - Written to hold catalogue records compactly: RecordStore keeps one
+                      column per record field (arrays, binary sha256, interned strings)
+                      and directories as a tree of interned names, replacing the nested
+                      dict of dicts; loadRecords/writeCatalogue stream the json schema
+PJD 18 Oct 2026     - RecordStore roots normalized (os.path.normpath, no trailing /), a
+                      catalogue key such as /p/css03/scratch/CMIP6/ matches its files
+
+@author: durack1
+"""
+
+# %% imports
+import array
+import datetime
+import gzip
+import json
+import os
+import sys
+
+from runLib import levelInfo, log
+
+# %% record layout written by scanCMIP.py, in key order; optional keys may be absent
+# (writeJson sorts keys, so the order of a stored record's keys is not kept)
+recordKeys = [
+    "date",
+    "time0",
+    "timeN",
+    "sha256",
+    "filePath",
+    "fileSizeBytes",
+    "fileModTimeNs",
+    "fileInode",
+    "cmorVersion",
+]
+optionalKeys = ["fileModTimeNs", "fileInode", "cmorVersion"]
+keySets = [set(recordKeys)]  # every key set RecordStore columns can rebuild
+for optional in optionalKeys:
+    keySets = keySets + [keys - set([optional]) for keys in keySets]
+keySets = set([frozenset(keys) for keys in keySets])
+noInt = -(2**63)  # absent fileModTimeNs/fileInode in the int64 columns
+
+# %% function defs
+
+
+class RecordStore:
+    # catalogue records by (root, fileName), also a {filePath: record} mapping
+    # (get, [], in, len, items, values) as scanCMIP.py used for prevIndex
+    # record dicts are rebuilt on access; a record whose keys or value types
+    # differ from recordKeys is kept as given, so nothing is lost
+    def __init__(self):
+        # directory tree, node 0 is the top; root.split("/") names the path
+        self.dirParent = array.array("q", [-1])
+        self.dirName = [""]
+        self.dirChildren = [{}]
+        self.dirFiles = [None]  # {fileName: record index}, None not a catalogue key
+        # record columns, one entry per record index
+        self.fileDir = array.array("q")
+        self.fileName = []
+        self.sha256 = bytearray()  # 32 bytes per record
+        self.date = []
+        self.dateFoundAtt = []
+        self.time0 = []
+        self.timeN = []
+        self.fileSizeBytes = array.array("q")
+        self.fileModTimeNs = array.array("q")
+        self.fileInode = array.array("q")
+        self.cmorVersion = []
+        self.given = {}  # record index -> record dict kept as given
+        self.count = 0
+        self.lastDir = (None, None)  # (root, node), consecutive adds share a root
+
+    def __contains__(self, filePath):
+        return self.find(filePath) is not None
+
+    def __getitem__(self, filePath):
+        ind = self.find(filePath)
+        if ind is None:
+            raise KeyError(filePath)
+
+        return self.record(ind)
+
+    def __len__(self):
+        return self.count
+
+    def __setitem__(self, filePath, rec):
+        root, sep, fileName = filePath.rpartition("/")
+        self.add(root, fileName, rec)
+
+    def add(self, root, fileName, rec):
+        # cm[root][fileName] = rec, replacing an earlier record
+        node = self.dirNode(root, create=True)
+        if self.dirFiles[node] is None:
+            self.dirFiles[node] = {}
+        ind = self.dirFiles[node].get(fileName)
+        if ind is None:
+            ind = len(self.fileName)
+            self.dirFiles[node][intern(fileName)] = ind
+            self.fileDir.append(node)
+            self.fileName.append(intern(fileName))
+            self.sha256.extend(bytes(32))
+            for column in (self.date, self.dateFoundAtt, self.time0, self.timeN):
+                column.append(None)
+            self.cmorVersion.append(None)
+            for column in (self.fileSizeBytes, self.fileModTimeNs, self.fileInode):
+                column.append(noInt)
+            self.count = self.count + 1
+        self.given.pop(ind, None)
+        if not self.setColumns(ind, root + "/" + fileName, rec):
+            self.given[ind] = rec
+
+        return ind
+
+    def addDir(self, root, files):
+        # cm[root] = files, an empty dict keeps root as a catalogue key
+        node = self.dirNode(root, create=True)
+        for ind in (self.dirFiles[node] or {}).values():
+            self.given.pop(ind, None)  # records dropped, as cm[root] = files
+            self.count = self.count - 1
+        self.dirFiles[node] = {}
+        for fileName, rec in files.items():
+            self.add(root, fileName, rec)
+
+    def dirNode(self, root, create=False):
+        # root as given to add/addDir/find, normalized so "a/b/" and "a/b" (the
+        # rpartition of "a/b/c.nc") are one directory
+        if root == self.lastDir[0]:
+            return self.lastDir[1]
+        node = 0
+        names = os.path.normpath(root).rstrip("/").split("/") if root else [""]
+        for name in names:
+            child = self.dirChildren[node].get(name)
+            if child is None:
+                if not create:
+                    return None
+                child = len(self.dirName)
+                self.dirChildren[node][intern(name)] = child
+                self.dirParent.append(node)
+                self.dirName.append(intern(name))
+                self.dirChildren.append({})
+                self.dirFiles.append(None)
+            node = child
+        self.lastDir = (root, node)
+
+        return node
+
+    def dirPath(self, node):
+        names = []
+        while node > 0:
+            names.append(self.dirName[node])
+            node = self.dirParent[node]
+
+        return "/".join(reversed(names))
+
+    def dirs(self):
+        # (root, {fileName: record index}) of every catalogue key, in creation order
+        for node, files in enumerate(self.dirFiles):
+            if files is not None:
+                yield self.dirPath(node), files
+
+    def find(self, filePath):
+        root, sep, fileName = filePath.rpartition("/")
+        node = self.dirNode(root)
+        if node is None or not self.dirFiles[node]:
+            return None
+
+        return self.dirFiles[node].get(fileName)
+
+    def get(self, filePath, default=None):
+        ind = self.find(filePath)
+        if ind is None:
+            return default
+
+        return self.record(ind)
+
+    def items(self):
+        for root, files in self.dirs():
+            for fileName, ind in files.items():
+                yield root + "/" + fileName, self.record(ind)
+
+    def record(self, ind, root=None):
+        # record dict as scanCMIP.py wrote it, root saves the tree walk
+        if ind in self.given:
+            return self.given[ind]
+        if root is None:
+            root = self.dirPath(self.fileDir[ind])
+        rec = {
+            "date": [self.date[ind], self.dateFoundAtt[ind]],
+            "time0": self.time0[ind],
+            "timeN": self.timeN[ind],
+            "sha256": self.sha256[ind * 32 : ind * 32 + 32].hex(),
+            "filePath": root + "/" + self.fileName[ind],
+            "fileSizeBytes": self.fileSizeBytes[ind],
+        }
+        if self.fileModTimeNs[ind] != noInt:
+            rec["fileModTimeNs"] = self.fileModTimeNs[ind]
+        if self.fileInode[ind] != noInt:
+            rec["fileInode"] = self.fileInode[ind]
+        if self.cmorVersion[ind] is not None:
+            rec["cmorVersion"] = self.cmorVersion[ind]
+
+        return rec
+
+    def setColumns(self, ind, filePath, rec):
+        # store rec in the columns, False if it would not rebuild identically
+        if frozenset(rec) not in keySets or rec["filePath"] != filePath:
+            return False
+        date, sha256 = rec["date"], rec["sha256"]
+        if type(date) is not list or len(date) != 2:
+            return False
+        if type(sha256) is not str or len(sha256) != 64:
+            return False
+        try:
+            digest = bytes.fromhex(sha256)
+        except ValueError:
+            return False
+        if digest.hex() != sha256:
+            return False  # upper case hex
+        for key in ("fileSizeBytes", "fileModTimeNs", "fileInode"):
+            value = rec.get(key, 0)
+            if type(value) is not int or not noInt < value < 2**63:
+                return False
+        strings = (date[0], date[1], rec["time0"], rec["timeN"])
+        for value in strings + (rec.get("cmorVersion", ""),):
+            if value is not None and type(value) is not str:
+                return False
+        if rec.get("cmorVersion", "") is None:
+            return False
+        self.sha256[ind * 32 : ind * 32 + 32] = digest
+        self.date[ind], self.dateFoundAtt[ind], self.time0[ind], self.timeN[ind] = [
+            intern(value) for value in strings
+        ]
+        self.fileSizeBytes[ind] = rec["fileSizeBytes"]
+        self.fileModTimeNs[ind] = rec.get("fileModTimeNs", noInt)
+        self.fileInode[ind] = rec.get("fileInode", noInt)
+        self.cmorVersion[ind] = intern(rec.get("cmorVersion"))
+
+        return True
+
+    def values(self):
+        for filePath, rec in self.items():
+            yield rec
+
+
+def intern(value):
+    # shared copy of repeated strings (dates, times, names), other values as is
+    if type(value) is str:
+        return sys.intern(value)
+
+    return value
+
+
+def loadRecords(catFile, store=None):
+    # scanCMIP.py json (optionally gzipped) or CatalogueWriter *.jsonl into a
+    # RecordStore, returns (store, other) - other holds the !_counts and !bad*
+    # entries as a dict; the jsonl is streamed, later lines win as in replay
+    if store is None:
+        store = RecordStore()
+    other = {}
+    if not catFile.endswith(".jsonl"):
+        opener = gzip.open if catFile.endswith(".gz") else open
+        with opener(catFile, "rt") as fH:
+            cm = json.load(fH)
+        for key in list(cm):
+            value = cm.pop(key)  # release each directory once it is stored
+            if key.startswith("!") or not isinstance(value, dict):
+                other[key] = value
+            else:
+                store.addDir(key, value)
+        return store, other
+    with open(catFile) as fH:
+        for line in fH:
+            try:
+                keys, value = json.loads(line)
+            except ValueError:
+                # partial last line from an interrupted scan
+                log(levelInfo, "skipping:", line[:80])
+                continue
+            if keys[0].startswith("!") or len(keys) > 2:
+                d = other
+                for key in keys[:-1]:
+                    d = d.setdefault(key, {})
+                d[keys[-1]] = value
+            elif len(keys) == 2:
+                store.add(keys[0], keys[1], value)
+            elif isinstance(value, dict):
+                store.addDir(keys[0], value)
+            else:
+                other[keys[0]] = value
+
+    return store, other
+
+
+def writeCatalogue(store, other, fileText, timeFormatDir=""):
+    # CMIP3Lib.writeJson of the nested catalogue, byte for byte, written one
+    # directory at a time from store rather than from a nested dict
+    if timeFormatDir == "":
+        timeFormatDir = datetime.datetime.now().strftime("%y%m%d")
+    outFile = ".".join(["_".join([timeFormatDir, fileText]), "json"])
+    log(levelInfo, "writing:", outFile)
+    dumpArgs = {"ensure_ascii": True, "sort_keys": True, "indent": 4}
+    dumpArgs["separators"] = (",", ":")
+    keys = [(key, None) for key in other]
+    keys.extend([(root, files) for root, files in store.dirs() if root not in other])
+    keys.sort(key=lambda item: item[0])
+    with open(outFile, "w") as fH:
+        if not keys:
+            fH.write("{}")
+            return
+        fH.write("{")
+        for n, (key, files) in enumerate(keys):
+            if files is None:
+                value = other[key]
+            else:
+                value = {name: store.record(ind, key) for name, ind in files.items()}
+            text = json.dumps(value, **dumpArgs).replace("\n", "\n    ")
+            fH.write("," if n else "")
+            fH.write("\n    " + json.dumps(key, ensure_ascii=True) + ":" + text)
+        fH.write("\n}")
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:21:07 2026
+
+PJD 18 Oct 2026     - Written for the scanners' console and log output: verbosity levels
+                      (-v/-q), one rate-limited progress line (files/s, MB/s, errors, ETA)
+                      and a batched JSONL per-file event log at debug level (--eventLog)
+PJD 18 Oct 2026     - Added StageTimer, per-stage totals, histograms and slowest files
+                      written to a run report json and a Prometheus textfile
+PJD 18 Oct 2026     - Added Profiler, sampled cProfile per stage to .pstats and collapsed
+                      flamegraph stacks, tracemalloc growth every N items (--profile)
+
+@author: durack1
+"""
+
+# %% imports
+import atexit
+import bisect
+import collections
+import contextlib
+import cProfile
+import datetime
+import glob
+import heapq
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+
+# %% verbosity, -q 0, default 1, -v 2, -vv 3; set by setLevel, inherited by forked workers
+levelQuiet, levelInfo, levelVerbose, levelDebug = 0, 1, 2, 3
+level = levelInfo
+activeProgress = None  # Progress owning the terminal line, cleared before log output
+
+# %% StageTimer histogram bucket upper bounds (seconds), Prometheus le labels
+stageBuckets = [0.001, 0.01, 0.1, 1, 10, 60, 600]
+
+# %% function defs
+
+
+class EventLog:
+    # per-file events as JSONL, written batchSize at a time; only at levelDebug
+    # with an eventFile, otherwise event() is a no-op
+    def __init__(self, eventFile, batchSize=1000):
+        self.fH = None
+        if eventFile and level >= levelDebug:
+            self.fH = open(eventFile, "w")
+        self.batchSize = batchSize
+        self.lines = []
+
+    def close(self):
+        if self.fH is None:
+            return
+        self.flush()
+        self.fH.close()
+        self.fH = None
+
+    def event(self, **fields):
+        if self.fH is None:
+            return
+        fields["time"] = round(time.time(), 3)
+        self.lines.append(json.dumps(fields, separators=(",", ":")))
+        if len(self.lines) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.fH.write("\n".join(self.lines) + "\n")
+            self.lines = []
+        self.fH.flush()
+
+
+class Progress:
+    # single live progress line on stream, redrawn at most every interval
+    # seconds - a terminal gets \r updates, a log file a line every logInterval
+    # total (files) gives an ETA, files already done (e.g. --resume) via done
+    def __init__(
+        self, label, total=None, done=0, stream=sys.stderr, interval=0.5, logInterval=60
+    ):
+        global activeProgress
+        self.label = label
+        self.total = total
+        self.files = done
+        self.done = done
+        self.bytes = 0
+        self.errors = 0
+        self.stream = stream
+        self.isTty = stream.isatty()
+        self.interval = interval if self.isTty else logInterval
+        self.pid = os.getpid()
+        self.start = time.monotonic()
+        self.lastDraw = self.start
+        self.width = 0
+        if level >= levelInfo:
+            activeProgress = self
+
+    def clear(self):
+        # blank the terminal line before other output
+        if self.isTty and self.width:
+            self.stream.write("\r" + " " * self.width + "\r")
+            self.width = 0
+
+    def close(self):
+        global activeProgress
+        if level >= levelInfo:
+            self.draw()
+            if self.isTty:
+                self.stream.write("\n")
+                self.width = 0
+        if activeProgress is self:
+            activeProgress = None
+
+    def draw(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        rate = (self.files - self.done) / elapsed
+        bits = [
+            self.label,
+            "{:d}".format(self.files),
+            "files" if self.total is None else "/ {:d} files".format(self.total),
+            "{:.1f} files/s".format(rate),
+            "{:.1f} MB/s".format(self.bytes / 1e6 / elapsed),
+            "errors {:d}".format(self.errors),
+        ]
+        if self.total is not None and rate > 0:
+            remaining = max(self.total - self.files, 0) / rate
+            bits.append("ETA " + time.strftime("%H:%M:%S", time.gmtime(remaining)))
+        line = " ".join(bits)
+        if self.isTty:
+            self.stream.write("\r" + line.ljust(self.width))
+            self.width = len(line)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+        self.lastDraw = time.monotonic()
+
+    def update(self, files=1, nbytes=0, errors=0):
+        self.files = self.files + files
+        self.bytes = self.bytes + nbytes
+        self.errors = self.errors + errors
+        if level >= levelInfo and time.monotonic() - self.lastDraw >= self.interval:
+            self.draw()
+
+
+class Profiler:
+    # opt-in cProfile of a sample of files/dirs, one profile per stage and thread;
+    # with profileDir "" every method is a pass-through. sampled keys are picked
+    # by crc32, the same files across runs and workers. close (owner process)
+    # writes {stage}.pstats and {stage}.collapsed (flamegraph.pl/speedscope)
+    # snapshotEvery > 0 appends tracemalloc growth to tracemalloc.txt every
+    # snapshotEvery items of iterate, in the owner process only; close is also
+    # registered with atexit
+    def __init__(self, profileDir, sample=100, snapshotEvery=0, top=15):
+        self.profileDir = profileDir
+        self.sample = max(sample, 1)
+        self.snapshotEvery = snapshotEvery if profileDir else 0
+        self.top = top
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.local = threading.local()  # per thread active flag, no nesting
+        self.profiles = {}  # (stage, pid, thread ident): cProfile.Profile
+        self.items = 0
+        self.lastSnapshot = None
+        if profileDir:
+            os.makedirs(profileDir, exist_ok=True)
+            atexit.register(self.close)
+        if self.snapshotEvery:
+            tracemalloc.start()
+
+    def close(self):
+        if not self.profileDir or os.getpid() != self.pid:
+            return
+        stages = collections.defaultdict(list)
+        for (stage, pid, ident), profile in self.profiles.items():
+            if pid == self.pid:
+                stages[stage].append(profile)
+        partFiles = glob.glob(os.path.join(self.profileDir, "*.part.pstats"))
+        for partFile in partFiles:
+            stage = os.path.basename(partFile).split(".")[0]
+            stages[stage].append(partFile)
+        for stage, sources in sorted(stages.items()):
+            stats = pstats.Stats(*sources)
+            stats.dump_stats(os.path.join(self.profileDir, stage + ".pstats"))
+            lines = collapseStats(stats.stats)
+            collapsedFile = os.path.join(self.profileDir, stage + ".collapsed")
+            writeAtomic(collapsedFile, "".join([line + "\n" for line in lines]))
+            log(levelInfo, "profile:", stage, "->", stage + ".pstats/.collapsed")
+        for partFile in partFiles:
+            os.remove(partFile)
+        if self.snapshotEvery:
+            self.snapshot("close")
+            tracemalloc.stop()
+        self.profileDir = ""
+
+    def iterate(self, stage, iterable, key=str):
+        # yield from iterable, the loop body run for a sampled key(item) is
+        # profiled as stage; every item counts towards the tracemalloc snapshots
+        if not self.profileDir:
+            yield from iterable
+            return
+        for item in iterable:
+            self.items = self.items + 1
+            if self.snapshotEvery and not self.items % self.snapshotEvery:
+                self.snapshot(stage)
+            profile = self.start(stage, key(item))
+            try:
+                yield item
+            finally:
+                self.stop(profile)
+
+    def sampled(self, key):
+        return zlib.crc32(key.encode("utf-8", "replace")) % self.sample == 0
+
+    def snapshot(self, stage):
+        # tracemalloc top growth since the previous snapshot, by line
+        snap = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+            ]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            "# {} {} after {:d} items, traced {:.1f} MB, peak {:.1f} MB".format(
+                datetime.datetime.now().isoformat(timespec="seconds"),
+                stage,
+                self.items,
+                current / 1e6,
+                peak / 1e6,
+            )
+        ]
+        if self.lastSnapshot is None:
+            stats = snap.statistics("lineno")
+        else:
+            stats = snap.compare_to(self.lastSnapshot, "lineno")
+        lines.extend([str(stat) for stat in stats[: self.top]])
+        with open(os.path.join(self.profileDir, "tracemalloc.txt"), "a") as fH:
+            fH.write("\n".join(lines) + "\n\n")
+        self.lastSnapshot = snap
+
+    def start(self, stage, key):
+        # enabled profile for a sampled key, else None
+        if not self.profileDir or getattr(self.local, "active", False):
+            return None
+        if not self.sampled(key):
+            return None
+        profKey = (stage, os.getpid(), threading.get_ident())
+        with self.lock:
+            profile = self.profiles.get(profKey)
+            if profile is None:
+                profile = cProfile.Profile()
+                self.profiles[profKey] = profile
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # python >= 3.12, another thread holds the profiler
+        self.local.active = True
+        profile.stage = stage
+
+        return profile
+
+    def stop(self, profile):
+        if profile is None:
+            return
+        profile.disable()
+        self.local.active = False
+        if os.getpid() != self.pid:
+            # forked worker, the owner merges {stage}.{pid}.part.pstats at close
+            partFile = ".".join([profile.stage, str(os.getpid()), "part.pstats"])
+            profile.dump_stats(os.path.join(self.profileDir, partFile))
+
+    def wrap(self, stage, func):
+        # func(key, ...) profiled as stage for sampled keys (file or dir paths),
+        # in this process, its threads or forked workers
+        if not self.profileDir:
+            return func
+
+        def profiledFunc(key, *args, **kwargs):
+            if os.getpid() != self.pid and tracemalloc.is_tracing():
+                tracemalloc.stop()  # forked worker, growth is tracked in the owner
+            profile = self.start(stage, key)
+            try:
+                return func(key, *args, **kwargs)
+            finally:
+                self.stop(profile)
+
+        return profiledFunc
+
+
+class StageTimer:
+    # per-stage call counts, total/max seconds and stageBuckets histograms, plus
+    # the slowest files by the sum of their stages; add is thread safe
+    def __init__(self, slowest=20):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.slowest = slowest
+        self.files = []  # min-heap of (seconds, seq, filePath, stageTimes)
+        self.seq = itertools.count()  # tie break, stageTimes never compared
+        self.timeBegin = datetime.datetime.now()
+        self.start = time.monotonic()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            rec = self.stages.get(stage)
+            if rec is None:
+                rec = {"count": 0, "seconds": 0.0, "max": 0.0}
+                rec["buckets"] = [0 for _ in range(len(stageBuckets) + 1)]
+                self.stages[stage] = rec
+            rec["count"] = rec["count"] + 1
+            rec["seconds"] = rec["seconds"] + seconds
+            rec["max"] = max(rec["max"], seconds)
+            rec["buckets"][bisect.bisect_left(stageBuckets, seconds)] += 1
+
+    def addFile(self, filePath, stageTimes):
+        # stageTimes {stage: seconds} of one file e.g. scanLib.inspectFile
+        for stage, seconds in stageTimes.items():
+            self.add(stage, seconds)
+        with self.lock:
+            item = (sum(stageTimes.values()), next(self.seq), filePath, stageTimes)
+            if len(self.files) < self.slowest:
+                heapq.heappush(self.files, item)
+            elif item[0] > self.files[0][0]:
+                heapq.heapreplace(self.files, item)
+
+    def iterate(self, stage, iterable):
+        # yield from iterable, each next() timed as stage e.g. scanTree
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def report(self, **extra):
+        # json-ready summary, extra (e.g. counts) is added as is
+        stages = {}
+        for stage, rec in sorted(self.stages.items()):
+            labels = [str(le) for le in stageBuckets] + ["+Inf"]
+            stages[stage] = {
+                "count": rec["count"],
+                "seconds": round(rec["seconds"], 6),
+                "meanSeconds": round(rec["seconds"] / rec["count"], 6),
+                "maxSeconds": round(rec["max"], 6),
+                "histogram": dict(zip(labels, rec["buckets"])),
+            }
+        slowest = [
+            {
+                "filePath": path,
+                "seconds": round(seconds, 6),
+                "stages": {k: round(v, 6) for k, v in stageTimes.items()},
+            }
+            for seconds, seq, path, stageTimes in sorted(self.files, reverse=True)
+        ]
+        report = {
+            "timeBegin": self.timeBegin.isoformat(timespec="seconds"),
+            "timeEnd": datetime.datetime.now().isoformat(timespec="seconds"),
+            "elapsedSeconds": round(time.monotonic() - self.start, 3),
+            "stages": stages,
+            "slowestFiles": slowest,
+        }
+        report.update(extra)
+
+        return report
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        # with timer.stage("checkpoint"): ...
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def timed(self, stage, func):
+        # func(filePath, ...) wrapped to record each call with addFile
+        def timedFunc(filePath, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(filePath, *args, **kwargs)
+            finally:
+                self.addFile(filePath, {stage: time.perf_counter() - start})
+
+        return timedFunc
+
+    def writePrometheus(self, promFile, prefix, labels, gauges={}):
+        # node_exporter textfile collector format, prefix_stage_seconds histogram
+        # and prefix_<gauge> gauges, written whole then renamed into place
+        labelList = ['{}="{}"'.format(k, v) for k, v in sorted(labels.items())]
+        labelStr = ",".join(labelList)
+        name = prefix + "_stage_seconds"
+        lines = [
+            "# HELP " + name + " Seconds per scanner stage call",
+            "# TYPE " + name + " histogram",
+        ]
+        for stage, rec in sorted(self.stages.items()):
+            stageLabels = ",".join(labelList + ['stage="' + stage + '"'])
+            cumulative = 0
+            for le, count in zip(stageBuckets + ["+Inf"], rec["buckets"]):
+                cumulative = cumulative + count
+                lines.append(
+                    '{}_bucket{{{},le="{}"}} {}'.format(
+                        name, stageLabels, le, cumulative
+                    )
+                )
+            lines.append("{}_sum{{{}}} {}".format(name, stageLabels, rec["seconds"]))
+            lines.append("{}_count{{{}}} {}".format(name, stageLabels, rec["count"]))
+        gauges = dict(gauges)
+        gauges["elapsed_seconds"] = round(time.monotonic() - self.start, 3)
+        for gauge, value in sorted(gauges.items()):
+            lines.append("# TYPE {}_{} gauge".format(prefix, gauge))
+            lines.append("{}_{}{{{}}} {}".format(prefix, gauge, labelStr, value))
+        writeAtomic(promFile, "\n".join(lines) + "\n")
+
+    def writeReport(self, reportFile, **extra):
+        writeAtomic(reportFile, json.dumps(self.report(**extra), indent=4) + "\n")
+
+
+def addArguments(parser, eventFile=None):
+    # -v/-q/--eventLog, shared by the scanners
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="More output: -v per directory and per problem file, -vv every file"
+        " and the --eventLog",
+        action="count",
+        default=0,
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        help="No progress line or summary",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--eventLog",
+        help="JSONL per-file event log, written at -vv only",
+        default=eventFile,
+    )
+
+
+def addProfileArguments(parser):
+    # --profile/--profileSample/--tracemalloc, the Profiler options
+    parser.add_argument(
+        "--profile",
+        help="Directory for cProfile .pstats and collapsed flamegraph stacks per"
+        " stage, of a sample of files or directories",
+        default="",
+    )
+    parser.add_argument(
+        "--profileSample",
+        help="Profile 1 in N files or directories (chosen by path)",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        help="With --profile, log tracemalloc memory growth every N files",
+        type=int,
+        default=0,
+    )
+
+
+def addReportArguments(parser, reportFile):
+    # --report/--prometheus, the StageTimer outputs
+    parser.add_argument(
+        "--report",
+        help="Run report json: per-stage timings, histograms and slowest files;"
+        " '' disables",
+        default=reportFile,
+    )
+    parser.add_argument(
+        "--prometheus",
+        help="Also write the stage timings as a Prometheus textfile (.prom)",
+        default="",
+    )
+
+
+def collapseStats(stats, maxDepth=64):
+    # pstats.Stats.stats -> folded stacks "a;b;c microseconds"; cProfile keeps
+    # caller/callee edges only, a callee's time is split over its callers in
+    # proportion (as flameprof does), recursive calls are not expanded
+    callees = collections.defaultdict(list)
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    roots = [func for func, rec in stats.items() if not rec[4]]
+    minSeconds = sum([stats[func][3] for func in roots]) * 1e-5
+    folded = collections.Counter()
+
+    def walk(func, path, seconds):
+        tt, ct = stats[func][2], stats[func][3]
+        path = path + [func]
+        scale = seconds / ct if ct else 0.0
+        folded[";".join([funcLabel(f) for f in path])] += tt * scale
+        if len(path) >= maxDepth:
+            return
+        for callee, edgeSeconds in callees[func]:
+            if callee not in path and edgeSeconds * scale > minSeconds:
+                walk(callee, path, edgeSeconds * scale)
+
+    for func in roots:
+        walk(func, [], stats[func][3])
+    lines = []
+    for stack, seconds in sorted(folded.items()):
+        if round(seconds * 1e6) > 0:
+            lines.append("{} {:d}".format(stack, round(seconds * 1e6)))
+
+    return lines
+
+
+def funcLabel(func):
+    # pstats (file, line, name) key as a flamegraph frame
+    fileName, line, name = func
+    if fileName == "~":
+        return name.replace(";", ",")  # built-in
+
+    return "{} ({}:{:d})".format(name, os.path.basename(fileName), line)
+
+
+def lapTime(stageTimes, stage, start):
+    # add the seconds since start (time.perf_counter) to stageTimes[stage],
+    # returns the new start
+    now = time.perf_counter()
+    stageTimes[stage] = stageTimes.get(stage, 0.0) + now - start
+
+    return now
+
+
+def log(msgLevel, *args):
+    # print args when the verbosity is at least msgLevel
+    if level < msgLevel:
+        return
+    if activeProgress is not None and activeProgress.pid == os.getpid():
+        activeProgress.clear()
+    print(*args)
+
+
+def setLevel(args):
+    # verbosity from addArguments options
+    global level
+    if args["quiet"]:
+        level = levelQuiet
+    else:
+        level = min(levelInfo + args["verbose"], levelDebug)
+
+    return level
+
+
+def writeAtomic(outFile, text):
+    # write a temporary file and rename it over outFile, readers never see a
+    # partial file
+    tmpFile = ".".join([outFile, "tmp"])
+    with open(tmpFile, "w") as fH:
+        fH.write(text)
+    os.replace(tmpFile, outFile)
@@ -27,6 +27,42 @@ PJD 22 Aug 2024     - Added dirCount logic
 PJD 22 Aug 2024     - Updated dirCount logic 1000 -> 10000 to reduce output file counts
 PJD 22 Aug 2024     - Added dirCount update to live file, not just strCounter increment
 PJD 17 Sep 2024     - Added gc.collect() calls to attempt to alleviate memory bloat
+PJD 18 Oct 2026     - Replaced os.walk with threaded scanTree (CMIP3Lib); reuse DirEntry stats
+PJD 18 Oct 2026     - Moved per-file work to scanLib.inspectFile; added --workers process pool
+PJD 18 Oct 2026     - Added --incremental, reuse unchanged records (size, mtime, inode) from a
+                      previous catalogue; records gain fileModTimeNs and fileInode
+PJD 18 Oct 2026     - Added --checkpoint/--resume, durable checkpoints of walker position,
+                      counters and cm every N directories
+PJD 18 Oct 2026     - Replaced per-directory json.dump and strCounter/dirCount chunks with
+                      an append-only CatalogueWriter {era}.jsonl; --finalize writes the
+                      nested json
+PJD 18 Oct 2026     - Added --hashCache, unchanged files take sha256 from the shared cache
+PJD 18 Oct 2026     - Report dateLib attribute cache hits/misses summed over workers
+PJD 18 Oct 2026     - Clone results for byte-identical files (sha256) from this run or
+                      --incremental catalogues, cached hashes skip the file open
+PJD 18 Oct 2026     - Moved the bad dict to badRules.json fix rules (--rules), no exec
+PJD 18 Oct 2026     - Added --timeout, --maxMemory (SandboxPool workers) and --quarantine;
+                      !fileReadError entries are [filePath, reason]
+PJD 18 Oct 2026     - Per-file prints -> runLib levels (-v/-q), progress line and --eventLog
+PJD 18 Oct 2026     - Added StageTimer per-stage timings, --report json and --prometheus
+PJD 18 Oct 2026     - Added --profile (sampled inspect/record cProfile) and --tracemalloc
+PJD 18 Oct 2026     - Added --paths and --outDir, e.g. a makeTestArchive.py tree for benchScan.py
+PJD 18 Oct 2026     - Previous records held in a compact recordLib.RecordStore; --finalize
+                      streams the nested json from one (writeCatalogue)
+PJD 18 Oct 2026     - Added --leaseDir multi-node scans: workers claim leaseLib work units
+                      (--unitDepth, --leaseSeconds) writing one shard each, --merge joins them
+PJD 18 Oct 2026     - Work units costed (--planCost stat pre-pass or previous catalogue) and
+                      claimed largest first, oversized ones split (--maxUnitMB)
+PJD 18 Oct 2026     - --incremental skips old-schema records (no sha256 or stamps)
+PJD 18 Oct 2026     - !noDateFile/!fileReadError entries stamped and reused like records;
+                      skipFile rule files are badFile without a job
+PJD 18 Oct 2026     - --incremental, --rules and --hashCache resolved before the chdir
+PJD 18 Oct 2026     - Progress total and --resume done count non-*.nc files as the line does
+PJD 18 Oct 2026     - Hash cache opened in dirJobs, after the --workers pool forks
+PJD 18 Oct 2026     - --leaseDir workers count completed and lost work units
+PJD 18 Oct 2026     - Archive paths normalized, no trailing / on catalogue roots
+PJD 18 Oct 2026     - Checkpoints hold the clone and date cache counters, --resume rebuilds
+                      the clone state from the catalogue so far
                     TODO: add time start/stop to fileNames that exclude them
                     TODO: table mappings O1 = Omon?, O1e?
 
@@ -34,19 +70,58 @@ PJD 17 Sep 2024     - Added gc.collect() calls to attempt to alleviate memory bl
 """
 
 import argparse
-import datetime
-import gc
-import hashlib
-import json
 import os
-import re
-import xarray as xr
-from xcdat import open_dataset
+import sys
+import time
+
+from CMIP3Lib import (
+    CatalogueWriter,
+    getCachedHashes,
+    getRule,
+    hashCacheFile,
+    loadRules,
+    openHashCache,
+    putCachedHashes,
+    ruleFile,
+    scanTree,
+)
+from scanLib import (
+    cloneResult,
+    fileStamp,
+    inspectFile,
+    mapDirs,
+    matchRecord,
+    readCheckpoint,
+    recordResult,
+    rememberResult,
+    stampedResults,
+    writeCheckpoint,
+)
+from leaseLib import (
+    WorkLeases,
+    catalogueCosts,
+    mergeShards,
+    statCosts,
+    walkUnit,
+)
+from recordLib import RecordStore, loadRecords, writeCatalogue
+from runLib import (
+    EventLog,
+    Profiler,
+    Progress,
+    StageTimer,
+    addArguments,
+    addProfileArguments,
+    addReportArguments,
+    levelDebug,
+    levelInfo,
+    levelVerbose,
+    log,
+    setLevel,
+)
 
 # import pdb
 # import shutil
-# import sys
-# import time
 
 # %% assign which CMIP phase you are targeting - set years and paths
 cmDict = {}
@@ -83,12 +158,164 @@ parser.add_argument(
     required=True,
     choices=["3", "5", "6"],
 )
+parser.add_argument(
+    "--paths",
+    help="Directories to scan, default the era's archive paths",
+    nargs="+",
+    default=None,
+)
+parser.add_argument(
+    "--outDir",
+    help="Directory the catalogue, checkpoint and reports are written to",
+    default="/home/durack1/git/CMIP3_CVs/src",
+)
+parser.add_argument(
+    "--threads",
+    help="Number of threads listing directories",
+    type=int,
+    default=16,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    help="Number of processes inspecting files, 0 runs inline",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--incremental",
+    help="Previous catalogue json/jsonl file(s), unchanged files are copied not reread",
+    nargs="+",
+    default=[],
+)
+parser.add_argument(
+    "--checkpoint",
+    help="Directories between checkpoints, 0 disables",
+    type=int,
+    default=100,
+)
+parser.add_argument(
+    "--resume",
+    help="Continue from the last checkpoint",
+    action="store_true",
+)
+parser.add_argument(
+    "--finalize",
+    help="Write the nested yymmdd_{era}.json catalogue once the scan completes",
+    action="store_true",
+)
+parser.add_argument(
+    "--hashCache",
+    help="SQLite sha256 cache shared by the scanners, '' disables",
+    default=hashCacheFile,
+)
+parser.add_argument(
+    "--timeout",
+    help="Seconds a worker may spend on one file, 0 disables (implies -w 1)",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--maxMemory",
+    help="Worker address space cap in MB, 0 disables (implies -w 1)",
+    type=int,
+    default=0,
+)
+parser.add_argument(
+    "--quarantine",
+    help="json list of files that hung or crashed a worker, skipped while unchanged;"
+    " default {era}_quarantine.json, '' disables",
+    default=None,
+)
+parser.add_argument(
+    "--rules",
+    help="json fix rules for files that fail to open, see badRules.json",
+    default=ruleFile,
+)
+parser.add_argument(
+    "--leaseDir",
+    help="Shared directory of work unit leases and shards for a multi-node scan, each"
+    " worker given it scans units until none are left",
+    default=None,
+)
+parser.add_argument(
+    "--merge",
+    help="With --leaseDir, wait for the workers then merge the shards into {era}.jsonl",
+    action="store_true",
+)
+parser.add_argument(
+    "--unitDepth",
+    help="Directory depth below each path of a --leaseDir work unit",
+    type=int,
+    default=4,
+)
+parser.add_argument(
+    "--planCost",
+    help="Cost of --leaseDir work units from a stat pre-pass or the --incremental"
+    " catalogue(s), default catalogue with --incremental else stat",
+    choices=["stat", "catalogue", "none"],
+    default=None,
+)
+parser.add_argument(
+    "--maxUnitMB",
+    help="Cost above which a --leaseDir work unit is divided or its directory split"
+    " into file batches, 0 is the planned total / 256",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--leaseSeconds",
+    help="Seconds a work unit lease lasts unrenewed before another worker re-claims it",
+    type=float,
+    default=600,
+)
+parser.add_argument(
+    "--workerId",
+    help="Name of this --leaseDir worker, default host.pid",
+    default=None,
+)
+addArguments(parser)
+addReportArguments(parser, None)
+addProfileArguments(parser)
 args = vars(parser.parse_args())
+setLevel(args)
 era = "".join(["CMIP", args["era"]])
+runName = era
+leases = None  # --leaseDir work units
+if args["leaseDir"]:
+    if args["resume"]:
+        parser.error("--resume does not apply to --leaseDir, units are re-claimed")
+    if args["finalize"] and not args["merge"]:
+        parser.error("--finalize with --leaseDir needs --merge")
+    leases = WorkLeases(
+        os.path.abspath(args["leaseDir"]), args["workerId"], args["leaseSeconds"]
+    )
+    args["checkpoint"] = 0  # a unit is the restart granularity
+    if not args["merge"]:
+        runName = "_".join([era, leases.workerId])  # workers may share --outDir
+elif args["merge"]:
+    parser.error("--merge needs --leaseDir")
+if args["planCost"] is None:
+    args["planCost"] = "catalogue" if args["incremental"] else "stat"
+if (args["timeout"] or args["maxMemory"]) and not args["workers"]:
+    args["workers"] = 1  # limits apply to worker processes only
+if args["quarantine"] is None:
+    args["quarantine"] = "_".join([runName, "quarantine.json"])
+if args["eventLog"] is None:
+    args["eventLog"] = "_".join([runName, "events.jsonl"])
+if args["report"] is None:
+    args["report"] = "_".join([runName, "report.json"])
 startYr = cmDict[era]["startYr"]
 endYr = cmDict[era]["endYr"]
-paths = cmDict[era]["paths"]
-print(era, startYr, endYr)
+paths = [os.path.normpath(path) for path in cmDict[era]["paths"]]  # CMIP6/ etc
+if args["paths"]:
+    paths = [os.path.abspath(path) for path in args["paths"]]  # before the chdir
+# input files resolve against the caller's directory, outputs against --outDir
+args["incremental"] = [os.path.abspath(catFile) for catFile in args["incremental"]]
+args["rules"] = os.path.abspath(args["rules"])
+if args["hashCache"]:
+    args["hashCache"] = os.path.abspath(args["hashCache"])
+log(levelInfo, era, startYr, endYr)
 
 # %% function defs
 
@@ -131,34 +358,11 @@ def copyStuff(root, dirs, destDir, vers):
 """
 
 
-def checkDate(dateStr, startYr, endYr):
-    # assume 2022-10-05 format
-    y, m, d = dateStr.split("-")
-    if not startYr <= int(y) <= endYr:
-        print("year invalid:", y)
-        return None
-    if not 1 <= int(m) <= 12:
-        print("month invalid:", m)
-        return None
-    if not 1 <= int(d) <= 31:
-        print("day invalid:", d)
-        return None
-
-    return dateStr
-
-
-def fixFunc(fixStr, fixStrInfo):
-    def fix(ds):
-        print(fixStrInfo)
-        exec(fixStr)  # ds.time.encoding["units"] = "days since 2001-1-1"
-
-        return ds
-
-    return fix
-
-
-def getFileSize(filePath):
-    if os.path.isfile(filePath):
+def getFileSize(filePath, entry=None):
+    # entry is an os.DirEntry from scanTree, reuse its cached stat
+    if entry is not None and entry.is_file():
+        fileSizeBytes = entry.stat().st_size
+    elif os.path.isfile(filePath):
         fileStats = os.stat(filePath)
         fileSizeBytes = fileStats.st_size
     else:
@@ -168,35 +372,6 @@ def getFileSize(filePath):
     return fileSizeBytes
 
 
-def getSha256(filePath, print=False):
-    with open(filePath, "rb") as f:
-        bytes = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest()
-        if print:
-            print(readable_hash)
-
-    return readable_hash
-
-
-def getTimes(time, startYr, endYr):
-    y = int(time.dt.year.data)
-    m = int(time.dt.month.data)
-    d = int(time.dt.day.data)
-    dateStr = makeDate(y, m, d, startYr, endYr, check=False)
-
-    return dateStr
-
-
-def makeDate(year, month, day, startYr, endYr, check):
-    date = "-".join([str(year), str(month), str(day)])
-    # print("makeDate: date =", date)
-    # pdb.set_trace()
-    if check:
-        date = checkDate(date, startYr, endYr)
-
-    return date
-
-
 def makeDRS(filePath, date):
     # source = cmip3/ipcc/data10/picntrl/ocn/mo/thetao/iap_fgoals1_0_g/run2/{files}.nc
     # target = CMIP3/DAMIP/NCAR/CCSM4/historicalMisc/r2i1p11/Omon/vo/gu/v20121128
@@ -287,411 +462,477 @@ def openData(filePath, fileName, ...):
 
 # %% deal with paths
 # "/p/user_pub/climate_work/durack1/tmp/"
-os.chdir("/home/durack1/git/CMIP3_CVs/src")
+os.chdir(args["outDir"])
 destDir = "CMIP3"  # "/a/"
 # if os.path.exists(destDir):
 #    shutil.rmtree(destDir)
 # os.makedirs(destDir)
 
-# %% create lookup lists
-attList = [
-    "cmor_version",
-    "creation_date",  # CMIP6 NCAR CESM2
-    "comment",
-    "contact",
-    "date",
-    "experiment_id",
-    "forcing",
-    "history",
-    "institution",
-    "realization",
-    "source",
-]
-# "creation_date","license","tracking_id", "table_id"
-monList = [
-    "Jan",
-    "Feb",
-    "Mar",
-    "Apr",
-    "May",
-    "Jun",
-    "Jul",
-    "Aug",
-    "Sep",
-    "Oct",
-    "Nov",
-    "Dec",
-]
+# %% load fix rules, files that fail to open as-is (was the bad dict)
+rules = loadRules(args["rules"])
+log(levelInfo, "fix rules:", sum([len(dirRules) for dirRules in rules.values()]))
+# "/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1": ["rlus_A2_a42_0108-0147.nc", "bad time dimension values", "", []],
+# /p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/mo/rsut/mpi_echam5/run1/rsut_CF1.nc
 
 # %% create exclude dirs
-bad = {
-    "/p/css03/esgf_publish/cmip3/ipcc/data3/sresa2/ice/mo/sic/ingv_echam4/run1": [
-        "",
-        "fix bad time:units 20O1-1-1",
-        "ds.time.attrs['units'] = 'days since 2001-01-01'",
-        [],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data3/sresa2/ice/mo/sit/ingv_echam4/run1": [
-        "",
-        "fix bad time:units 20O1-1-1",
-        "ds.time.attrs['units'] = 'days since 2001-01-01'",
-        [],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data8/picntrl/ocn/mo/rhopoto/ncar_ccsm3_0/run2": [
-        "rhopoto_O1.PIcntrl_2.CCSM.ocnm.0585-01_cat_0589-12.nc",
-        "drop bad time_bnds",
-        "",
-        ["time_bnds"],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data16/sresa1b/atm/mo/rlds/mpi_echam5/run2": [
-        "rlds_A1.nc",
-        "drop bad time_bnds",
-        "",
-        ["time_bnds"],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/da/pr/ukmo_hadsm4/run1": [
-        "pr_CF3.nc",
-        "bad time dimension",
-        "",
-        [],
-    ],
-    # "/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1": ["rlus_A2_a42_0108-0147.nc", "bad time dimension values", "", []],
-    # /p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/mo/rsut/mpi_echam5/run1/rsut_CF1.nc
-}
 excludeDirs = set(["summer", "cam3.3", "T4031qt"])
 excludeDirs2 = set(["ipcc"])
 # 004306 filePath: /p/css03/esgf_publish/cmip3/ipcc/summer/T4031qtC.pop.h.0019-08-21-43200.nc
 
+# %% load previous catalogue(s)
+prevIndex = RecordStore()  # {filePath: record} of the previous scan(s)
+prevOther = {}  # {filePath: stamped result} of their !noDateFile/!fileReadError
+expectedCount = None  # entries of the previous scan, for the progress ETA
+for catFile in args["incremental"]:
+    log(levelInfo, "loading:", catFile)
+    prevIndex, other = loadRecords(catFile, prevIndex)
+    # !_fileCount is *.nc only, the progress line counts every file e.g. *.nc.bad
+    otherFiles = [
+        path
+        for path in other.get("!badFile", {}).values()
+        if isinstance(path, str) and path[-3:] != ".nc"
+    ]
+    entryCount = other.get("!_fileCount", 0) + len(otherFiles)
+    expectedCount = max(expectedCount or 0, entryCount) or None
+    prevOther.update(stampedResults(other))
+    del other
+log(levelInfo, "previous records:", len(prevIndex))
+for rec in prevIndex.values():
+    result = recordResult(rec)
+    if result is not None:
+        rememberResult(result)
+
+# %% --leaseDir, plan the work units (one process, costed), --merge joins the shards
+if leases is not None:
+    costs = {
+        "catalogue": lambda: catalogueCosts(prevIndex),
+        "none": None,
+        "stat": lambda: statCosts(paths, excludeDirs, excludeDirs2, args["threads"]),
+    }[args["planCost"]]
+    try:
+        leases.plan(
+            paths,
+            args["unitDepth"],
+            excludeDirs,
+            excludeDirs2,
+            costs,
+            int(args["maxUnitMB"] * 1e6),
+        )
+    except ValueError as err:
+        parser.error(str(err))
+    if args["merge"]:
+        catFile = ".".join([era, "jsonl"])
+        leases.wait()
+        counts, failed = mergeShards(leases, catFile)
+        log(levelInfo, "catalogue:", catFile, "files:", counts["!_fileCount"])
+        if failed:
+            log(levelInfo, "failed work units:", len(failed))
+        if args["finalize"]:
+            writeCatalogue(*loadRecords(catFile), era)
+        sys.exit(1 if failed else 0)
+
 # %% iterate over files
-cm = {}
-cm["!badFile"] = {}
-cm["!noDateFile"] = {}
-cm["!fileReadError"] = {}
 (
     badFileCount,
+    cloneCount,
     cmorCount,
     count,
+    dateCacheHits,
+    dateCacheMisses,
     dirCount,
     fileReadErrorCount,
     noDateFileCount,
-    strCounter,
-) = [0 for _ in range(7)]
-for cmPath in paths:
-    # for cmPath in ["/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1"]:  # bug hunting
-    # for cmPath in list(bad.keys()):
-    for root, dirs, files in os.walk(cmPath):
-        print("root:", root)
-        # Add dirs to exclude;
-        [dirs.remove(d) for d in list(dirs) if d in excludeDirs]
-        if root.split("/")[-1] == "ipcc":
-            [dirs.remove(d) for d in list(dirs) if d in excludeDirs2]  # catch ipcc/ipcc
-        if root in list(bad.keys()):
-            # Weed out bad paths/files
-            # print("in here!")
-            # pdb.set_trace()
-            badFile = bad[root][0]
-            fixStrInfo = bad[root][1]
-            fixStr = bad[root][2]
-            if bad[root][3] != []:
-                badVars = bad[root][3][0]
-            else:
-                badVars = None
-        else:
-            badFile, fixStrInfo, fixStr, badVars = [None for _ in range(4)]
-            # continue
-        if files:
-            # print("files:", files)
-            files.sort()  # sort to process sequentially
-            for c1, fileName in enumerate(files):
-                filePath = os.path.join(root, fileName)
-                print("{:06d}".format(count), "filePath:", filePath)
-                # get sha256
-                sha256 = getSha256(filePath)
-                # get fileSizeBytes
-                fileSizeBytes = getFileSize(filePath)
-                if filePath[-3:] != ".nc":  # deal with *.nc.bad files
-                    badFileCount = badFileCount + 1
-                    print("no date; filePath:", filePath)
-                    cm["!badFileCount"] = badFileCount
-                    cm["!badFile"][badFileCount] = filePath
-                elif filePath[-3:] == ".nc":  # process all "good" files
-                    if c1 == 0:
-                        cm[root] = {}  # create dir entry for each file
-                    elif root not in cm.keys():
-                        # create dir entry for each file, if first file bad
-                        cm[root] = {}
-                    cmorVersion, dateFound = [
-                        False for _ in range(2)
-                    ]  # set for each file
-                    count = count + 1  # file counter
-                    # open and deal with file issues
-                    # pdb.set_trace()
-                    try:
-                        # wrap so bombs are caught in except
-                        if fixStr == None and badVars == None and badFile == None:
-                            fh = open_dataset(filePath, use_cftime=True)
-                        # Case bad root match, but not file
-                        elif fixStrInfo and (badFile != fileName and not badFile == ""):
-                            fh = open_dataset(filePath, use_cftime=True)
-                        # Case bad root match, AND file
-                        elif badVars and (fileName == badFile):  # badVars only
-                            print("badVars:", badVars)
-                            fh = xr.open_dataset(
-                                filePath, drop_variables=[badVars]
-                            ).pipe(xr.decode_cf)
-                        elif badFile == "":  # fixFunc for all files only - 9863
-                            print("badFile == ''")
-                            fh = (
-                                xr.open_dataset(filePath, decode_times=False)
-                                .pipe(fixFunc(fixStr, fixStrInfo))
-                                .pipe(xr.decode_cf)
-                            )
-                        # is there a need for fixFunc AND badVars?
-                        elif badVars == [] and (fileName == badFile):
-                            # print("elif3")
-                            # pdb.set_trace()
-                            badFileCount = badFileCount + 1
-                            print("badFile; filePath:", filePath)
-                            cm["!badFileCount"] = badFileCount
-                            cm["!badFile"][badFileCount] = filePath
-                            continue
-                    except:
-                        print("except")
-                        # pdb.set_trace()
-                        fileReadErrorCount = fileReadErrorCount + 1
-                        print("fileReadError; filePath:", filePath)
-                        cm["!fileReadErrorCount"] = fileReadErrorCount
-                        cm["!fileReadError"][fileReadErrorCount] = filePath
+    reuseCount,
+) = [0 for _ in range(10)]
+catFile = ".".join([era, "jsonl"])
+if leases is not None:
+    catFile = leases.path("shards")  # one shard per work unit instead
+checkFile = "_".join([era, "checkpoint.json"])
+checkNames = [
+    "badFileCount",
+    "cloneCount",
+    "cmorCount",
+    "count",
+    "dateCacheHits",
+    "dateCacheMisses",
+    "dirCount",
+    "fileReadErrorCount",
+    "noDateFileCount",
+    "reuseCount",
+]
+lastCounts = {}
+unitCount, lostUnitCount = 0, 0  # --leaseDir work units completed, lost
+# filePath -> reason and stamp of files that hung or crashed a worker
+quarantine = {}
+if args["quarantine"] and os.path.exists(args["quarantine"]):
+    quarantine = readCheckpoint(args["quarantine"])
+    log(levelInfo, "quarantined files:", len(quarantine))
+db = None  # opened by dirJobs, see there
+resumePathInd, resumeRoot = 0, None
+progressCount = 0  # files done before the checkpoint, non-*.nc included
+if args["resume"]:
+    if not os.path.exists(checkFile):
+        parser.error(" ".join(["no checkpoint", checkFile, "to resume from"]))
+    state = readCheckpoint(checkFile)
+    (
+        badFileCount,
+        cloneCount,
+        cmorCount,
+        count,
+        dateCacheHits,
+        dateCacheMisses,
+        dirCount,
+        fileReadErrorCount,
+        noDateFileCount,
+        reuseCount,
+    ) = [state["counts"].get(name, 0) for name in checkNames]
+    lastCounts = state["catalogueCounts"]
+    progressCount = state.get("progressCount", count)
+    resumePathInd, resumeRoot = state["pathIndex"], state["root"]
+    log(
+        levelInfo, "resuming after:", resumeRoot, "dirCount:", dirCount, "count:", count
+    )
+    writer = CatalogueWriter(catFile, offset=state["catalogueOffset"])
+    # clone state (shaResults) of the files catalogued before the checkpoint, as an
+    # uninterrupted scan holds it; the dateLib cache restarts empty, so the date
+    # cache hit/miss split can differ from an uninterrupted scan's
+    done, doneOther = loadRecords(catFile)
+    resumed = [(filePath, recordResult(rec)) for filePath, rec in done.items()]
+    for filePath, stamped in stampedResults(doneOther).items():
+        resumed.append((filePath, stamped["result"]))
+    for filePath, result in resumed:
+        root, sep, fileName = filePath.rpartition("/")
+        if result is not None and getRule(rules, root, fileName) is None:
+            rememberResult(result)
+    del done, doneOther, resumed
+elif leases is not None:
+    writer = None  # opened as each work unit starts
+else:
+    writer = CatalogueWriter(catFile)
+    writer.set(["!badFile"], {})
+    writer.set(["!noDateFile"], {})
+    writer.set(["!fileReadError"], {})
+
+
+def pathWalks():
+    # (pathInd, scanTree walk) per path, or (unit id, walk) per claimed work unit
+    if leases is not None:
+        for unit in leases.claimUnits():
+            yield unit["id"], walkUnit(unit, excludeDirs, excludeDirs2, args["threads"])
+        return
+    for pathInd, cmPath in enumerate(paths):
+        # for cmPath in ["/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1"]:  # bug hunting
+        # for cmPath in list(rules.keys()):
+        if pathInd < resumePathInd:
+            continue  # completed before the checkpoint
+        # excludeDirs/excludeDirs2 (ipcc/ipcc) are pruned by scanTree
+        walk = scanTree(
+            [cmPath],
+            excludeDirs,
+            excludeDirs2,
+            threads=args["threads"],
+            resumeAfter=resumeRoot if pathInd == resumePathInd else None,
+        )
+        yield pathInd, walk
+
+
+def dirJobs():
+    # walk paths, queue one inspectFile job per *.nc file
+    # the hash cache opens here, after mapDirs has started its --workers pool, so
+    # no worker holds a sqlite connection
+    global db
+    db = openHashCache(args["hashCache"])
+    for pathInd, walk in pathWalks():
+        for root, dirs, files in timer.iterate("walk", walk):
+            log(levelVerbose, "root:", root)
+            inspect = []
+            for entry in files:
+                if entry.path[-3:] != ".nc":
+                    inspect.append(False)
+                elif matchRecord(prevOther.get(entry.path), fileStamp(entry)):
+                    inspect.append(False)  # unchanged, no date or read error
+                elif matchRecord(prevIndex.get(entry.path), fileStamp(entry)):
+                    inspect.append(False)  # unchanged, record copied from prevIndex
+                else:
+                    inspect.append(True)
+            # one hash cache lookup per directory, hits skip the full read
+            with timer.stage("hashCacheRead"):
+                cached = getCachedHashes(
+                    db, [entry for entry, flag in zip(files, inspect) if flag]
+                )
+            jobs, known = [], {}  # known, results decided without a job
+            for entry, flag in zip(files, inspect):
+                if not flag:
+                    jobs.append(None)
+                    continue
+                if matchRecord(quarantine.get(entry.path), fileStamp(entry)):
+                    reason = quarantine[entry.path]["reason"]
+                    known[entry.path] = {"status": "fileReadError", "reason": reason}
+                    jobs.append(None)
+                    continue
+                sha256 = cached.get(entry.path)
+                rule = getRule(rules, root, entry.name)  # Weed out bad paths/files
+                if rule is not None and rule["skip"]:
+                    # skipFile rule, nothing to open or hash
+                    known[entry.path] = {"status": "badFile"}
+                    jobs.append(None)
+                    continue
+                if sha256 is not None and rule is None:
+                    result = cloneResult(sha256)
+                    if result is not None:
+                        # identical content inspected already, no job
+                        known[entry.path] = result
+                        jobs.append(None)
                         continue
-                    if "T" in fh.cf.axes:
-                        startTime = getTimes(fh.time[0], startYr, endYr)
-                        endTime = getTimes(fh.time[-1], startYr, endYr)
+                jobs.append((entry.path, entry.name, rule, era, startYr, endYr, sha256))
+            yield (pathInd, root, files, cached, known), jobs
+        if leases is not None:
+            # barrier, the unit is complete once its directories are recorded
+            yield (pathInd, None, [], {}, {}), None
+
+
+progress = Progress("scan", total=expectedCount, done=progressCount)
+timer = StageTimer()  # per-stage seconds, --report/--prometheus
+# before mapDirs, forked workers inherit the profiler
+profiler = Profiler(args["profile"], args["profileSample"], args["tracemalloc"])
+events = EventLog(args["eventLog"])
+dirResults = mapDirs(
+    profiler.wrap("inspect", inspectFile),
+    dirJobs(),
+    workers=args["workers"],
+    timeout=args["timeout"],
+    maxMemory=args["maxMemory"] * 1048576,
+)
+# mapDirs wait includes the walk and, serially, inspectFile itself
+for (pathInd, root, files, cached, known), results in timer.iterate(
+    "mapDirs", dirResults
+):
+    if leases is not None and writer is None:
+        # a work unit starts, counters carry on and the merge subtracts shardBase
+        shardFile, shardBase = leases.shardFile(pathInd), lastCounts
+        writer = CatalogueWriter(shardFile)
+    if results is None:
+        writer.sync()
+        writer.close()
+        writer = None
+        if leases.complete(pathInd, shardFile, shardBase, lastCounts):
+            unitCount = unitCount + 1
+        else:
+            lostUnitCount = lostUnitCount + 1  # another worker's shard is merged
+        continue
+    if files:
+        recordStart = time.perf_counter()
+        # print("files:", files)
+        # scanTree returns files sorted, to process sequentially
+        dirEntry = False  # cm[root] written
+        newHashes = []
+        fileResults = profiler.iterate(
+            "record", zip(files, results), key=lambda item: item[0].path
+        )
+        for c1, (entry, result) in enumerate(fileResults):
+            fileName = entry.name
+            filePath = entry.path
+            log(levelDebug, "{:06d}".format(count), "filePath:", filePath)
+            # get fileSizeBytes
+            fileSizeBytes = getFileSize(filePath, entry)
+            if filePath[-3:] != ".nc":  # deal with *.nc.bad files
+                badFileCount = badFileCount + 1
+                log(levelVerbose, "no date; filePath:", filePath)
+                writer.set(["!badFile", badFileCount], filePath)
+                progress.update(1, fileSizeBytes, 1)
+                events.event(path=filePath, size=fileSizeBytes, status="badFile")
+            elif filePath[-3:] == ".nc":  # process all "good" files
+                if not dirEntry:
+                    # create dir entry for each file, if first file bad
+                    writer.set([root], {})
+                    dirEntry = True
+                count = count + 1  # file counter
+                # sha256, open, times and dates from inspectFile (scanLib)
+                source = "inspect"
+                if filePath in known:
+                    result = known[filePath]
+                    source = "known"
+                elif result is None:
+                    if matchRecord(prevOther.get(filePath), fileStamp(entry)):
+                        result = prevOther[filePath]["result"]
                     else:
-                        startTime, endTime = [None for _ in range(2)]
-                    attDict = fh.attrs
-                    for att in attList:
-                        if not att in attDict.keys():
-                            # print(att, "not in file, skipping..")
-                            continue
-                        if isinstance(attDict[att], str):
-                            print("att:", att)
-                            attStr = attDict[att]
-                            # print("attStr:", attStr)
-                            # BCCR_BCM2_0 format
-                            if att == "date":
-                                date = attStr
-                                date = date.split("-")
-                                day = date[0]
-                                mon = "{:02d}".format(monList.index(date[1]) + 1)
-                                yr = date[-1]
-                                date = makeDate(
-                                    yr, mon, day, startYr, endYr, check=True
-                                )
-                                dateFound = True
-                                dateFoundAtt = att
-                            # Deal with CMOR matches
-                            if "CMOR rewrote data to comply" in attStr:
-                                if era == "CMIP3":  # CMOR1
-                                    # assuming mm/dd/yyyy e.g. At 20:53:22 on 06/28/2005, CMOR rewrote data to comply with CF standards and IPCC Fourth Assessment requirements
-                                    attStrInd = attStr.index(" At ")
-                                    attStr = attStr[attStrInd:]
-                                    date = re.findall(
-                                        r"\d{1,2}/\d{1,2}/\d{2,4}", attStr
-                                    )
-                                    date = date[0].split("/")
-                                    date = makeDate(
-                                        date[-1],
-                                        date[0],
-                                        date[1],
-                                        startYr,
-                                        endYr,
-                                        check=True,
-                                    )
-                                elif era == "CMIP5":  # CMOR2
-                                    # assuming YYYY-MM-DDTHH:MM:SSZ e.g. ..from cfsv2_decadal runs. 2013-03-12T17:53:48Z CMOR rewrote data to comply with CF standards and CMIP5 requirements.
-                                    attStrInd = attStr.index(
-                                        "Z CMOR rewrote data to comply"
-                                    )
-                                    attStr = attStr[attStrInd - 19 : attStrInd]
-                                    date = re.findall(
-                                        r"\d{1,4}-\d{1,2}-\d{1,2}", attStr
-                                    )
-                                    date = date[0].split("-")
-                                    date = makeDate(
-                                        date[0],
-                                        date[1],
-                                        date[2],
-                                        startYr,
-                                        endYr,
-                                        check=True,
-                                    )
-                                elif era == "CMIP6":
-                                    # assuming ??? CMOR3
-                                    attStrInd = attStr.index(
-                                        "Z CMOR rewrote data to comply"
-                                    )
-                                    attStr = attStr[attStrInd - 19 : attStrInd]
-                                    date = re.findall(
-                                        r"\d{1,4}-\d{1,2}-\d{1,2}", attStr
-                                    )
-                                    date = date[0].split("-")
-                                    date = makeDate(
-                                        date[0],
-                                        date[1],
-                                        date[2],
-                                        startYr,
-                                        endYr,
-                                        check=True,
-                                    )
-                                # Proceed with globalAtts
-                                # dateFound = True
-                                dateFoundAtt = att
-                            # Deal with regex matches
-                            dateReg = [
-                                r"[0-3][0-9]/[0-3][0-9]/(?:[0-9][0-9])?[0-9][0-9]",
-                                r"year:[0-9]{4}:month:[0-9]{2}:day:[0-9]{2}",
-                                # r"Fri Aug  5 19:23:54 MDT 2005"
-                                r"[a-zA-Z]{3}\s[a-zA-Z]{3}\s{1,2}\d{1,2}\s\d{1,2}.\d{2}.\d{2}\s[A-Z]{3}\s\d{4}",
-                                # :creation_date = "2021-05-06T18:58:51Z" CMIP6/ISMIP6/NCAR/CESM2/ssp585-withism/r1i1p1f1/ImonGre/rlds/gn/v20210513
-                                r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z",
-                            ]
-                            # check if dateFound, otherwise drop into other attributes for matches
-                            if dateFound:
-                                continue
-                            # start checking other attributes
-                            for dateFormat in dateReg:
-                                # print("for dateFormat:", dateFormat)
-                                # print("dateFound:", dateFound)
-                                # pdb.set_trace()
-                                date = re.findall(dateFormat, attStr)
-                                # print("re.date:", date)
-                                # timezones
-                                timeZones = [
-                                    "EDT",
-                                    "EST",
-                                    "MDT",
-                                    "MST",
-                                    "PDT",
-                                    "PST",
-                                ]
-                                # CSIRO format - r"year:[0-9]{4}:month:[0-9]{2}:day:[0-9]{2}"
-                                if date and ("year" in date[0]):
-                                    date = (
-                                        date[0]
-                                        .replace("year:", "")
-                                        .replace(":month:", "-")
-                                        .replace(":day:", "-")
-                                    )
-                                    dateFound = True
-                                    dateFoundAtt = att
-                                # CMIP3 NCAR CCSM format - r"[a-zA-Z]{3}\s[a-zA-Z]{3}\s{1,2}\d{1,2}\s\d{1,2}.\d{2}.\d{2}\s[A-Z]{3}\s\d{4}"
-                                elif date and any(
-                                    zone in date[0] for zone in timeZones
-                                ):
-                                    date = date[0].split(" ")
-                                    mon = "{:02d}".format(monList.index(date[1]) + 1)
-                                    yr = date[-1]
-                                    if len(date) == 6:
-                                        day = date[2]
-                                    elif len(date) == 7:
-                                        day = date[3]
-                                    day = "{:02d}".format(int(day))
-                                    date = makeDate(
-                                        yr, mon, day, startYr, endYr, check=True
-                                    )
-                                    dateFound = True
-                                    dateFoundAtt = att
-                                # CMIP6 NCAR CESM2 format r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z"
-                                if date and re.match(
-                                    r"\d{1,4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}Z",
-                                    date[0],
-                                ):
-                                    date = date[0].split("T")
-                                    # print(date)
-                                    date = date[0].split("-")
-                                    yr = date[0]
-                                    mon = date[1]
-                                    day = date[2]
-                                    date = makeDate(
-                                        yr, mon, day, startYr, endYr, check=True
-                                    )
-                                    dateFound = True
-                                    dateFoundAtt = att
-                    # cmor_version?
-                    if "cmor_version" in fh.attrs.keys():
-                        cmorVersion = fh.attrs["cmor_version"]
-                        cmorCount = cmorCount + 1
-                    # if a valid date start saving pieces
-                    if date:
-                        # save filePath, fileName, attName, date
-                        cm[root][fileName] = {}
-                        cm[root][fileName]["date"] = [date, dateFoundAtt]
-                        cm[root][fileName]["time0"] = startTime
-                        cm[root][fileName]["timeN"] = endTime
-                        cm[root][fileName]["sha256"] = sha256
-                        cm[root][fileName]["filePath"] = filePath
-                        cm[root][fileName]["fileSizeBytes"] = fileSizeBytes
-                        if cmorVersion:
-                            cm[root][fileName]["cmorVersion"] = str(cmorVersion)
-                        cm["!_cmorCount"] = cmorCount
-                        cm["!_dirCount"] = dirCount
-                        cm["!_fileCount"] = count  # https://ascii.cl/
-                    if not date:
-                        noDateFileCount = noDateFileCount + 1
-                        print("no date; filePath:", filePath)
-                        cm["!noDateFileCount"] = noDateFileCount
-                        cm["!noDateFile"][noDateFileCount] = [
-                            filePath,
-                            sha256,
-                            fileSizeBytes,
-                        ]
-                    print("date:", date)
-
-                    # close open file
-                    fh.close()
-                    gc.collect()  # force memory refresh
-
-                # if filePath[-3:] != ".nc":
-
-            # save dictionary ## if files and completed dir
-            dirCount = dirCount + 1  # directory counter
-            # timeNow = datetime.datetime.now()
-            # timeFormatDir = timeNow.strftime("%y%m%d")
-            # outFile = "_".join([timeFormatDir, ".".join([era, "json"])])
-            outFile = "_".join([era, ".".join(["{:03d}".format(strCounter), "json"])])
-            if os.path.exists(outFile):
-                os.remove(outFile)
-            print("writing:", outFile)
-            fH = open(outFile, "w")
-            json.dump(
-                cm,
-                fH,
-                ensure_ascii=True,
-                sort_keys=True,
-                indent=4,
-                separators=(",", ":"),
-            )
-            fH.close()
-            gc.collect()  # force memory refresh
-
-            # create filename dynamically from dirCount - complete write above before
-            # resetting the cm dictionary
-            countLim = 10000  # json files between 10000 = 7.5-222Mb; 1000 = 600kb-3Mb; 10 = 10-80 kb
-            if not dirCount % countLim and (dirCount != 0):  # if true will execute
-                print(
-                    "dirCount/countLim/count:", dirCount, (dirCount % countLim), count
+                        result = recordResult(prevIndex[filePath])
+                    reuseCount = reuseCount + 1
+                    source = "reused"
+                elif "sha256" in result and filePath not in cached:
+                    newHashes.append((entry, result["sha256"]))
+                if "stageTimes" in result and source == "inspect":
+                    timer.addFile(filePath, result["stageTimes"])
+                progress.update(1, fileSizeBytes, int(result["status"] != "ok"))
+                events.event(
+                    path=filePath,
+                    size=fileSizeBytes,
+                    source="cloned" if result.get("cloned") else source,
+                    status=result["status"],
+                    reason=result.get("reason"),
+                    date=result.get("date"),
                 )
-                strCounter = int(dirCount / countLim)
-                # create new dictionary
-                cmorCountTmp = cm["!_cmorCount"]
-                fileCountTmp = cm["!_fileCount"]
-                badFileTmp = cm["!badFile"]
-                fileReadErrorTmp = cm["!fileReadError"]
-                noDateFileTmp = cm["!noDateFile"]
-                cm = {}
-                cm["!_cmorCount"] = cmorCountTmp
-                cm["!_dirCount"] = dirCount
-                cm["!_fileCount"] = fileCountTmp
-                cm["!badFile"] = badFileTmp
-                cm["!fileReadError"] = fileReadErrorTmp
-                cm["!noDateFile"] = noDateFileTmp
+                if result.get("cloned"):
+                    cloneCount = cloneCount + 1
+                elif getRule(rules, root, fileName) is None:
+                    rememberResult(result)  # later copies clone this result
+                if "dateCacheHits" in result:
+                    dateCacheHits = dateCacheHits + result["dateCacheHits"]
+                    dateCacheMisses = dateCacheMisses + result["dateCacheMisses"]
+                if result["status"] == "badFile":
+                    badFileCount = badFileCount + 1
+                    writer.set(["!badFile", badFileCount], filePath)
+                    continue
+                elif result["status"] == "fileReadError":
+                    fileReadErrorCount = fileReadErrorCount + 1
+                    reason = result.get("reason", "open")
+                    stamp = fileStamp(entry)
+                    value = [filePath, reason]
+                    if stamp is not None:
+                        value.extend(stamp)  # reused while unchanged
+                    writer.set(["!fileReadError", fileReadErrorCount], value)
+                    if stamp is not None and reason in ("crash", "memory", "timeout"):
+                        quarantine[filePath] = {
+                            "reason": reason,
+                            "fileSizeBytes": stamp[0],
+                            "fileModTimeNs": stamp[1],
+                            "fileInode": stamp[2],
+                        }
+                    continue
+                sha256 = result["sha256"]
+                date = result["date"]
+                dateFoundAtt = result["dateFoundAtt"]
+                startTime = result["time0"]
+                endTime = result["timeN"]
+                # cmor_version?
+                cmorVersion = False
+                if "cmorVersion" in result:
+                    cmorVersion = result["cmorVersion"]
+                    cmorCount = cmorCount + 1
+                # if a valid date start saving pieces
+                if date:
+                    # save filePath, fileName, attName, date
+                    rec = {}
+                    rec["date"] = [date, dateFoundAtt]
+                    rec["time0"] = startTime
+                    rec["timeN"] = endTime
+                    rec["sha256"] = sha256
+                    rec["filePath"] = filePath
+                    rec["fileSizeBytes"] = fileSizeBytes
+                    stamp = fileStamp(entry)
+                    if stamp is not None:
+                        rec["fileModTimeNs"] = stamp[1]
+                        rec["fileInode"] = stamp[2]
+                    if cmorVersion:
+                        rec["cmorVersion"] = str(cmorVersion)
+                    writer.set([root, fileName], rec)
+                if not date:
+                    noDateFileCount = noDateFileCount + 1
+                    log(levelVerbose, "no date; filePath:", filePath)
+                    value = [filePath, sha256, fileSizeBytes]
+                    stamp = fileStamp(entry)
+                    if stamp is not None:
+                        # reused while unchanged, cmorVersion for !_cmorCount
+                        if "cmorVersion" in result:
+                            cmorVersion = str(result["cmorVersion"])
+                        else:
+                            cmorVersion = None
+                        value.extend([stamp[1], stamp[2], cmorVersion])
+                    writer.set(["!noDateFile", noDateFileCount], value)
+                log(levelDebug, "date:", date)
+
+            # if filePath[-3:] != ".nc":
+
+        timer.add("record", time.perf_counter() - recordStart)
+        with timer.stage("hashCacheWrite"):
+            putCachedHashes(db, newHashes)
+
+        # completed dir, append changed counters https://ascii.cl/
+        dirCount = dirCount + 1  # directory counter
+        counts = {
+            "!_cmorCount": cmorCount,
+            "!_dirCount": dirCount,
+            "!_fileCount": count,
+            "!badFileCount": badFileCount,
+            "!fileReadErrorCount": fileReadErrorCount,
+            "!noDateFileCount": noDateFileCount,
+        }
+        for key, value in counts.items():
+            if value != lastCounts.get(key, 0):
+                writer.set([key], value)
+        lastCounts = counts
+
+        # checkpoint after the completed directory
+        if args["checkpoint"] and not dirCount % args["checkpoint"]:
+            counts = [
+                badFileCount,
+                cloneCount,
+                cmorCount,
+                count,
+                dateCacheHits,
+                dateCacheMisses,
+                dirCount,
+                fileReadErrorCount,
+                noDateFileCount,
+                reuseCount,
+            ]
+            state = {
+                "catalogueCounts": lastCounts,
+                "catalogueOffset": writer.sync(),
+                "counts": dict(zip(checkNames, counts)),
+                "pathIndex": pathInd,
+                "progressCount": progress.files,
+                "root": root,
+            }
+            with timer.stage("checkpoint"):
+                writeCheckpoint(checkFile, state)
+                if args["quarantine"]:
+                    writeCheckpoint(args["quarantine"], quarantine)
+
+if writer is not None:
+    writer.close()
+if leases is not None:
+    leases.close()
+progress.close()
+events.close()
+log(levelInfo, "catalogue:", catFile)
+if args["quarantine"]:
+    writeCheckpoint(args["quarantine"], quarantine)  # same atomic json write
+    log(levelInfo, "quarantined files:", len(quarantine))
+log(levelInfo, "files reused from previous catalogue:", reuseCount)
+log(levelInfo, "files cloned from identical content (sha256):", cloneCount)
+log(levelInfo, "date cache hits:", dateCacheHits, "misses:", dateCacheMisses)
+if leases is not None:
+    log(levelInfo, "work units completed:", unitCount, "lost:", lostUnitCount)
+
+# scan complete, a later --resume has nothing to continue
+if os.path.exists(checkFile):
+    os.remove(checkFile)
+
+# %% nested json, as written by earlier versions
+if args["finalize"]:
+    with timer.stage("finalize"):
+        writeCatalogue(*loadRecords(catFile), era)
+
+# %% run report, stage timings and final counts
+runCounts = {
+    "badFileCount": badFileCount,
+    "cloneCount": cloneCount,
+    "cmorCount": cmorCount,
+    "dateCacheHits": dateCacheHits,
+    "dateCacheMisses": dateCacheMisses,
+    "dirCount": dirCount,
+    "fileCount": count,
+    "fileReadErrorCount": fileReadErrorCount,
+    "noDateFileCount": noDateFileCount,
+    "reuseCount": reuseCount,
+}
+if leases is not None:
+    runCounts["unitCount"] = unitCount
+    runCounts["lostUnitCount"] = lostUnitCount
+if args["report"]:
+    timer.writeReport(args["report"], era=era, catalogue=catFile, counts=runCounts)
+    log(levelInfo, "report:", args["report"])
+if args["prometheus"]:
+    timer.writePrometheus(args["prometheus"], "cmip_scan", {"era": era}, runCounts)
+profiler.close()
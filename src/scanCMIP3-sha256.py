@@ -8,19 +8,94 @@ PJD  7 Aug 2023     - Written to collect file information allowing
 PJD  7 Aug 2023     - Moved function defs to CMIP3Lib
 PJD  8 Aug 2023     - Added writeJson function
 PJD 11 Aug 2023     - Added additional dob vars
-                    - TODO: think about parallelisation
-                    https://stackoverflow.com/questions/11920490/how-do-i-run-os-walk-in-parallel-in-python
+PJD 18 Oct 2026     - Replaced os.walk with threaded scanTree; reuse DirEntry stats
+PJD 18 Oct 2026     - Hash on a thread pool (CMIP3Lib.hashFiles, --threads/--perDevice),
+                      report MB/s; write json every 10000 files, ~np.mod was always true
+PJD 18 Oct 2026     - Added --hashCache, unchanged files take sha256 from the shared cache
+PJD 18 Oct 2026     - Size-first: only files sharing a size are hashed, singletons listed
+                      under !unhashed; --fixity hashes all; keep every path per sha256
+PJD 18 Oct 2026     - Head/tail blake2b fingerprint first, sha256 only where they collide
+PJD 18 Oct 2026     - Per-file prints -> runLib levels (-v/-q), progress line and --eventLog
+PJD 18 Oct 2026     - Added StageTimer per-stage timings, --report json and --prometheus
+PJD 18 Oct 2026     - Added --profile (sampled fingerprint/sha256/record cProfile) and
+                      --tracemalloc
+PJD 18 Oct 2026     - Added --paths, e.g. a makeTestArchive.py tree for benchScan.py
+PJD 18 Oct 2026     - Cached files sharing a size with an uncached file are fingerprinted,
+                      so a new copy of a cached file collides with it
 
 @author: durack1
 """
 
 # %% imports
+import argparse
+import collections
 import datetime
+import time
 import numpy as np
-import os
 
 # %% function defs
-from CMIP3Lib import getFileStats, getSha256, writeJson
+from CMIP3Lib import (
+    getCachedHashes,
+    getFileStats,
+    getPartialHash,
+    getSha256,
+    hashCacheFile,
+    hashFiles,
+    openHashCache,
+    putCachedHashes,
+    scanTree,
+    writeJson,
+)
+from runLib import (
+    EventLog,
+    Profiler,
+    Progress,
+    StageTimer,
+    addArguments,
+    addProfileArguments,
+    addReportArguments,
+    levelDebug,
+    levelInfo,
+    levelVerbose,
+    log,
+    setLevel,
+)
+
+# add runtime argument
+parser = argparse.ArgumentParser(description="Collect sha256 of all CMIP3 files")
+parser.add_argument(
+    "--paths",
+    help="Directories to hash, default the CMIP3 archive paths",
+    nargs="+",
+    default=None,
+)
+parser.add_argument(
+    "--threads",
+    help="Number of threads hashing files",
+    type=int,
+    default=16,
+)
+parser.add_argument(
+    "--perDevice",
+    help="Files hashed at once on each device (mount point)",
+    type=int,
+    default=4,
+)
+parser.add_argument(
+    "--hashCache",
+    help="SQLite sha256 cache shared by the scanners, '' disables",
+    default=hashCacheFile,
+)
+parser.add_argument(
+    "--fixity",
+    help="Hash every file, not only those sharing a size with another file",
+    action="store_true",
+)
+addArguments(parser, "cmip3-sha256_events.jsonl")
+addReportArguments(parser, "cmip3-sha256_report.json")
+addProfileArguments(parser)
+args = vars(parser.parse_args())
+setLevel(args)
 
 # set times
 timeNow = datetime.datetime.now()
@@ -32,52 +107,184 @@ cm3Paths = [
     "/p/css03/esgf_publish/cmip3",
     "/p/css03/scratch/ipcc2_deleteme_July2020",
 ]
+if args["paths"]:
+    cm3Paths = args["paths"]
 
 # preallocate
 fileDict = {}
 fileDict["!_timeBegin"] = timeBegin
 count = 0
+db = openHashCache(args["hashCache"])
+timer = StageTimer()  # per-stage seconds, --report/--prometheus
+profiler = Profiler(args["profile"], args["profileSample"], args["tracemalloc"])
+
 
-for cmPath in cm3Paths:
-    for root, dirs, files in os.walk(cmPath):
-        if files:
-            # print("files:", files)
-            files.sort()  # sort to process sequentially
-            for c1, fileName in enumerate(files):
+def listFiles():
+    # files to hash, scanTree returns files sorted, to process sequentially
+    for cmPath in cm3Paths:
+        for root, dirs, files in scanTree([cmPath]):
+            for entry in files:
                 # catch erroneous files
-                if fileName == "listing_20080409.txt":
-                    print("badFile:", "listing_20080409.txt", "skipping")
+                if entry.name == "listing_20080409.txt":
+                    log(levelVerbose, "badFile:", "listing_20080409.txt", "skipping")
                     continue
-                filePath = os.path.join(root, fileName)
-                print("filePath:", filePath)
-                # get sha256, fileSizeBytes, fileModTime
-                sha256 = getSha256(filePath)
-                fileSizeBytes, fileModTime = getFileStats(filePath)
-                # print
-                print(
-                    "{:06d}".format(count),
-                    "sha256:",
-                    sha256,
-                    "fileSizeBytes:",
-                    fileSizeBytes,
-                )
-                # add file entry to dictionary
-                fileDict[sha256] = {}
-                fileDict[sha256][filePath] = {}
-                fileDict[sha256][filePath]["fileSizeBytes"] = fileSizeBytes
-                fileDict[sha256][filePath]["fileModTime"] = fileModTime
-                count = count + 1  # file counter
-
-            # write json if count
-            if ~np.mod(count, 10):
-                writeJson(fileDict, "cmip3-sha256", timeFormatDir)
+                yield entry
+
+
+def printRate(stats, timeStart):
+    mbps = stats["bytes"] / 1e6 / max(time.monotonic() - timeStart, 1e-9)
+    log(levelInfo, "hashed:", stats["files"], "files", "{:.1f}".format(mbps), "MB/s")
+
+
+# size-first - a file with a unique size cannot have a binary identical copy, so
+# only size collisions are hashed (all files with --fixity); cached hashes are free
+entries = list(timer.iterate("walk", listFiles()))
+sizeCounts = collections.Counter([entry.stat().st_size for entry in entries])
+with timer.stage("hashCacheRead"):
+    cached = getCachedHashes(db, entries)
+cachedPaths = set(cached)
+# cached files are fingerprinted only where an uncached file shares their size, it
+# may be a new copy of one; sizes of cached files alone are free to hash
+uncachedSizes = set(
+    [entry.stat().st_size for entry in entries if entry.path not in cachedPaths]
+)
+# within a size, head/tail blake2b fingerprints - sha256 only where these collide
+partials = {}
+if not args["fixity"]:
+    candidates = [
+        entry
+        for entry in entries
+        if sizeCounts[entry.stat().st_size] > 1
+        and entry.stat().st_size in uncachedSizes
+    ]
+    partialStats = {}
+    for entry, partialHash in hashFiles(
+        candidates,
+        threads=args["threads"],
+        perDevice=args["perDevice"],
+        stats=partialStats,
+        hashFunc=timer.timed(
+            "fingerprint", profiler.wrap("fingerprint", getPartialHash)
+        ),
+    ):
+        partials[entry.path] = (entry.stat().st_size, partialHash)
+    log(levelInfo, "fingerprinted:", partialStats["files"], "files")
+partialCounts = collections.Counter(partials.values())
+toHash = []
+fileDict["!unhashed"] = {}
+for entry in entries:
+    if (
+        args["fixity"]
+        or entry.path in cachedPaths
+        or partialCounts[partials.get(entry.path)] > 1
+    ):
+        toHash.append(entry)
+        continue
+    filePath = entry.path
+    fileSizeBytes, fileModTime = getFileStats(filePath, entry)
+    log(
+        levelDebug,
+        "{:06d}".format(count),
+        "unhashed:",
+        filePath,
+        "fileSizeBytes:",
+        fileSizeBytes,
+    )
+    fileDict["!unhashed"][filePath] = {}
+    fileDict["!unhashed"][filePath]["fileSizeBytes"] = fileSizeBytes
+    fileDict["!unhashed"][filePath]["fileModTime"] = fileModTime
+    if filePath in partials:
+        fileDict["!unhashed"][filePath]["partialBlake2b"] = partials[filePath][1]
+    count = count + 1  # file counter
+unhashedCount = len(fileDict["!unhashed"])
+log(
+    levelInfo,
+    "files:",
+    len(entries),
+    "to hash:",
+    len(toHash),
+    "unhashed:",
+    unhashedCount,
+)
+del entries
+
+# hashFiles reads ahead on a thread pool, results return in toHash order
+hashStats = {}
+newHashes = []
+timeStart = time.monotonic()
+progress = Progress("sha256", total=len(toHash))
+events = EventLog(args["eventLog"])
+hashed = hashFiles(
+    toHash,
+    threads=args["threads"],
+    perDevice=args["perDevice"],
+    stats=hashStats,
+    known=cached,
+    hashFunc=timer.timed("sha256", profiler.wrap("sha256", getSha256)),
+)
+for entry, sha256 in profiler.iterate("record", hashed, key=lambda item: item[0].path):
+    filePath = entry.path
+    if filePath not in cachedPaths:
+        newHashes.append((entry, sha256))
+    log(levelDebug, "filePath:", filePath)
+    # get fileSizeBytes, fileModTime
+    fileSizeBytes, fileModTime = getFileStats(filePath, entry)
+    progress.update(1, fileSizeBytes)
+    events.event(path=filePath, size=fileSizeBytes, sha256=sha256)
+    # print
+    log(
+        levelDebug,
+        "{:06d}".format(count),
+        "sha256:",
+        sha256,
+        "fileSizeBytes:",
+        fileSizeBytes,
+    )
+    # add file entry to dictionary, binary identical copies share the sha256 key
+    if sha256 not in fileDict:
+        fileDict[sha256] = {}
+    fileDict[sha256][filePath] = {}
+    fileDict[sha256][filePath]["fileSizeBytes"] = fileSizeBytes
+    fileDict[sha256][filePath]["fileModTime"] = fileModTime
+    count = count + 1  # file counter
+
+    # write json if count
+    if not np.mod(count, 10000):
+        printRate(hashStats, timeStart)
+        with timer.stage("hashCacheWrite"):
+            putCachedHashes(db, newHashes)
+        newHashes = []
+        with timer.stage("writeJson"):
+            writeJson(fileDict, "cmip3-sha256", timeFormatDir)
+progress.close()
+events.close()
+printRate(hashStats, timeStart)
+with timer.stage("hashCacheWrite"):
+    putCachedHashes(db, newHashes)
 
 # determine counts
-shaCount = len(fileDict) - 1  # -1 as "!_timeBegin" exists
+shaCount = len(fileDict) - 2  # -2 as "!_timeBegin" and "!unhashed" exist
 fileDict["!_shaCount"] = shaCount  # 98349
+fileDict["!_unhashedCount"] = unhashedCount  # unique size/fingerprint, add to shaCount
 fileDict["!_fileCount"] = count + 1  # 137096 (0-indexed)
 
 # cleanup
 timeEnd = datetime.datetime.now().strftime("%y%m%d_%H%M%S")
 fileDict["!_timeEnd"] = timeEnd
-writeJson(fileDict, "cmip3-sha256", timeFormatDir)
+with timer.stage("writeJson"):
+    writeJson(fileDict, "cmip3-sha256", timeFormatDir)
+
+# run report, stage timings and final counts
+runCounts = {
+    "fileCount": count,
+    "hashedBytes": hashStats.get("bytes", 0),
+    "hashedCount": hashStats.get("files", 0),
+    "shaCount": shaCount,
+    "unhashedCount": unhashedCount,
+}
+if args["report"]:
+    timer.writeReport(args["report"], catalogue="cmip3-sha256", counts=runCounts)
+    log(levelInfo, "report:", args["report"])
+if args["prometheus"]:
+    timer.writePrometheus(args["prometheus"], "cmip3_sha256", {}, runCounts)
+profiler.close()
@@ -20,6 +20,14 @@ PJD 30 Jun 2023     - Added getFileSize
 PJD 30 Jun 2023     - Removed table_id as this has file generation date/time - will provide erronous timestamp
 PJD 16 Apr 2024     - Update to attempt CMIP5/6 scanning
 PJD 18 Apr 2024     - Update for CMIP5/6 scanning; pull cmor_version check up
+PJD 18 Oct 2026     - Replaced os.walk with threaded scanTree (CMIP3Lib); reuse DirEntry stats
+PJD 18 Oct 2026     - Replaced per-directory json.dump of cm3 with an append-only
+                      CatalogueWriter *.jsonl, nested json written once at the end
+PJD 18 Oct 2026     - Use streaming CMIP3Lib.getSha256, whole files were read into memory
+PJD 18 Oct 2026     - Added --hashCache, unchanged files take sha256 from the shared cache
+PJD 18 Oct 2026     - Moved the bad dict to badRules.json fix rules (--rules), no exec
+PJD 18 Oct 2026     - Per-file prints -> runLib levels (-v/-q) and a progress line
+PJD 18 Oct 2026     - Nested json written from a recordLib.RecordStore (writeCatalogue)
                     TODO: add time start/stop to fileNames that exclude them
                     TODO: table mappings O1 = Omon?, O1e?
 
@@ -28,13 +36,35 @@ PJD 18 Apr 2024     - Update for CMIP5/6 scanning; pull cmor_version check up
 
 import argparse
 import datetime
-import hashlib
-import json
 import os
 import re
 import xarray as xr
 from xcdat import open_dataset
 
+from CMIP3Lib import (
+    CatalogueWriter,
+    getCachedHashes,
+    getRule,
+    getSha256,
+    hashCacheFile,
+    loadRules,
+    openHashCache,
+    putCachedHashes,
+    ruleFile,
+    scanTree,
+)
+from recordLib import loadRecords, writeCatalogue
+from runLib import (
+    Progress,
+    addArguments,
+    levelDebug,
+    levelInfo,
+    levelVerbose,
+    log,
+    setLevel,
+)
+from scanLib import openRule
+
 # import pdb
 # import shutil
 # import sys
@@ -75,12 +105,30 @@ parser.add_argument(
     required=True,
     choices=["3", "5", "6"],
 )
+parser.add_argument(
+    "--threads",
+    help="Number of threads listing directories",
+    type=int,
+    default=16,
+)
+parser.add_argument(
+    "--hashCache",
+    help="SQLite sha256 cache shared by the scanners, '' disables",
+    default=hashCacheFile,
+)
+parser.add_argument(
+    "--rules",
+    help="json fix rules for files that fail to open, see badRules.json",
+    default=ruleFile,
+)
+addArguments(parser)
 args = vars(parser.parse_args())
+setLevel(args)
 era = "".join(["CMIP", args["era"]])
 startYr = cmDict[era]["startYr"]
 endYr = cmDict[era]["endYr"]
 paths = cmDict[era]["paths"]
-print(era, startYr, endYr)
+log(levelInfo, era, startYr, endYr)
 
 # %% function defs
 
@@ -127,30 +175,23 @@ def checkDate(dateStr, startYr, endYr):
     # assume 2022-10-05 format
     y, m, d = dateStr.split("-")
     if not startYr <= int(y) <= endYr:
-        print("year invalid:", y)
+        log(levelDebug, "year invalid:", y)
         return None
     if not 1 <= int(m) <= 12:
-        print("month invalid:", m)
+        log(levelDebug, "month invalid:", m)
         return None
     if not 1 <= int(d) <= 31:
-        print("day invalid:", d)
+        log(levelDebug, "day invalid:", d)
         return None
 
     return dateStr
 
 
-def fixFunc(fixStr, fixStrInfo):
-    def fix(ds):
-        print(fixStrInfo)
-        exec(fixStr)  # ds.time.encoding["units"] = "days since 2001-1-1"
-
-        return ds
-
-    return fix
-
-
-def getFileSize(filePath):
-    if os.path.isfile(filePath):
+def getFileSize(filePath, entry=None):
+    # entry is an os.DirEntry from scanTree, reuse its cached stat
+    if entry is not None and entry.is_file():
+        fileSizeBytes = entry.stat().st_size
+    elif os.path.isfile(filePath):
         fileStats = os.stat(filePath)
         fileSizeBytes = fileStats.st_size
     else:
@@ -160,16 +201,6 @@ def getFileSize(filePath):
     return fileSizeBytes
 
 
-def getSha256(filePath, print=False):
-    with open(filePath, "rb") as f:
-        bytes = f.read()  # read entire file as bytes
-        readable_hash = hashlib.sha256(bytes).hexdigest()
-        if print:
-            print(readable_hash)
-
-    return readable_hash
-
-
 def getTimes(time, startYr, endYr):
     y = int(time.dt.year.data)
     m = int(time.dt.month.data)
@@ -315,139 +346,90 @@ monList = [
     "Dec",
 ]
 
+# %% load fix rules, files that fail to open as-is (was the bad dict)
+rules = loadRules(args["rules"])
+# "/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1": ["rlus_A2_a42_0108-0147.nc", "bad time dimension values", "", []],
+# /p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/mo/rsut/mpi_echam5/run1/rsut_CF1.nc
+
 # %% create exclude dirs
-bad = {
-    "/p/css03/esgf_publish/cmip3/ipcc/data3/sresa2/ice/mo/sic/ingv_echam4/run1": [
-        "",
-        "fix bad time:units 20O1-1-1",
-        "ds.time.attrs['units'] = 'days since 2001-01-01'",
-        [],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data3/sresa2/ice/mo/sit/ingv_echam4/run1": [
-        "",
-        "fix bad time:units 20O1-1-1",
-        "ds.time.attrs['units'] = 'days since 2001-01-01'",
-        [],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data8/picntrl/ocn/mo/rhopoto/ncar_ccsm3_0/run2": [
-        "rhopoto_O1.PIcntrl_2.CCSM.ocnm.0585-01_cat_0589-12.nc",
-        "drop bad time_bnds",
-        "",
-        ["time_bnds"],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/data16/sresa1b/atm/mo/rlds/mpi_echam5/run2": [
-        "rlds_A1.nc",
-        "drop bad time_bnds",
-        "",
-        ["time_bnds"],
-    ],
-    "/p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/da/pr/ukmo_hadsm4/run1": [
-        "pr_CF3.nc",
-        "bad time dimension",
-        "",
-        [],
-    ],
-    # "/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1": ["rlus_A2_a42_0108-0147.nc", "bad time dimension values", "", []],
-    # /p/css03/esgf_publish/cmip3/ipcc/cfmip/2xco2/atm/mo/rsut/mpi_echam5/run1/rsut_CF1.nc
-}
 excludeDirs = set(["summer", "cam3.3", "T4031qt"])
 excludeDirs2 = set(["ipcc"])
 # 004306 filePath: /p/css03/esgf_publish/cmip3/ipcc/summer/T4031qtC.pop.h.0019-08-21-43200.nc
 
 # %% iterate over files
-cm3 = {}
-cm3["!badFile"] = {}
-cm3["!noDateFile"] = {}
-cm3["!fileReadError"] = {}
+timeNow = datetime.datetime.now()
+timeFormatDir = timeNow.strftime("%y%m%d")
+catFile = "_".join([timeFormatDir, ".".join([era, "jsonl"])])
+writer = CatalogueWriter(catFile)
+writer.set(["!badFile"], {})
+writer.set(["!noDateFile"], {})
+writer.set(["!fileReadError"], {})
+lastCounts = {}
+db = openHashCache(args["hashCache"])
 badFileCount, cmorCount, count, fileReadErrorCount, noDateFileCount = [
     0 for _ in range(5)
 ]
+progress = Progress("scan")
 for cmPath in paths:
     # for cmPath in ["/p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1"]:  # bug hunting
-    # for cmPath in list(bad.keys()):
-    for root, dirs, files in os.walk(cmPath):
-        print("root:", root)
-        # Add dirs to exclude;
-        [dirs.remove(d) for d in list(dirs) if d in excludeDirs]
-        if root.split("/")[-1] == "ipcc":
-            [dirs.remove(d) for d in list(dirs) if d in excludeDirs2]  # catch ipcc/ipcc
-        if root in list(bad.keys()):
-            # Weed out bad paths/files
-            # print("in here!")
-            # pdb.set_trace()
-            badFile = bad[root][0]
-            fixStrInfo = bad[root][1]
-            fixStr = bad[root][2]
-            if bad[root][3] != []:
-                badVars = bad[root][3][0]
-            else:
-                badVars = None
-        else:
-            badFile, fixStrInfo, fixStr, badVars = [None for _ in range(4)]
-            # continue
+    # for cmPath in list(rules.keys()):
+    # excludeDirs/excludeDirs2 (ipcc/ipcc) are pruned by scanTree
+    for root, dirs, files in scanTree(
+        [cmPath], excludeDirs, excludeDirs2, threads=args["threads"]
+    ):
+        log(levelVerbose, "root:", root)
         if files:
             # print("files:", files)
-            files.sort()  # sort to process sequentially
-            for c1, fileName in enumerate(files):
-                filePath = os.path.join(root, fileName)
-                print("{:06d}".format(count), "filePath:", filePath)
+            # scanTree returns files sorted, to process sequentially
+            dirEntry = False  # cm3[root] written
+            # one hash cache lookup per directory
+            cached, newHashes = getCachedHashes(db, files), []
+            for c1, entry in enumerate(files):
+                fileName = entry.name
+                filePath = entry.path
+                log(levelDebug, "{:06d}".format(count), "filePath:", filePath)
                 # get sha256
-                sha256 = getSha256(filePath)
+                sha256 = cached.get(filePath)
+                if sha256 is None:
+                    sha256 = getSha256(filePath)
+                    newHashes.append((entry, sha256))
                 # get fileSizeBytes
-                fileSizeBytes = getFileSize(filePath)
+                fileSizeBytes = getFileSize(filePath, entry)
+                progress.update(1, fileSizeBytes)
                 if filePath[-3:] != ".nc":  # deal with *.nc.bad files
                     badFileCount = badFileCount + 1
-                    print("no date; filePath:", filePath)
-                    cm3["!badFileCount"] = badFileCount
-                    cm3["!badFile"][badFileCount] = filePath
+                    log(levelVerbose, "no date; filePath:", filePath)
+                    writer.set(["!badFile", badFileCount], filePath)
                 elif filePath[-3:] == ".nc":  # process all "good" files
-                    if c1 == 0:
-                        cm3[root] = {}  # create dir entry for each file
-                    elif root not in cm3.keys():
+                    if not dirEntry:
                         # create dir entry for each file, if first file bad
-                        cm3[root] = {}
+                        writer.set([root], {})
+                        dirEntry = True
                     cmorVersion, dateFound = [
                         False for _ in range(2)
                     ]  # set for each file
                     count = count + 1  # file counter
                     # open and deal with file issues
                     # pdb.set_trace()
+                    # Weed out bad paths/files
+                    rule = getRule(rules, root, fileName)
                     try:
                         # wrap so bombs are caught in except
-                        if fixStr == None and badVars == None and badFile == None:
+                        if rule is None:
                             fh = open_dataset(filePath, use_cftime=True)
-                        # Case bad root match, but not file
-                        elif fixStrInfo and (badFile != fileName and not badFile == ""):
-                            fh = open_dataset(filePath, use_cftime=True)
-                        # Case bad root match, AND file
-                        elif badVars and (fileName == badFile):  # badVars only
-                            print("badVars:", badVars)
-                            fh = xr.open_dataset(
-                                filePath, drop_variables=[badVars]
-                            ).pipe(xr.decode_cf)
-                        elif badFile == "":  # fixFunc for all files only - 9863
-                            print("badFile == ''")
-                            fh = (
-                                xr.open_dataset(filePath, decode_times=False)
-                                .pipe(fixFunc(fixStr, fixStrInfo))
-                                .pipe(xr.decode_cf)
-                            )
-                        # is there a need for fixFunc AND badVars?
-                        elif badVars == [] and (fileName == badFile):
-                            # print("elif3")
-                            # pdb.set_trace()
+                        # skipFile rule, no fix will open it
+                        elif rule["skip"]:
                             badFileCount = badFileCount + 1
-                            print("badFile; filePath:", filePath)
-                            cm3["!badFileCount"] = badFileCount
-                            cm3["!badFile"][badFileCount] = filePath
+                            log(levelVerbose, "badFile; filePath:", filePath)
+                            writer.set(["!badFile", badFileCount], filePath)
                             continue
+                        else:
+                            fh = openRule(filePath, rule)
                     except:
-                        print("except")
                         # pdb.set_trace()
                         fileReadErrorCount = fileReadErrorCount + 1
-                        print("fileReadError; filePath:", filePath)
-                        cm3["!fileReadErrorCount"] = fileReadErrorCount
-                        cm3["!fileReadError"][fileReadErrorCount] = filePath
+                        log(levelVerbose, "fileReadError; filePath:", filePath)
+                        writer.set(["!fileReadError", fileReadErrorCount], filePath)
                         continue
                     if "T" in fh.cf.axes:
                         startTime = getTimes(fh.time[0], startYr, endYr)
@@ -460,7 +442,7 @@ for cmPath in paths:
                             # print(att, "not in file, skipping..")
                             continue
                         if isinstance(attDict[att], str):
-                            print("att:", att)
+                            log(levelDebug, "att:", att)
                             attStr = attDict[att]
                             # print("attStr:", attStr)
                             # BCCR_BCM2_0 format
@@ -550,11 +532,11 @@ for cmPath in paths:
                                 continue
                             # start checking other attributes
                             for dateFormat in dateReg:
-                                print("for dateFormat:", dateFormat)
-                                print("dateFound:", dateFound)
+                                log(levelDebug, "for dateFormat:", dateFormat)
+                                log(levelDebug, "dateFound:", dateFound)
                                 # pdb.set_trace()
                                 date = re.findall(dateFormat, attStr)
-                                print("re.date:", date)
+                                log(levelDebug, "re.date:", date)
                                 # timezones
                                 timeZones = [
                                     "EDT",
@@ -597,7 +579,7 @@ for cmPath in paths:
                                     date[0],
                                 ):
                                     date = date[0].split("T")
-                                    print(date)
+                                    log(levelDebug, date)
                                     date = date[0].split("-")
                                     yr = date[0]
                                     mon = date[1]
@@ -610,48 +592,46 @@ for cmPath in paths:
                     # if a valid date start saving pieces
                     if date:
                         # save filePath, fileName, attName, date
-                        cm3[root][fileName] = {}
-                        cm3[root][fileName]["date"] = [date, dateFoundAtt]
-                        cm3[root][fileName]["time0"] = startTime
-                        cm3[root][fileName]["timeN"] = endTime
-                        cm3[root][fileName]["sha256"] = sha256
-                        cm3[root][fileName]["filePath"] = filePath
-                        cm3[root][fileName]["fileSizeBytes"] = fileSizeBytes
+                        rec = {}
+                        rec["date"] = [date, dateFoundAtt]
+                        rec["time0"] = startTime
+                        rec["timeN"] = endTime
+                        rec["sha256"] = sha256
+                        rec["filePath"] = filePath
+                        rec["fileSizeBytes"] = fileSizeBytes
                         if cmorVersion:
-                            cm3[root][fileName]["cmorVersion"] = str(cmorVersion)
-                        cm3["!_cmorCount"] = cmorCount
-                        cm3["!_fileCount"] = count  # https://ascii.cl/
+                            rec["cmorVersion"] = str(cmorVersion)
+                        writer.set([root, fileName], rec)
                     if not date:
                         noDateFileCount = noDateFileCount + 1
-                        print("no date; filePath:", filePath)
-                        cm3["!noDateFileCount"] = noDateFileCount
-                        cm3["!noDateFile"][noDateFileCount] = [
-                            filePath,
-                            sha256,
-                            fileSizeBytes,
-                        ]
-                    print("date:", date)
+                        log(levelVerbose, "no date; filePath:", filePath)
+                        writer.set(
+                            ["!noDateFile", noDateFileCount],
+                            [filePath, sha256, fileSizeBytes],
+                        )
+                    log(levelDebug, "date:", date)
 
                     # close open file
                     fh.close()
-
-        # save dictionary ## if files
-        timeNow = datetime.datetime.now()
-        timeFormatDir = timeNow.strftime("%y%m%d")
-        outFile = "_".join([timeFormatDir, ".".join([era, "json"])])
-        if os.path.exists(outFile):
-            os.remove(outFile)
-        print("writing:", outFile)
-        fH = open(outFile, "w")
-        json.dump(
-            cm3,
-            fH,
-            ensure_ascii=True,
-            sort_keys=True,
-            indent=4,
-            separators=(",", ":"),
-        )
-        fH.close()
+            putCachedHashes(db, newHashes)
+
+        # completed dir, append changed counters https://ascii.cl/
+        counts = {
+            "!_cmorCount": cmorCount,
+            "!_fileCount": count,
+            "!badFileCount": badFileCount,
+            "!fileReadErrorCount": fileReadErrorCount,
+            "!noDateFileCount": noDateFileCount,
+        }
+        for key, value in counts.items():
+            if value != lastCounts.get(key, 0):
+                writer.set([key], value)
+        lastCounts = counts
+
+# save dictionary, same yymmdd_{era}.json as the per-directory dumps
+writer.close()
+progress.close()
+writeCatalogue(*loadRecords(catFile), era, timeFormatDir)
 
 """
 067561 filePath: /p/css03/esgf_publish/cmip3/ipcc/20c3m/atm/da/rlus/miub_echo_g/run1/rlus_A2_a42_0108-0147.nc
@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:27 2026
+
+PJD 18 Oct 2026     - Written to collect scanCMIP.py per-file functions so they can run
+                      in a process pool (scanCMIP.py --workers)
+PJD 18 Oct 2026     - inspectFile reads netCDF3 headers with ncLib, xarray only for netCDF4/fixes
+PJD 18 Oct 2026     - Added loadCatalogue, indexCatalogue, fileStamp, matchRecord, recordResult
+                      for scanCMIP.py --incremental
+PJD 18 Oct 2026     - Added readCheckpoint, writeCheckpoint for scanCMIP.py --resume
+PJD 18 Oct 2026     - loadCatalogue reads CatalogueWriter *.jsonl; checkpoints hold the
+                      catalogue offset rather than the dictionary
+PJD 18 Oct 2026     - inspectFile hashes and reads netCDF3 metadata in one pass (ncLib.scanFile)
+PJD 18 Oct 2026     - inspectFile takes a sha256 from the hash cache, header-only read
+PJD 18 Oct 2026     - getDate, attList, monList moved to dateLib (single pass regex)
+PJD 18 Oct 2026     - inspectFile returns dateLib cache hits/misses for the file
+PJD 18 Oct 2026     - Added shaResults, cloneResult, rememberResult; inspectFile copies the
+                      result of byte-identical content instead of opening the file
+PJD 18 Oct 2026     - inspectFile takes a CMIP3Lib.getRule fix rule, fixFunc -> openRule
+PJD 18 Oct 2026     - Added SandboxPool, mapDirs workers run with a per-file timeout and
+                      memory cap, replaced when a file hangs or crashes them
+PJD 18 Oct 2026     - inspectFile opens netCDF4/fixed files with times undecoded and
+                      decodes only the first/last values (getRawTimes); dropped getTimes,
+                      makeDate, checkDate
+PJD 18 Oct 2026     - prints -> runLib.log levels
+PJD 18 Oct 2026     - inspectFile returns stageTimes (scanFile/header/sha256, open, times,
+                      dates, close seconds) for the scanCMIP.py run report
+PJD 18 Oct 2026     - shaResults keyed by binary digest, values interned field tuples;
+                      loadCatalogue, indexCatalogue -> recordLib.loadRecords/RecordStore;
+                      dropped the per-file gc.collect
+PJD 18 Oct 2026     - mapDirs barrier jobs (None), drains the pool e.g. at a work unit end
+PJD 18 Oct 2026     - recordResult None for old-schema records (no sha256), they are rescanned
+PJD 18 Oct 2026     - Added stampedResults, reuse stamped !noDateFile/!fileReadError entries
+PJD 18 Oct 2026     - SandboxPool workers forked by sandboxSpawner, started with the pool,
+                      so replacements never inherit the scan's threads and locks
+
+@author: durack1
+"""
+
+# %% imports
+import collections
+import json
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.reduction
+import os
+import resource
+import signal
+import sys
+import time
+import xarray as xr
+
+from CMIP3Lib import getSha256
+from dateLib import dateCacheStats, getDate
+from ncLib import (
+    getTimeVar,
+    isTimeVar,
+    rawTimeValues,
+    readHeader,
+    readTimes,
+    scanFile,
+    timeValues,
+)
+from recordLib import intern
+from runLib import lapTime, levelInfo, levelVerbose, log
+
+# %% sha256 -> result fields of content already inspected, per process - scanCMIP.py
+# seeds it from previous catalogues before the --workers pool forks; keys are the
+# 32 byte digest, values ((field, value), ...) tuples of interned strings
+shaResults = {}
+shaFields = ["date", "dateFoundAtt", "time0", "timeN", "cmorVersion"]
+
+# %% (size, mtime, inode) record keys in fileStamp order, compared by matchRecord
+stampKeys = ["fileSizeBytes", "fileModTimeNs", "fileInode"]
+
+# %% sandboxWorker exit code after a MemoryError under the --maxMemory cap
+sandboxMemoryExit = 75
+
+# %% function defs
+
+
+class SandboxPool:
+    # fork worker processes that run func one job at a time; a job that runs
+    # past timeout (seconds) or takes its worker down (crash, maxMemory bytes
+    # RLIMIT_AS cap) gets a fileReadError result with a reason and the worker
+    # is replaced, so one pathological file never stalls or breaks the scan.
+    # workers, replacements included, are forked by a sandboxSpawner process that
+    # is forked here: create the pool before threads start or files (e.g. the
+    # sqlite hash cache) open, a worker forked later would inherit them
+    def __init__(self, func, workers, timeout=0, maxMemory=0):
+        self.func = func
+        self.timeout = timeout
+        self.maxMemory = maxMemory
+        # fork: scanCMIP.py runs at module level, spawn/forkserver would re-execute it
+        self.context = multiprocessing.get_context("fork")
+        self.jobs = collections.deque()  # (ticket, args) not yet sent
+        self.busy = {}  # worker index -> (ticket, args, start time)
+        self.results = {}
+        self.nextTicket = 0
+        self.spawnConn, spawnerConn = self.context.Pipe()
+        self.spawner = self.context.Process(
+            target=sandboxSpawner,
+            args=(func, spawnerConn, self.spawnConn, maxMemory),
+            daemon=True,
+        )
+        self.spawner.start()
+        spawnerConn.close()
+        self.procs = [self.spawn() for _ in range(workers)]  # [pid, conn]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for pid, conn in self.procs:
+            try:
+                conn.send(None)
+            except OSError:
+                pass  # worker already gone
+        self.spawnConn.send(None)  # the spawner reaps the workers, then exits
+        self.spawner.join()
+        self.spawnConn.close()
+        for pid, conn in self.procs:
+            conn.close()
+
+    def dispatch(self):
+        # hand queued jobs to idle workers
+        for ind in range(len(self.procs)):
+            if not self.jobs:
+                return
+            if ind in self.busy:
+                continue
+            ticket, args = self.jobs.popleft()
+            try:
+                self.procs[ind][1].send((ticket, args))
+            except OSError:
+                # worker died while idle, replace it and resend
+                self.replace(ind)
+                self.procs[ind][1].send((ticket, args))
+            self.busy[ind] = (ticket, args, time.monotonic())
+
+    def fail(self, ind, reason):
+        # error result for the job on worker ind, then a fresh worker
+        ticket, args, started = self.busy.pop(ind)
+        log(levelInfo, "fileReadError;", reason, "filePath:", args[0])
+        self.results[ticket] = {"status": "fileReadError", "reason": reason}
+        self.replace(ind)
+
+    def poll(self):
+        # wait for a result, a worker exit or the next timeout
+        wait = None
+        if self.timeout and self.busy:
+            started = min([busy[2] for busy in self.busy.values()])
+            wait = max(0, started + self.timeout - time.monotonic())
+        waitOn = {}
+        for ind in self.busy:
+            waitOn[self.procs[ind][1]] = ind  # EOF once the worker exits
+        ready = multiprocessing.connection.wait(list(waitOn), wait)
+        for ind in set([waitOn[obj] for obj in ready]):
+            try:
+                self.results[self.busy[ind][0]] = self.procs[ind][1].recv()
+                del self.busy[ind]
+            except (EOFError, OSError):
+                exitcode = self.reap(ind)
+                reason = "memory" if exitcode == sandboxMemoryExit else "crash"
+                self.fail(ind, reason)
+        if self.timeout:
+            now = time.monotonic()
+            for ind, (ticket, args, started) in list(self.busy.items()):
+                if now - started > self.timeout:
+                    self.fail(ind, "timeout")  # replace kills it
+        self.dispatch()
+
+    def reap(self, ind, kill=False):
+        # exit code of worker ind, killed first if kill, once the spawner reaps it
+        pid = self.procs[ind][0]
+        self.procs[ind][0] = None
+        self.spawnConn.send((pid, kill))
+
+        return self.spawnConn.recv()
+
+    def replace(self, ind):
+        if self.procs[ind][0] is not None:
+            self.reap(ind, kill=True)
+        self.procs[ind][1].close()
+        self.procs[ind] = self.spawn()
+
+    def result(self, ticket):
+        while ticket not in self.results:
+            self.poll()
+
+        return self.results.pop(ticket)
+
+    def spawn(self):
+        # a new worker, forked by the spawner and its connection passed back
+        self.spawnConn.send("spawn")
+        pid = self.spawnConn.recv()
+        fd = multiprocessing.reduction.recv_handle(self.spawnConn)
+
+        return [pid, multiprocessing.connection.Connection(fd)]
+
+    def submit(self, args):
+        ticket = self.nextTicket
+        self.nextTicket = ticket + 1
+        self.jobs.append((ticket, args))
+        self.dispatch()
+
+        return ticket
+
+
+def cloneResult(sha256):
+    # inspectFile result for content seen before, None if sha256 is new
+    known = shaResults.get(bytes.fromhex(sha256))
+    if known is None:
+        return None
+    result = {"status": "ok", "sha256": sha256, "cloned": True}
+    result.update(known)
+
+    return result
+
+
+def fileStamp(entry):
+    # (size, mtime_ns, inode) used to decide if a catalogued file has changed
+    try:
+        fileStats = entry.stat()
+    except OSError:
+        return None
+
+    return fileStats.st_size, fileStats.st_mtime_ns, fileStats.st_ino
+
+
+def getRawTimes(fh):
+    # first/last y-m-d of the time coordinate of a Dataset opened with
+    # decode_times=False, indexing two raw values rather than decoding the axis
+    var = fh.variables.get("time")
+    if var is None or not isTimeVar(var.attrs, var.dims) or var.size == 0:
+        return None, None
+    values = [var[0].values, var[-1].values]
+    dates = rawTimeValues(var.attrs, values)
+
+    return dates[0], dates[-1]
+
+
+def inspectFile(filePath, fileName, rule, era, startYr, endYr, sha256=None):
+    # per-file stage of scanCMIP.py: sha256, open, time bounds and dates
+    # runs inline or in a worker process, so only plain values are returned
+    # rule is the CMIP3Lib.getRule fix rule for the file, None for most files
+    # sha256 is passed when the hash cache already holds it
+    # content already inspected (shaResults) is cloned, files with a rule never are
+    # stageTimes holds the seconds spent in each stage, summed by runLib.StageTimer
+    if sha256 is not None and rule is None:
+        result = cloneResult(sha256)
+        if result is not None:
+            return result
+    start = time.perf_counter()
+    stageTimes = {}
+    result = {"status": "ok", "stageTimes": stageTimes}
+    # netCDF3 files without a fix rule are read from the header (ncLib),
+    # skipping the xarray Dataset build and full time axis decode; scanFile hashes
+    # the file in the same read so the header and time values are not fetched again
+    header = None
+    if rule is None:
+        stage = "scanFile" if sha256 is None else "header"
+        try:
+            if sha256 is None:
+                sha256, header, rawTimes = scanFile(filePath)
+            else:
+                # hash known, read only the header and the two time values
+                header = readHeader(filePath)
+                if header is not None:
+                    rawTimes = readTimes(filePath, header)
+        except Exception:
+            header = None  # unreadable file, leave it to xarray
+        start = lapTime(stageTimes, stage, start)
+    if sha256 is None:
+        # get sha256
+        sha256 = getSha256(filePath)
+        start = lapTime(stageTimes, "sha256", start)
+    result["sha256"] = sha256
+    clone = cloneResult(sha256) if rule is None else None
+    if clone is not None:
+        clone["stageTimes"] = stageTimes  # hashed, skip the xarray open
+        return clone
+    if header is not None:
+        try:
+            if rawTimes:
+                startTime, endTime = timeValues(getTimeVar(header), rawTimes)
+            else:
+                startTime, endTime = None, None
+            start = lapTime(stageTimes, "times", start)
+        except Exception:
+            log(levelVerbose, "fileReadError; filePath:", filePath)
+            result["status"] = "fileReadError"
+            result["reason"] = "time"
+            return result
+        attDict = header["attributes"]
+    else:
+        # open and deal with file issues
+        try:
+            # wrap so bombs are caught in except
+            # times undecoded, getRawTimes decodes the first/last values only
+            if rule is None:
+                fh = xr.open_dataset(filePath, decode_times=False)
+            # skipFile rule, no fix will open it
+            elif rule["skip"]:
+                log(levelVerbose, "badFile; filePath:", filePath)
+                result["status"] = "badFile"
+                return result
+            else:
+                fh = openRule(filePath, rule, decode=False)
+            start = lapTime(stageTimes, "open", start)
+        except:
+            log(levelVerbose, "fileReadError; filePath:", filePath)
+            result["status"] = "fileReadError"
+            result["reason"] = "open"
+            return result
+        try:
+            startTime, endTime = getRawTimes(fh)
+            start = lapTime(stageTimes, "times", start)
+        except Exception:
+            log(levelVerbose, "fileReadError; filePath:", filePath)
+            fh.close()
+            result["status"] = "fileReadError"
+            result["reason"] = "time"
+            return result
+        attDict = fh.attrs
+    result["time0"] = startTime
+    result["timeN"] = endTime
+    hits, misses = dateCacheStats["hits"], dateCacheStats["misses"]
+    result["date"], result["dateFoundAtt"] = getDate(attDict, era, startYr, endYr)
+    # per file, as each worker process has its own cache
+    result["dateCacheHits"] = dateCacheStats["hits"] - hits
+    result["dateCacheMisses"] = dateCacheStats["misses"] - misses
+    start = lapTime(stageTimes, "dates", start)
+    # cmor_version?
+    if "cmor_version" in attDict.keys():
+        result["cmorVersion"] = attDict["cmor_version"]
+
+    if header is None:
+        # close open file
+        fh.close()
+        start = lapTime(stageTimes, "close", start)
+    if rule is None:
+        rememberResult(result)
+
+    return result
+
+
+def matchRecord(rec, stamp):
+    # a previous record can be reused if path (index key), size, mtime and inode match
+    if rec is None or stamp is None:
+        return False
+    fileSizeBytes, fileModTimeNs, fileInode = stamp
+
+    return (
+        rec.get("fileSizeBytes") == fileSizeBytes
+        and rec.get("fileModTimeNs") == fileModTimeNs
+        and rec.get("fileInode") == fileInode
+    )
+
+
+def mapDirs(func, dirJobs, workers=0, lookAhead=None, timeout=0, maxMemory=0):
+    # ordered map of func over the per-directory job lists yielded by dirJobs as
+    # (key, jobs); yields (key, results) in the same order. A job is an args tuple,
+    # None jobs give None results. workers > 0 runs func in a SandboxPool keeping
+    # up to lookAhead jobs in flight across directories. jobs None is a barrier,
+    # yielded as (key, None) after everything before it, before dirJobs continues
+    if not workers:
+        for key, jobs in dirJobs:
+            if jobs is None:
+                yield key, None
+                continue
+            yield key, [func(*job) if job is not None else None for job in jobs]
+        return
+    if lookAhead is None:
+        lookAhead = workers * 8
+    # workers start here, before dirJobs starts the scanTree threads
+    with SandboxPool(func, workers, timeout, maxMemory) as pool:
+        queue = collections.deque()
+        inFlight = 0
+        for key, jobs in dirJobs:
+            if jobs is None:
+                while queue:
+                    queued, tickets = queue.popleft()
+                    yield queued, [
+                        pool.result(t) if t is not None else None for t in tickets
+                    ]
+                inFlight = 0
+                yield key, None
+                continue
+            tickets = [pool.submit(job) if job is not None else None for job in jobs]
+            queue.append((key, tickets))
+            inFlight = inFlight + len(tickets)
+            while queue and inFlight > lookAhead:
+                key, tickets = queue.popleft()
+                inFlight = inFlight - len(tickets)
+                yield key, [pool.result(t) if t is not None else None for t in tickets]
+        while queue:
+            key, tickets = queue.popleft()
+            yield key, [pool.result(t) if t is not None else None for t in tickets]
+
+
+def recordResult(rec):
+    # inspectFile style result rebuilt from a previous catalogue record, None for
+    # records without sha256/date e.g. 221017_cmip3.json.gz (the file is rescanned)
+    if "sha256" not in rec or not isinstance(rec.get("date"), list):
+        return None
+    result = {
+        "status": "ok",
+        "sha256": rec["sha256"],
+        "date": rec["date"][0],
+        "dateFoundAtt": rec["date"][1],
+        "time0": rec["time0"],
+        "timeN": rec["timeN"],
+    }
+    if "cmorVersion" in rec:
+        result["cmorVersion"] = rec["cmorVersion"]
+
+    return result
+
+
+def rememberResult(result):
+    # add an ok result to shaResults, the first result for a sha256 is kept
+    if result["status"] != "ok":
+        return
+    digest = bytes.fromhex(result["sha256"])
+    if digest in shaResults:
+        return
+    shaResults[digest] = tuple(
+        [(field, intern(result[field])) for field in shaFields if field in result]
+    )
+
+
+def openRule(filePath, rule, decode=True):
+    # open with times undecoded, apply the rule fixes then decode
+    # decode=False leaves times raw for getRawTimes
+    log(levelVerbose, rule["info"])
+    fh = xr.open_dataset(
+        filePath, decode_times=False, drop_variables=rule["dropVariables"] or None
+    )
+    for fix in rule["fixes"]:
+        fh = fix(fh)
+    if not decode:
+        return fh
+
+    return xr.decode_cf(fh)
+
+
+def readCheckpoint(checkFile):
+    # counters, walker position and catalogue offset written by writeCheckpoint
+    with open(checkFile) as fH:
+        state = json.load(fH)
+
+    return state
+
+
+def sandboxSpawner(func, conn, poolConn, maxMemory):
+    # SandboxPool fork server, single threaded: "spawn" forks a sandboxWorker and
+    # replies its pid then its connection (fd passing), (pid, kill) replies the
+    # worker's exit code once reaped; None (or the pool gone) waits up to 5 s for
+    # the workers to finish, kills the rest and exits
+    poolConn.close()
+    pids = set()
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            request = None
+        if request is None:
+            break
+        if request == "spawn":
+            parentConn, childConn = multiprocessing.Pipe()
+            pid = os.fork()
+            if pid == 0:
+                conn.close()
+                parentConn.close()
+                code = 0
+                try:
+                    sandboxWorker(func, childConn, maxMemory)
+                except BaseException:
+                    code = 1
+                sys.stdout.flush()  # as multiprocessing does, os._exit skips it
+                sys.stderr.flush()
+                os._exit(code)
+            childConn.close()
+            pids.add(pid)
+            conn.send(pid)
+            multiprocessing.reduction.send_handle(
+                conn, parentConn.fileno(), os.getppid()
+            )
+            parentConn.close()
+            continue
+        pid, kill = request
+        if kill:
+            os.kill(pid, signal.SIGKILL)
+        pids.discard(pid)
+        conn.send(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]))
+    deadline = time.monotonic() + 5
+    for pid in pids:
+        while not os.waitpid(pid, os.WNOHANG)[0]:
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                break
+            time.sleep(0.01)
+
+
+def sandboxWorker(func, conn, maxMemory):
+    # SandboxPool worker loop, one (ticket, args) job at a time until None
+    if maxMemory:
+        resource.setrlimit(resource.RLIMIT_AS, (maxMemory, maxMemory))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return  # parent gone
+        if job is None:
+            return
+        ticket, args = job
+        try:
+            result = func(*args)
+        except MemoryError:
+            # the cap can leave too little to carry on, exit for a fresh worker
+            os._exit(sandboxMemoryExit)
+        except Exception as error:
+            log(levelVerbose, "fileReadError;", repr(error), "filePath:", args[0])
+            result = {"status": "fileReadError", "reason": "exception"}
+        conn.send(result)
+
+
+def stampedResults(other):
+    # {filePath: {result, fileSizeBytes, fileModTimeNs, fileInode}} of the stamped
+    # !noDateFile [filePath, sha256, fileSizeBytes, fileModTimeNs, fileInode,
+    # cmorVersion] and !fileReadError [filePath, reason, fileSizeBytes,
+    # fileModTimeNs, fileInode] entries of a previous catalogue, see matchRecord
+    stamped = {}
+    for value in other.get("!noDateFile", {}).values():
+        if not isinstance(value, list) or len(value) != 6:
+            continue  # unstamped, rescanned
+        result = {"status": "ok", "sha256": value[1], "date": None}
+        result.update({"dateFoundAtt": None, "time0": None, "timeN": None})
+        if value[5] is not None:
+            result["cmorVersion"] = value[5]
+        stamped[value[0]] = dict(zip(stampKeys, value[2:5]), result=result)
+    for value in other.get("!fileReadError", {}).values():
+        if not isinstance(value, list) or len(value) != 5:
+            continue
+        result = {"status": "fileReadError", "reason": value[1]}
+        stamped[value[0]] = dict(zip(stampKeys, value[2:5]), result=result)
+
+    return stamped
+
+
+def writeCheckpoint(checkFile, state):
+    # write to a temporary file, fsync and rename so a crash never leaves a partial
+    # checkpoint behind
+    tmpFile = ".".join([checkFile, "tmp"])
+    with open(tmpFile, "w") as fH:
+        json.dump(state, fH, ensure_ascii=True, separators=(",", ":"))
+        fH.flush()
+        os.fsync(fH.fileno())
+    os.replace(tmpFile, checkFile)
+    dirFd = os.open(os.path.dirname(os.path.abspath(checkFile)), os.O_RDONLY)
+    try:
+        os.fsync(dirFd)
+    finally:
+        os.close(dirFd)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:12:05 2026
+
+PJD 18 Oct 2026     - Written for the scanner regression tests: src on sys.path and
+                      runScript, a src script run in a working directory
+
+@author: durack1
+"""
+
+# %% imports
+import glob
+import json
+import os
+import subprocess
+import sys
+
+srcDir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+sys.path.insert(0, srcDir)
+
+# %% function defs
+
+
+def runScript(script, args, cwd):
+    # run src/script with args in cwd, the scripts write their output there
+    cmd = [sys.executable, os.path.join(srcDir, script)] + args
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+
+    return proc
+
+
+def readOutput(cwd, pattern):
+    # the one json file matching pattern in cwd, e.g. a yymmdd_ dated catalogue
+    files = glob.glob(os.path.join(cwd, pattern))
+    assert len(files) == 1, files
+    with open(files[0]) as fH:
+        return json.load(fH)
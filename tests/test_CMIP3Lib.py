@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:58:09 2026
+
+PJD 18 Oct 2026     - Written, scanTree resumeAfter walks what follows it only
+PJD 18 Oct 2026     - Added test_hashFilesKnown
+
+@author: durack1
+"""
+
+# %% imports
+import hashlib
+
+from CMIP3Lib import hashFiles, scanTree
+
+# %% tests
+
+
+def test_scanTreeResume(tmp_path):
+    for a in range(6):
+        for b in range(6):
+            leaf = tmp_path / "d{}".format(a) / "e{}".format(b)
+            leaf.mkdir(parents=True)
+            (leaf / "f.nc").write_bytes(b"")
+    full = [root for root, dirs, files in scanTree([str(tmp_path)], lookAhead=8)]
+    resumeAfter = str(tmp_path / "d3" / "e2")
+    resumed = scanTree([str(tmp_path)], lookAhead=8, resumeAfter=resumeAfter)
+    roots = [root for root, dirs, files in resumed]
+    assert roots == full[full.index(resumeAfter) + 1 :]
+
+
+def test_hashFilesKnown(tmp_path):
+    # known hashes are yielded unread and the caller's dict is kept
+    paths = []
+    for name in ("a.nc", "b.nc"):
+        (tmp_path / name).write_bytes(name.encode())
+        paths.append(str(tmp_path / name))
+    known = {paths[0]: "cached"}
+    hashed = dict(hashFiles(paths, known=known))
+    assert hashed == {paths[0]: "cached", paths[1]: hashlib.sha256(b"b.nc").hexdigest()}
+    assert known == {paths[0]: "cached"}
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:31:40 2026
+
+PJD 18 Oct 2026     - Written, failed planning and waiting on held leases
+
+@author: durack1
+"""
+
+# %% imports
+import json
+import time
+
+import pytest
+
+import leaseLib
+from leaseLib import WorkLeases, maxAttempts
+
+# %% tests
+
+
+def test_planFailed(tmp_path):
+    # the planner's last lease has expired, no one waits for plan.json forever
+    leases = WorkLeases(str(tmp_path), "waiting", leaseSeconds=1)
+    lease = {"worker": "dead", "token": "t", "attempt": maxAttempts, "expires": 0}
+    with open(tmp_path / "leases" / "plan.json", "w") as fH:
+        json.dump(lease, fH)
+    with pytest.raises(ValueError, match="dead"):
+        leases.plan([str(tmp_path)], 1)
+
+
+def test_claimHeld(tmp_path, monkeypatch):
+    # a live lease is only read, nothing is written to the lease directory
+    holder = WorkLeases(str(tmp_path), "holder", leaseSeconds=60)
+    assert holder.claim("unit")
+    waiting = WorkLeases(str(tmp_path), "waiting", leaseSeconds=60)
+    monkeypatch.setattr(leaseLib, "createJson", None)
+    assert waiting.claim("unit") is None
+    holder.close()
+    monkeypatch.undo()
+    time.sleep(0.01)
+    assert waiting.claim("unit")["worker"] == "waiting"
+    waiting.close()
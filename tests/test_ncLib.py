@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 22:14:37 2026
+
+PJD 18 Oct 2026     - Written, corrupt netCDF3 headers fall back to xarray
+PJD 18 Oct 2026     - Added test_monthsSince
+
+@author: durack1
+"""
+
+# %% imports
+import hashlib
+import struct
+
+import netCDF4
+import numpy as np
+
+from ncLib import getTimeVar, maxHeaderBytes, readHeader, scanFile, timeValues
+
+# %% tests
+
+
+def test_corruptHeader(tmp_path):
+    # a garbage dimension count, and a count that fits but a header past the cap
+    for n in (0x7FFFFFFF, maxHeaderBytes // 4):
+        filePath = tmp_path / "bad.nc"
+        data = b"CDF\x01" + struct.pack(">III", 0, 10, n)
+        data = data + bytes(maxHeaderBytes + 65536)
+        filePath.write_bytes(data)
+        try:
+            assert readHeader(str(filePath)) is None
+        except ValueError:
+            pass  # past the end of the file, scanLib.inspectFile uses xarray
+        sha256, header, rawTimes = scanFile(str(filePath), bufferSize=65536)
+        assert sha256 == hashlib.sha256(data).hexdigest()
+        assert header is None and rawTimes is None
+
+
+def test_monthsSince(tmp_path):
+    # monthly files on the standard calendar decode as xcdat would, not fail
+    filePath = str(tmp_path / "tas_A1.nc")
+    ds = netCDF4.Dataset(filePath, "w", format="NETCDF3_CLASSIC")
+    ds.createDimension("time", None)
+    time = ds.createVariable("time", "f8", ("time",))
+    time.units = "months since 1850-01-31"
+    time.calendar = "standard"
+    time[:] = np.arange(14.0)
+    ds.close()
+    sha256, header, rawTimes = scanFile(filePath)
+    assert timeValues(getTimeVar(header), rawTimes) == ("1850-1-31", "1851-2-28")
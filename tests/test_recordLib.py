@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:58:21 2026
+
+PJD 18 Oct 2026     - Written, RecordStore roots with a trailing /
+
+@author: durack1
+"""
+
+# %% imports
+from recordLib import RecordStore
+
+# %% tests
+
+
+def test_trailingSlashRoot():
+    # the default CMIP6 path "/p/css03/scratch/CMIP6/" is a catalogue key as given
+    store = RecordStore()
+    rec = {"date": ["1850-1-1", "time"], "filePath": "/p/CMIP6/x.nc"}
+    store.addDir("/p/CMIP6/", {"x.nc": rec})
+    store.addDir("/p//CMIP6/y", {})
+    assert store.get("/p/CMIP6/x.nc") == rec
+    assert "/p/CMIP6/x.nc" in store
+    assert [root for root, files in store.dirs()] == ["/p/CMIP6", "/p/CMIP6/y"]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:31:17 2026
+
+PJD 18 Oct 2026     - Written, --incremental with an old-schema catalogue
+PJD 18 Oct 2026     - Added test_relativeInputs, test_progressTotal
+
+@author: durack1
+"""
+
+# %% imports
+import json
+import os
+
+import pytest
+
+from conftest import readOutput, runScript, srcDir
+
+# %% tests
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    # small makeTestArchive.py tree, bad/no date/broken time files included
+    outDir = tmp_path_factory.mktemp("archive")
+    args = ["--outDir", str(outDir), "--files", "60", "--bad", "0.1"]
+    args = args + ["--brokenTime", "0.1", "--noDate", "0.1"]
+    runScript("makeTestArchive.py", args, outDir)
+    with open(os.path.join(outDir, "manifest.json")) as fH:
+        return json.load(fH)["paths"]
+
+
+def scan(archive, outDir, args=[]):
+    outDir.mkdir()
+    args = ["-e", "3", "--paths"] + archive + ["--outDir", str(outDir)] + args
+    args = args + ["--hashCache", "", "--checkpoint", "0", "--finalize", "-q"]
+    runScript("scanCMIP.py", args, outDir)
+
+    return readOutput(outDir, "*_CMIP3.json")
+
+
+def test_oldSchemaIncremental(archive, tmp_path):
+    # 221017_cmip3.json.gz records have no sha256, filePath or stamps
+    oldCatalogue = os.path.join(srcDir, "221017_cmip3.json.gz")
+    fresh = scan(archive, tmp_path / "fresh")
+    incremental = scan(archive, tmp_path / "old", ["--incremental", oldCatalogue])
+    assert incremental["!_fileCount"] == fresh["!_fileCount"]
+    assert incremental["!noDateFile"] == fresh["!noDateFile"]
+
+
+def test_incrementalReusesEveryEntry(archive, tmp_path):
+    # unchanged files are not reopened, dated or not, read errors included
+    first = scan(archive, tmp_path / "first")
+    catFile = str(tmp_path / "first" / "CMIP3.jsonl")
+    second = scan(archive, tmp_path / "second", ["--incremental", catFile])
+    assert second == first
+    with open(tmp_path / "second" / "CMIP3_report.json") as fH:
+        counts = json.load(fH)["counts"]
+    assert counts["reuseCount"] == counts["fileCount"]
+    assert first["!noDateFileCount"] and first["!fileReadErrorCount"]
+
+
+def test_relativeInputs(archive, tmp_path):
+    # --incremental is found from the caller's directory, not --outDir
+    scan(archive, tmp_path / "first")
+    (tmp_path / "second").mkdir()
+    args = ["-e", "3", "--paths"] + archive + ["--outDir", "second"]
+    args = args + ["--incremental", os.path.join("first", "CMIP3.jsonl")]
+    args = args + ["--hashCache", "", "--checkpoint", "0", "-q"]
+    runScript("scanCMIP.py", args, tmp_path)
+    with open(tmp_path / "second" / "CMIP3_report.json") as fH:
+        counts = json.load(fH)["counts"]
+    assert counts["reuseCount"] == counts["fileCount"]
+
+
+def test_progressTotal(archive, tmp_path):
+    # the final progress line reaches the total taken from the previous scan
+    first = scan(archive, tmp_path / "first")
+    (tmp_path / "second").mkdir()
+    args = ["-e", "3", "--paths"] + archive + ["--outDir", str(tmp_path / "second")]
+    args = args + ["--incremental", str(tmp_path / "first" / "CMIP3.jsonl")]
+    args = args + ["--hashCache", "", "--checkpoint", "0"]
+    proc = runScript("scanCMIP.py", args, tmp_path)
+    lines = [line for line in proc.stderr.splitlines() if line.startswith("scan ")]
+    done, total = lines[-1].split()[1:4:2]
+    assert done == total
+    assert int(total) > first["!_fileCount"]  # *.nc.bad files included
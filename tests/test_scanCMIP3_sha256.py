@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:14:41 2026
+
+PJD 18 Oct 2026     - Written, a copy of a cached file joins its sha256 group
+PJD 18 Oct 2026     - An uncached file only sharing a size with cached files is not hashed
+
+@author: durack1
+"""
+
+# %% imports
+import os
+import shutil
+
+from conftest import readOutput, runScript
+
+# %% tests
+
+
+def scan(tmp_path, name, tree, hashCache):
+    outDir = tmp_path / name
+    outDir.mkdir()
+    args = ["--paths", str(tree), "--hashCache", str(hashCache), "-q"]
+    runScript("scanCMIP3-sha256.py", args, outDir)
+
+    return readOutput(outDir, "*_cmip3-sha256.json")
+
+
+def test_copyOfCachedFile(tmp_path):
+    tree = tmp_path / "tree"
+    tree.mkdir()
+    content = os.urandom(100000)
+    for name in ("x.nc", "y.nc"):
+        (tree / name).write_bytes(content)
+    (tree / "w.nc").write_bytes(os.urandom(100000))  # same size, other content
+    hashCache = tmp_path / "hashes.sqlite"
+    first = scan(tmp_path, "first", tree, hashCache)
+    shutil.copy2(tree / "x.nc", tree / "z.nc")  # cp -p, cache hits for x and y
+    second = scan(tmp_path, "second", tree, hashCache)
+    groups = [
+        set(map(os.path.basename, value))
+        for key, value in second.items()
+        if not key.startswith("!")
+    ]
+    assert {"x.nc", "y.nc", "z.nc"} in groups
+    assert str(tree / "z.nc") not in second["!unhashed"]
+    assert list(first["!unhashed"]) == [str(tree / "w.nc")]
+    assert list(second["!unhashed"]) == [str(tree / "w.nc")]  # fingerprint differs
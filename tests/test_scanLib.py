@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 23:05:12 2026
+
+PJD 18 Oct 2026     - Written, SandboxPool replaces hung and crashed workers
+
+@author: durack1
+"""
+
+# %% imports
+import os
+import signal
+import threading
+import time
+
+from scanLib import SandboxPool
+
+# %% tests
+
+lock = threading.Lock()  # held by the scan once the pool has started
+
+
+def job(kind):
+    if kind == "hang":
+        time.sleep(60)
+    elif kind == "crash":
+        os.kill(os.getpid(), signal.SIGKILL)
+    locked = not lock.acquire(timeout=1)  # inherited held if forked now
+
+    return {"status": "ok", "locked": locked}
+
+
+def test_sandboxReplace():
+    with SandboxPool(job, 1, timeout=2) as pool:
+        with lock:
+            results = [
+                pool.result(pool.submit((kind,))) for kind in ("hang", "crash", "ok")
+            ]
+    assert results[0] == {"status": "fileReadError", "reason": "timeout"}
+    assert results[1] == {"status": "fileReadError", "reason": "crash"}
+    assert results[2] == {"status": "ok", "locked": False}